@@ -0,0 +1,70 @@
+"""
+黑白名单过滤的微基准测试
+
+对比旧实现（字符串ID在list中线性查找）与ChatFilter（整数snowflake的frozenset）
+在名单规模从100到100k时的单次判断耗时，ChatFilter的耗时应基本不随名单规模变化。
+
+用法: python benchmarks/bench_chat_filter.py
+"""
+
+import random
+import timeit
+
+from bench_env import prepare_environment
+
+prepare_environment('[Debug]\nlevel = "WARNING"')
+
+from src.chat_filter import ChatFilter  # noqa: E402
+from src.config import GlobalConfig  # noqa: E402
+
+SIZES = (100, 1_000, 10_000, 100_000)
+LOOKUPS = 2_000
+
+
+def legacy_check(config: GlobalConfig, user_id: str, channel_id: str) -> bool:
+    """旧的判断方式，与重构前main.on_message中的逻辑一致"""
+    if config.channel_list_type == "whitelist" and channel_id not in config.channel_list:
+        return False
+    if config.channel_list_type == "blacklist" and channel_id in config.channel_list:
+        return False
+    if user_id in config.ban_user_id:
+        return False
+    return True
+
+
+def make_config(size: int) -> GlobalConfig:
+    config = GlobalConfig()
+    config.channel_list_type = "blacklist"
+    config.channel_list = [str(random.getrandbits(60)) for _ in range(size)]
+    config.ban_user_id = [str(random.getrandbits(60)) for _ in range(size)]
+    return config
+
+
+def main() -> None:
+    random.seed(0)
+    print(f"{'名单规模':>10} {'list (us/次)':>14} {'frozenset (us/次)':>18} {'加速比':>8}")
+    for size in SIZES:
+        config = make_config(size)
+        chat_filter = ChatFilter.from_config(config)
+        # 最坏情况：不在名单中的ID，线性查找需要扫描整个列表
+        users = [random.getrandbits(60) for _ in range(LOOKUPS)]
+        channels = [random.getrandbits(60) for _ in range(LOOKUPS)]
+        user_strs = [str(u) for u in users]
+        channel_strs = [str(c) for c in channels]
+
+        def run_legacy():
+            for user_id, channel_id in zip(user_strs, channel_strs):
+                legacy_check(config, user_id, channel_id)
+
+        def run_compiled():
+            for user_id, channel_id in zip(users, channels):
+                chat_filter.check(user_id, channel_id)
+
+        repeat = max(1, 100_000 // size)
+        legacy_us = min(timeit.repeat(run_legacy, number=1, repeat=min(repeat, 5))) / LOOKUPS * 1e6
+        compiled_us = min(timeit.repeat(run_compiled, number=10, repeat=5)) / 10 / LOOKUPS * 1e6
+        print(f"{size:>10} {legacy_us:>14.3f} {compiled_us:>18.3f} {legacy_us / compiled_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+端到端吞吐/延迟基准测试
+
+离线运行整条链路：
+    合成的Discord消息 -> main.on_message -> message_queue -> 工作池 -> RecvHandler
+    -> router.send_message -> 本地替身MaiBot（maim_message.MessageServer）
+    -> 回复 -> SendHandler.handle_message -> 出站调度器 -> 替身频道的send
+替身MaiBot对每条消息回复一条引用原消息的文本，文本中带有原消息ID，
+替身频道收到回复时按ID计算 从注入on_message 到 调用channel.send 的延迟。
+消息中混有群聊、私聊、回复和带图片附件的消息。
+
+出站限速默认放开，测的是适配器本身的容量；加 --discord-limits 则使用配置中的限速。
+峰值内存为整个进程（含替身MaiBot服务器）的最大RSS。
+
+用法: python benchmarks/bench_end_to_end.py [--messages 5000] [--rate 500] [--channels 20]
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import resource
+import socket
+import sys
+import time
+
+from bench_env import prepare_environment
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="端到端吞吐/延迟基准测试")
+    parser.add_argument("--messages", type=int, default=5000, help="注入的消息总数")
+    parser.add_argument("--rate", type=float, default=500, help="注入速率（条/秒），0表示不限速")
+    parser.add_argument("--channels", type=int, default=20, help="服务器频道数量")
+    parser.add_argument("--users", type=int, default=200, help="用户数量")
+    parser.add_argument("--dm-ratio", type=float, default=0.1, help="私聊消息比例")
+    parser.add_argument("--reply-ratio", type=float, default=0.2, help="回复消息比例")
+    parser.add_argument("--image-ratio", type=float, default=0.1, help="带图片附件的消息比例")
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="替身频道每次send的模拟耗时（秒）")
+    parser.add_argument("--discord-limits", action="store_true", help="使用配置中的出站限速")
+    parser.add_argument("--timeout", type=float, default=60, help="等待全部回复的最长时间（秒）")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+args = parse_args()
+PORT = free_port()
+overrides = f"""
+[MaiBot_Server]
+platform_name = "discord"
+host = "127.0.0.1"
+port = {PORT}
+
+[Chat]
+channel_list_type = "blacklist"
+channel_list = []
+private_list_type = "blacklist"
+private_list = []
+ban_user_id = []
+enable_poke = false
+
+[Media]
+cache_enable = false
+
+[Reload]
+watch = false
+
+[Debug]
+level = "WARNING"
+"""
+if not args.discord_limits:
+    overrides += """
+[Performance]
+send_channel_rate = 100000.0
+send_channel_burst = 100000
+send_global_rate = 100000.0
+send_global_burst = 100000
+coalesce_window = 0
+"""
+prepare_environment(overrides)
+
+from fake_discord import FakeBot, make_gateway_message  # noqa: E402
+from maim_message import BaseMessageInfo, FormatInfo, MessageBase, MessageServer, Seg  # noqa: E402
+
+import main as adapter  # noqa: E402
+from src.config import global_config  # noqa: E402
+from src.mmc_com_layer import router  # noqa: E402
+
+REPLY_ID = re.compile(r"#(\d+)#")
+
+
+def start_maibot_server(port: int) -> MessageServer:
+    """替身MaiBot：收到消息后回复一条引用原消息、带有原消息ID的文本"""
+    server = MessageServer(host="127.0.0.1", port=port)
+
+    async def handle(message: dict) -> None:
+        info = MessageBase.from_dict(message).message_info
+        reply = MessageBase(
+            message_info=BaseMessageInfo(
+                platform=info.platform,
+                message_id=f"reply-{info.message_id}",
+                time=time.time(),
+                user_info=info.user_info,
+                group_info=info.group_info,
+                format_info=FormatInfo(content_format=["text"], accept_format=["text"]),
+            ),
+            message_segment=Seg(
+                type="seglist",
+                data=[Seg(type="reply", data=info.message_id), Seg(type="text", data=f"收到 #{info.message_id}#")],
+            ),
+        )
+        await server.send_message(reply)
+
+    server.register_message_handler(handle)
+    return server
+
+
+async def wait_until(predicate, timeout: float, what: str) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"等待{what}超时")
+        await asyncio.sleep(0.05)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run() -> None:
+    random.seed(0)
+    injected_at = {}
+    latencies = []
+    all_replied = asyncio.Event()
+
+    def on_send(channel, content, kwargs) -> None:
+        now = time.perf_counter()
+        for message_id in REPLY_ID.findall(content or ""):
+            start = injected_at.pop(int(message_id), None)
+            if start is not None:
+                latencies.append(now - start)
+        if len(latencies) >= args.messages:
+            all_replied.set()
+
+    fake_bot = FakeBot(on_send, args.discord_latency)
+    text_channels = [fake_bot.get_channel(900000000000000000 + i) for i in range(args.channels)]
+    adapter.recv_handler.discord_bot = fake_bot
+    adapter.send_handler.discord_bot = fake_bot
+    adapter.discord_resolver.discord_bot = fake_bot
+    adapter.recv_handler.maibot_outbox = adapter.maibot_outbox
+    adapter.bot_ready.set()
+
+    server = start_maibot_server(PORT)
+    tasks = [
+        asyncio.create_task(server.run()),
+        asyncio.create_task(adapter.message_process()),
+        asyncio.create_task(adapter.send_scheduler.run()),
+        asyncio.create_task(adapter.maibot_outbox.run()),
+    ]
+    await asyncio.sleep(0.5)
+    tasks.append(asyncio.create_task(adapter.mmc_start_com()))
+    await wait_until(lambda: router.check_connection(global_config.platform), 15, "连接替身MaiBot")
+
+    recent = []  # 可被回复的最近消息
+    interval = 1 / args.rate if args.rate > 0 else 0
+    start = time.perf_counter()
+    for index in range(args.messages):
+        message_id = 500000000000000000 + index
+        user_id = 100000000000000000 + random.randrange(args.users)
+        if random.random() < args.dm_ratio:
+            channel = fake_bot.get_user(user_id).dm_channel
+        else:
+            channel = random.choice(text_channels)
+        referenced = random.choice(recent) if recent and random.random() < args.reply_ratio else None
+        message = make_gateway_message(
+            message_id,
+            user_id,
+            channel,
+            f"第{index}条测试消息，内容长度和普通聊天差不多喵~",
+            referenced=referenced if referenced is not None and referenced.channel is channel else None,
+            image=random.random() < args.image_ratio,
+        )
+        recent = (recent + [message])[-50:]
+        injected_at[message_id] = time.perf_counter()
+        await adapter.on_message(message)
+        if interval:
+            # 按目标速率注入，落后时不补偿等待
+            delay = start + (index + 1) * interval - time.perf_counter()
+            await asyncio.sleep(max(0.0, delay))
+    inject_elapsed = time.perf_counter() - start
+
+    try:
+        await asyncio.wait_for(all_replied.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"等待超时，{len(injected_at)} 条消息没有收到回复", file=sys.stderr)
+    total_elapsed = time.perf_counter() - start
+
+    await adapter.mmc_stop_com()
+    await adapter.inbound_pool.stop()
+    await server.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies.sort()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux下单位为KiB
+    print(f"注入 {args.messages} 条消息，目标速率 {args.rate or '不限'} 条/秒，实际注入耗时 {inject_elapsed:.2f}秒")
+    print(f"收到回复: {len(latencies)} 条")
+    print(f"吞吐: {len(latencies) / total_elapsed:.1f} 条/秒")
+    print(f"延迟: p50 {percentile(latencies, 0.5) * 1000:.1f} ms，p99 {percentile(latencies, 0.99) * 1000:.1f} ms，"
+          f"最大 {percentile(latencies, 1.0) * 1000:.1f} ms")
+    print(f"峰值RSS: {peak_rss:.1f} MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
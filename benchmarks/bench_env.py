@@ -0,0 +1,54 @@
+"""
+基准测试的公共环境准备
+
+src下的模块在导入时会读取当前目录的config.toml，
+这里在缺少配置文件时用模板配置创建一个临时工作目录，使基准测试可以离线独立运行。
+"""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_environment(overrides: str = "") -> str:
+    """
+    准备运行环境
+
+    Parameters:
+        overrides: str: 追加到模板配置末尾的TOML内容（会覆盖同名配置段）
+    Returns:
+        str: 工作目录
+    """
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    if not os.path.exists("config.toml") or overrides:
+        work_dir = tempfile.mkdtemp(prefix="adapter-bench-")
+        config_path = os.path.join(work_dir, "config.toml")
+        shutil.copy(os.path.join(ROOT_DIR, "template", "template_config.toml"), config_path)
+        if overrides:
+            _apply_overrides(config_path, overrides)
+        os.chdir(work_dir)
+    # 与main.py保持一致，先导入logger再导入其他模块，避免config与logger的循环导入出错
+    importlib.import_module("src.logger")
+    return os.getcwd()
+
+
+def _apply_overrides(config_path: str, overrides: str) -> None:
+    """删除模板中与overrides同名的配置段，再追加overrides"""
+    sections = {line.strip() for line in overrides.splitlines() if line.strip().startswith("[")}
+    kept = []
+    skipping = False
+    with open(config_path, "r", encoding="utf-8") as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith("["):
+                skipping = stripped.split("#")[0].strip() in sections
+            if not skipping:
+                kept.append(line)
+    with open(config_path, "w", encoding="utf-8") as f:
+        f.writelines(kept)
+        f.write("\n" + overrides + "\n")
@@ -0,0 +1,152 @@
+"""
+入站日志吞吐基准测试
+
+以突发方式不断追加消息并在落盘后立即确认，测量不同fsync_interval下：
+    - 持续吞吐（条/秒），与不写日志时的入队速度对比
+    - 追加到fsync完成的延迟（即断电时可能丢失的窗口）p50/p99
+    - 事件循环上每条消息的额外开销（序列化和记账，写入与fsync在线程中）
+fsync的耗时取决于磁盘，请用 --dir 指向与线上journal目录相同的磁盘。
+
+用法: python benchmarks/bench_journal.py [--messages 50000] [--burst 100] [--dir /path/on/disk]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+
+from bench_env import prepare_environment
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="入站日志吞吐基准测试")
+    parser.add_argument("--messages", type=int, default=50000, help="每轮追加的消息数")
+    parser.add_argument("--burst", type=int, default=100, help="每次让出事件循环前追加的消息数")
+    parser.add_argument("--dir", default=None, help="日志目录所在的父目录，默认为系统临时目录")
+    return parser.parse_args()
+
+
+args = parse_args()
+PARENT_DIR = os.path.abspath(args.dir) if args.dir else None
+prepare_environment('[Debug]\nlevel = "WARNING"')
+
+from src.config import global_config  # noqa: E402
+from src.inbound_event import InboundMessage, ReplyInfo  # noqa: E402
+from src.inbound_journal import InboundJournal  # noqa: E402
+
+FSYNC_INTERVALS = (0, 0.005, 0.05)
+
+
+class TimedJournal(InboundJournal):
+    """记录每条消息从追加到fsync完成的时间"""
+
+    def __init__(self, directory: str):
+        super().__init__(directory)
+        self.appended_at = {}
+        self.durable_latencies = []
+
+    async def flush(self) -> None:
+        before = self.durable_seq
+        await super().flush()
+        now = time.perf_counter()
+        for seq in range(before + 1, self.durable_seq + 1):
+            start = self.appended_at.pop(seq, None)
+            if start is not None:
+                self.durable_latencies.append(now - start)
+
+
+def make_events(count: int) -> list:
+    return [
+        InboundMessage(
+            message_id=500000000000000000 + i,
+            user_id=100000000000000000 + i % 200,
+            channel_id=900000000000000000 + i % 20,
+            is_group=i % 10 != 0,
+            mention_self=False,
+            content=f"第{i}条测试消息，内容长度和普通聊天差不多喵~",
+            nickname=f"用户{i % 200}",
+            username=f"user{i % 200}",
+            channel_name=f"频道{i % 20}",
+            reply=ReplyInfo(500000000000000000 + i - 1, 100000000000000000, "上一条消息") if i % 5 == 0 else None,
+        )
+        for i in range(count)
+    ]
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def bench_baseline(events: list) -> float:
+    """不写日志，只入队"""
+    queue = asyncio.Queue()
+    start = time.perf_counter()
+    for index, event in enumerate(events, 1):
+        queue.put_nowait(event)
+        if index % args.burst == 0:
+            await asyncio.sleep(0)
+    return len(events) / (time.perf_counter() - start)
+
+
+async def bench_journal(events: list, fsync_interval: float) -> dict:
+    global_config.journal_fsync_interval = fsync_interval
+    directory = tempfile.mkdtemp(prefix="journal-bench-", dir=PARENT_DIR)
+    journal = TimedJournal(directory)
+    await journal.open()
+
+    async def dispatch(event) -> None:
+        pass
+
+    task = asyncio.create_task(journal.run(dispatch, lambda: True))
+    unacked = deque()
+    loop_time = 0.0
+    start = time.perf_counter()
+    for index, event in enumerate(events, 1):
+        before = time.perf_counter()
+        seq = journal.append(event)
+        loop_time += time.perf_counter() - before
+        journal.appended_at[seq] = before
+        unacked.append(seq)
+        if index % args.burst == 0:
+            await asyncio.sleep(0)
+            # 已落盘的消息立即确认，模拟MaiBot正常在线
+            while unacked and unacked[0] <= journal.durable_seq:
+                journal.settle(unacked.popleft(), True)
+    while journal.appended_at:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await journal.close()
+    shutil.rmtree(directory, ignore_errors=True)
+    latencies = sorted(journal.durable_latencies)
+    return {
+        "throughput": len(events) / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "loop_us": loop_time / len(events) * 1e6,
+    }
+
+
+async def run() -> None:
+    events = make_events(args.messages)
+    baseline = await bench_baseline(events)
+    print(f"{args.messages} 条消息，每 {args.burst} 条让出一次事件循环，日志目录: {PARENT_DIR or tempfile.gettempdir()}")
+    print(f"{'fsync_interval':<16}{'吞吐(条/秒)':>14}{'落盘p50(ms)':>14}{'落盘p99(ms)':>14}{'循环开销(µs/条)':>18}")
+    print(f"{'不写日志':<16}{baseline:>14.0f}{'-':>14}{'-':>14}{'-':>18}")
+    for fsync_interval in FSYNC_INTERVALS:
+        result = await bench_journal(events, fsync_interval)
+        print(
+            f"{fsync_interval:<16}{result['throughput']:>14.0f}{result['p50'] * 1000:>14.2f}"
+            f"{result['p99'] * 1000:>14.2f}{result['loop_us']:>18.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,182 @@
+"""
+入站消息转换的分配基准测试
+
+对比旧流程（on_message构造完整的OneBot字典，再由RecvHandler从字典构造MessageBase）
+与message_converter直接从Discord消息构造MessageBase的耗时和单条消息的内存峰值。
+Discord消息用只带必要属性的替身对象模拟，不需要连接Discord。
+
+用法: python benchmarks/bench_message_convert.py
+"""
+
+import asyncio
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from bench_env import prepare_environment
+
+prepare_environment('[Debug]\nlevel = "WARNING"')
+
+from fake_discord import make_message  # noqa: E402
+from maim_message import BaseMessageInfo, FormatInfo, GroupInfo, MessageBase, Seg, UserInfo  # noqa: E402
+
+from src.config import global_config  # noqa: E402
+from src.message_converter import message_to_message_base  # noqa: E402
+from src.recv_handler import recv_handler  # noqa: E402
+
+MESSAGES = 2_000
+
+
+def legacy_message_dict(message, bot_user_id: int) -> dict:
+    """旧的字典构造方式，与重构前main.on_message中的逻辑一致"""
+    referenced = message.referenced
+    reference_info = None
+    if referenced is not None:
+        reference_info = {
+            "message_id": str(referenced.id),
+            "user_id": str(referenced.author.id),
+            "content": referenced.content,
+            "timestamp": referenced.created_at.isoformat(),
+        }
+    attachments = [
+        {
+            "id": str(a.id),
+            "filename": a.filename,
+            "url": a.url,
+            "content_type": a.content_type,
+            "size": a.size,
+        }
+        for a in message.attachments
+    ]
+    embeds = []
+    for embed in message.embeds:
+        embeds.append({
+            "title": embed.title,
+            "description": embed.description,
+            "url": embed.url,
+            "color": embed.color.value if embed.color else None,
+            "timestamp": embed.timestamp.isoformat() if embed.timestamp else None,
+            "footer": {"text": embed.footer.text, "icon_url": embed.footer.icon_url} if embed.footer else None,
+            "image": {"url": embed.image.url} if embed.image else None,
+            "thumbnail": {"url": embed.thumbnail.url} if embed.thumbnail else None,
+            "author": {"name": embed.author.name, "url": embed.author.url, "icon_url": embed.author.icon_url}
+            if embed.author else None,
+            "fields": [{"name": f.name, "value": f.value, "inline": f.inline} for f in embed.fields],
+        })
+    channel = message.channel
+    author = message.author
+    return {
+        "post_type": "message",
+        "message_type": "group",
+        "filter_passed": True,
+        "message_id": str(message.id),
+        "user_id": str(author.id),
+        "group_id": str(channel.id),
+        "message": message.content,
+        "raw_message": message.content,
+        "timestamp": message.created_at.isoformat(),
+        "edited_timestamp": message.edited_at.isoformat() if message.edited_at else None,
+        "tts": message.tts,
+        "mention_everyone": message.mention_everyone,
+        "mention_self": any(user.id == bot_user_id for user in message.mentions),
+        "mentions": [str(user.id) for user in message.mentions],
+        "mention_roles": [str(role.id) for role in message.role_mentions],
+        "mention_channels": [str(c.id) for c in message.channel_mentions],
+        "attachments": attachments,
+        "embeds": embeds,
+        "components": [],
+        "reference": reference_info,
+        "pinned": message.pinned,
+        "flags": message.flags.value if message.flags else 0,
+        "sender": {
+            "user_id": str(author.id),
+            "nickname": author.display_name,
+            "card": author.name,
+            "bot": author.bot,
+            "system": author.system,
+            "avatar_url": str(author.avatar.url) if author.avatar else None,
+            "discriminator": author.discriminator,
+            "color": author.color.value if author.color else None,
+            "roles": [str(role.id) for role in author.roles],
+        },
+        "channel": {
+            "id": str(channel.id),
+            "name": channel.name,
+            "type": str(channel.type),
+            "category_id": str(channel.category_id),
+            "position": channel.position,
+            "nsfw": channel.nsfw,
+            "topic": channel.topic,
+            "slowmode_delay": channel.slowmode_delay,
+        },
+    }
+
+
+async def legacy_convert(message) -> MessageBase:
+    """旧流程：构造字典，再按RecvHandler.handle_raw_message的方式从字典构造MessageBase"""
+    raw_message = legacy_message_dict(message, recv_handler.discord_bot.user.id)
+    segments = await recv_handler.handle_real_message(raw_message)
+    return MessageBase(
+        message_info=BaseMessageInfo(
+            platform=global_config.platform,
+            message_id=raw_message.get("message_id"),
+            time=time.time(),
+            user_info=UserInfo(
+                platform=global_config.platform,
+                user_id=raw_message.get("user_id"),
+                user_nickname=raw_message.get("sender", {}).get("nickname"),
+                user_cardname=raw_message.get("sender", {}).get("card"),
+            ),
+            group_info=GroupInfo(
+                platform=global_config.platform,
+                group_id=raw_message.get("group_id"),
+                group_name=message.channel.name,
+            ),
+            template_info=None,
+            format_info=FormatInfo(
+                content_format=["text", "image", "emoji"],
+                accept_format=["text", "image", "emoji", "reply", "voice", "command"],
+            ),
+        ),
+        message_segment=Seg(type="seglist", data=segments),
+    )
+
+
+async def direct_convert(message) -> MessageBase:
+    return message_to_message_base(message, True, message.referenced)
+
+
+async def measure(convert, messages) -> tuple:
+    # 先预热一遍，排除首次导入和缓存带来的分配
+    for message in messages[:100]:
+        await convert(message)
+    start = time.perf_counter()
+    for message in messages:
+        await convert(message)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    peak_total = 0
+    for message in messages:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        await convert(message)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - base
+    tracemalloc.stop()
+    return elapsed / len(messages) * 1e6, peak_total / len(messages)
+
+
+async def main() -> None:
+    recv_handler.discord_bot = SimpleNamespace(user=SimpleNamespace(id=1))
+    messages = [make_message(i, with_reply=i % 4 == 0) for i in range(MESSAGES)]
+    legacy_us, legacy_bytes = await measure(legacy_convert, messages)
+    direct_us, direct_bytes = await measure(direct_convert, messages)
+    print(f"{'方式':<10} {'耗时 (us/条)':>14} {'内存峰值 (字节/条)':>20}")
+    print(f"{'字典中转':<10} {legacy_us:>14.2f} {legacy_bytes:>20.0f}")
+    print(f"{'直接转换':<10} {direct_us:>14.2f} {direct_bytes:>20.0f}")
+    print(f"耗时降低 {legacy_us / direct_us:.1f}x，内存峰值降低 {legacy_bytes / direct_bytes:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+入站队列积压时的内存占用基准测试
+
+对比旧的队列元素（完整的OneBot格式嵌套字典）与InboundMessage记录，
+在积压BACKLOG条消息时，队列元素本身（含其引用的全部对象，同一对象只计一次）占用的内存。
+消息文本等字符串两种表示都直接引用原对象，计入方式相同。
+
+用法: python benchmarks/bench_queue_memory.py [积压条数]
+"""
+
+import sys
+
+from bench_env import prepare_environment
+
+prepare_environment('[Debug]\nlevel = "WARNING"')
+
+from bench_message_convert import legacy_message_dict  # noqa: E402
+from fake_discord import make_message  # noqa: E402
+from src.inbound_event import InboundMessage  # noqa: E402
+
+BACKLOG = 100_000
+DISTINCT_MESSAGES = 2_000  # 替身消息本身较大，循环使用，ID保证各不相同
+
+
+def deep_sizeof(root) -> int:
+    """统计root及其引用的所有对象的大小，同一对象只计一次"""
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(type(obj), "__slots__") and not isinstance(obj, (str, bytes, int, float)):
+            stack.extend(getattr(obj, name) for name in type(obj).__slots__ if hasattr(obj, name))
+    return total
+
+
+def main() -> None:
+    backlog = int(sys.argv[1]) if len(sys.argv) > 1 else BACKLOG
+    templates = [make_message(i, with_reply=i % 4 == 0) for i in range(DISTINCT_MESSAGES)]
+
+    legacy = []
+    compact = []
+    for index in range(backlog):
+        message = templates[index % DISTINCT_MESSAGES]
+        # 每条消息使用不同的ID，避免整数对象被不同元素共享
+        message.id = 500000000000000000 + index
+        legacy.append(legacy_message_dict(message, 1))
+        compact.append(InboundMessage.from_message(message, True, message.referenced))
+        compact[-1].message_id = int(str(message.id))
+
+    legacy_bytes = deep_sizeof(legacy)
+    compact_bytes = deep_sizeof(compact)
+    print(f"积压 {backlog} 条消息时队列元素占用的内存:")
+    print(f"{'OneBot字典':<14} {legacy_bytes / 1024 / 1024:>10.1f} MiB {legacy_bytes / backlog:>10.0f} 字节/条")
+    print(f"{'InboundMessage':<14} {compact_bytes / 1024 / 1024:>10.1f} MiB {compact_bytes / backlog:>10.0f} 字节/条")
+    print(f"内存占用降低 {legacy_bytes / compact_bytes:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+基准测试用的Discord消息替身
+
+只带有适配器会读取的属性，不需要连接Discord即可构造。
+"""
+
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import discord
+
+
+def make_message(index: int, with_reply: bool = False) -> SimpleNamespace:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    author = SimpleNamespace(
+        id=100000000000000000 + index,
+        display_name=f"用户{index}",
+        name=f"user{index}",
+        bot=False,
+        system=False,
+        avatar=SimpleNamespace(url=f"https://cdn.discordapp.com/avatars/{index}/a.png"),
+        discriminator="0",
+        color=discord.Colour(0x3498DB),
+        roles=[SimpleNamespace(id=200000000000000000 + role) for role in range(8)],
+    )
+    channel = SimpleNamespace(
+        id=300000000000000000 + index % 50,
+        name=f"频道{index % 50}",
+        type=discord.ChannelType.text,
+        category_id=400000000000000000,
+        position=index % 50,
+        nsfw=False,
+        topic="一个很普通的频道简介" * 5,
+        slowmode_delay=0,
+    )
+    embed = discord.Embed(title="标题", description="描述" * 20, url="https://example.com", color=0xFF0000)
+    embed.set_footer(text="footer", icon_url="https://example.com/f.png")
+    embed.set_image(url="https://example.com/i.png")
+    for field in range(3):
+        embed.add_field(name=f"字段{field}", value="值" * 10)
+    message = SimpleNamespace(
+        id=500000000000000000 + index,
+        author=author,
+        channel=channel,
+        content=f"这是第{index}条测试消息，内容长度和普通聊天差不多喵~",
+        created_at=now,
+        edited_at=None,
+        tts=False,
+        mention_everyone=False,
+        mentions=[SimpleNamespace(id=600000000000000000 + i) for i in range(2)],
+        role_mentions=[],
+        channel_mentions=[],
+        attachments=[
+            SimpleNamespace(
+                id=700000000000000000 + index,
+                filename="image.png",
+                url=f"https://cdn.discordapp.com/attachments/1/{index}/image.png",
+                content_type="image/png",
+                size=123456,
+            )
+        ],
+        embeds=[embed],
+        components=[],
+        pinned=False,
+        flags=discord.MessageFlags._from_value(0),
+        reference=None,
+    )
+    message.referenced = make_message(index + 1) if with_reply else None
+    return message
+
+
+class FakeTextChannel(discord.TextChannel):
+    """服务器文字频道的替身，send不访问网络，交给on_send回调记录"""
+
+    def __init__(self, channel_id: int, name: str, on_send=None, latency: float = 0):
+        self.id = channel_id
+        self.name = name
+        self.guild = None
+        self.on_send = on_send
+        self.latency = latency
+
+    async def send(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.on_send is not None:
+            self.on_send(self, content, kwargs)
+
+    def get_partial_message(self, message_id: int):
+        return SimpleNamespace(to_reference=lambda **kwargs: SimpleNamespace(message_id=message_id))
+
+
+class FakeDMChannel(discord.DMChannel):
+    """私聊频道的替身"""
+
+    def __init__(self, channel_id: int, on_send=None, latency: float = 0):
+        self.id = channel_id
+        self.on_send = on_send
+        self.latency = latency
+
+    async def send(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.on_send is not None:
+            self.on_send(self, content, kwargs)
+
+
+def make_gateway_message(
+    message_id: int,
+    author_id: int,
+    channel,
+    content: str,
+    referenced=None,
+    image: bool = False,
+) -> SimpleNamespace:
+    """
+    构造一条on_message收到的消息
+
+    Parameters:
+        channel: FakeTextChannel或FakeDMChannel
+        referenced: 被回复的消息（同样由本函数构造），通过reference.cached_message提供
+        image: bool: 是否带一张图片附件
+    """
+    author = SimpleNamespace(
+        id=author_id,
+        display_name=f"用户{author_id % 10000}",
+        name=f"user{author_id % 10000}",
+        bot=False,
+    )
+    message = SimpleNamespace(
+        id=message_id,
+        author=author,
+        channel=channel,
+        guild=None,
+        content=content,
+        created_at=datetime.datetime.now(datetime.timezone.utc),
+        mentions=[],
+        attachments=[],
+        reference=None,
+    )
+    if image:
+        message.attachments.append(
+            SimpleNamespace(
+                id=message_id,
+                filename="image.png",
+                url=f"https://cdn.discordapp.com/attachments/{channel.id}/{message_id}/image.png",
+                content_type="image/png",
+                size=123456,
+            )
+        )
+    if referenced is not None:
+        message.reference = SimpleNamespace(
+            message_id=referenced.id,
+            channel_id=channel.id,
+            resolved=None,
+            cached_message=referenced,
+        )
+    message.to_reference = lambda **kwargs: SimpleNamespace(message_id=message_id)
+    return message
+
+
+class FakeBot:
+    """
+    只提供适配器用到的get_channel/get_user
+
+    未见过的频道和用户按ID自动创建，用户带有对应的私聊频道，
+    因此录制回放等任意ID的场景也能发送成功。
+    """
+
+    user = None
+
+    def __init__(self, on_send=None, latency: float = 0):
+        self.on_send = on_send
+        self.latency = latency
+        self.channels = {}
+        self.users = {}
+
+    def get_channel(self, channel_id: int) -> FakeTextChannel:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeTextChannel(
+                channel_id, f"频道{channel_id % 10000}", self.on_send, self.latency
+            )
+        return channel
+
+    def get_user(self, user_id: int) -> SimpleNamespace:
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = SimpleNamespace(
+                id=user_id, dm_channel=FakeDMChannel(user_id, self.on_send, self.latency)
+            )
+        return user
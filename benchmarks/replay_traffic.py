@@ -0,0 +1,254 @@
+"""
+流量录制回放
+
+把[Recording]录下的.jsonl.gz文件按原来的时间间隔（或加速）重新送入适配器：
+    入站事件 -> message_queue -> 工作池 -> RecvHandler -> router.send_message -> 本地替身MaiBot
+    MaiBot的出站消息 -> SendHandler.handle_message -> 出站调度器 -> 替身频道的send
+替身MaiBot只接收和计时，不再回复（回复本身已经在录制里）。
+入站延迟为 放入message_queue 到 替身MaiBot收到 的时间。
+
+默认使用模板配置中的出站限速，与线上行为一致；加 --unlimited 放开限速，测适配器本身的容量。
+加 --output 把结果写成JSON，方便对比不同版本。
+
+用法: python benchmarks/replay_traffic.py 录制文件 [--speed 1|10|max] [--unlimited] [--output result.json]
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import resource
+import socket
+import sys
+import time
+
+from bench_env import prepare_environment
+
+
+def parse_speed(value: str) -> float:
+    """回放倍速，max表示不等待、尽快回放"""
+    if value == "max":
+        return 0
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("倍速必须大于0，或使用max")
+    return speed
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="流量录制回放")
+    parser.add_argument("recording", help="录制文件（.jsonl.gz）")
+    parser.add_argument("--speed", type=parse_speed, default=1, help="回放倍速，如1、10，max为不限速")
+    parser.add_argument("--unlimited", action="store_true", help="放开出站限速")
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="替身频道每次send的模拟耗时（秒）")
+    parser.add_argument("--timeout", type=float, default=120, help="回放结束后等待处理完毕的最长时间（秒）")
+    parser.add_argument("--output", help="把结果写入这个JSON文件")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+args = parse_args()
+# prepare_environment会切换到临时目录，先把路径转换为绝对路径
+RECORDING = os.path.abspath(args.recording)
+OUTPUT = os.path.abspath(args.output) if args.output else None
+PORT = free_port()
+overrides = f"""
+[MaiBot_Server]
+platform_name = "discord"
+host = "127.0.0.1"
+port = {PORT}
+
+[Chat]
+channel_list_type = "blacklist"
+channel_list = []
+private_list_type = "blacklist"
+private_list = []
+ban_user_id = []
+enable_poke = false
+
+[Media]
+cache_enable = false
+
+[Reload]
+watch = false
+
+[Debug]
+level = "WARNING"
+"""
+if args.unlimited:
+    overrides += """
+[Performance]
+send_channel_rate = 100000.0
+send_channel_burst = 100000
+send_global_rate = 100000.0
+send_global_burst = 100000
+"""
+prepare_environment(overrides)
+
+from fake_discord import FakeBot  # noqa: E402
+from maim_message import MessageBase, MessageServer  # noqa: E402
+
+import main as adapter  # noqa: E402
+from src.config import global_config  # noqa: E402
+from src.mmc_com_layer import router  # noqa: E402
+from src.inbound_event import InboundMessage  # noqa: E402
+from src.message_queue import message_queue  # noqa: E402
+from src.traffic_recorder import RECORDING_VERSION  # noqa: E402
+
+
+def read_recording(path: str):
+    """逐行读取录制文件，不一次性载入内存"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("type") != "header" or header.get("version") != RECORDING_VERSION:
+            raise ValueError(f"不支持的录制文件: {path}")
+        yield header
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def wait_until(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def is_drained() -> bool:
+    return (
+        message_queue.qsize() == 0
+        and adapter.inbound_pool.pending_count == 0
+        and adapter.maibot_outbox.depth == 0
+        and adapter.send_scheduler.queue_depth() == 0
+        and adapter.send_scheduler.stats()["inflight"] == 0
+    )
+
+
+async def run() -> dict:
+    enqueued_at = {}
+    inbound_latencies = []
+    discord_sends = 0
+
+    def on_send(channel, content, kwargs) -> None:
+        nonlocal discord_sends
+        discord_sends += 1
+
+    server = MessageServer(host="127.0.0.1", port=PORT)
+
+    async def handle(message: dict) -> None:
+        message_id = MessageBase.from_dict(message).message_info.message_id
+        start = enqueued_at.pop(str(message_id), None)
+        if start is not None:
+            inbound_latencies.append(time.perf_counter() - start)
+
+    server.register_message_handler(handle)
+
+    fake_bot = FakeBot(on_send, args.discord_latency)
+    adapter.recv_handler.discord_bot = fake_bot
+    adapter.send_handler.discord_bot = fake_bot
+    adapter.discord_resolver.discord_bot = fake_bot
+    adapter.recv_handler.maibot_outbox = adapter.maibot_outbox
+    adapter.bot_ready.set()
+
+    tasks = [
+        asyncio.create_task(server.run()),
+        asyncio.create_task(adapter.message_process()),
+        asyncio.create_task(adapter.send_scheduler.run()),
+        asyncio.create_task(adapter.maibot_outbox.run()),
+    ]
+    await asyncio.sleep(0.5)
+    tasks.append(asyncio.create_task(adapter.mmc_start_com()))
+    if not await wait_until(lambda: router.check_connection(global_config.platform), 15):
+        raise TimeoutError("连接替身MaiBot超时")
+
+    records = read_recording(RECORDING)
+    header = next(records)
+    inbound = outbound = 0
+    recorded_span = 0.0
+    max_lag = 0.0
+    start = time.perf_counter()
+    for record in records:
+        recorded_span = record["t"]
+        if args.speed:
+            delay = start + record["t"] / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        if record["type"] == "inbound":
+            event = InboundMessage.from_record(record["event"])
+            enqueued_at[str(event.message_id)] = time.perf_counter()
+            await message_queue.put(event)
+            inbound += 1
+        elif record["type"] == "outbound":
+            await adapter.send_handler.handle_message(record["message"])
+            outbound += 1
+        if not args.speed and (inbound + outbound) % 100 == 0:
+            await asyncio.sleep(0)  # 不限速时也让工作池和调度器有机会运行
+    inject_elapsed = time.perf_counter() - start
+
+    drained = await wait_until(lambda: not enqueued_at and is_drained(), args.timeout)
+    total_elapsed = time.perf_counter() - start
+    if not drained:
+        print(f"等待超时，{len(enqueued_at)} 条入站消息没有送达替身MaiBot", file=sys.stderr)
+
+    await adapter.mmc_stop_com()
+    await adapter.inbound_pool.stop()
+    await server.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    inbound_latencies.sort()
+    return {
+        "recording": RECORDING,
+        "recorded_at": header.get("started"),
+        "anonymized": header.get("anonymized"),
+        "speed": args.speed or "max",
+        "recorded_span_s": round(recorded_span, 3),
+        "replay_inject_s": round(inject_elapsed, 3),
+        "replay_total_s": round(total_elapsed, 3),
+        "max_schedule_lag_ms": round(max_lag * 1000, 3),
+        "inbound": inbound,
+        "inbound_delivered": len(inbound_latencies),
+        "inbound_p50_ms": round(percentile(inbound_latencies, 0.5) * 1000, 3),
+        "inbound_p99_ms": round(percentile(inbound_latencies, 0.99) * 1000, 3),
+        "outbound": outbound,
+        "discord_sends": discord_sends,
+        "throughput_msgs_s": round((inbound + outbound) / total_elapsed, 1) if total_elapsed else 0,
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # Linux下单位为KiB
+    }
+
+
+def main() -> None:
+    result = asyncio.run(run())
+    print(f"录制文件: {result['recording']}（{result['recorded_at']}，匿名化: {result['anonymized']}）")
+    print(f"倍速: {result['speed']}，录制时长 {result['recorded_span_s']}秒，回放注入 {result['replay_inject_s']}秒，"
+          f"处理完毕 {result['replay_total_s']}秒，最大调度延迟 {result['max_schedule_lag_ms']}ms")
+    print(f"入站: {result['inbound']} 条，送达MaiBot {result['inbound_delivered']} 条，"
+          f"延迟 p50 {result['inbound_p50_ms']}ms，p99 {result['inbound_p99_ms']}ms")
+    print(f"出站: {result['outbound']} 条，调用Discord发送 {result['discord_sends']} 次")
+    print(f"吞吐: {result['throughput_msgs_s']} 条/秒，峰值RSS: {result['peak_rss_mib']} MiB")
+    if OUTPUT:
+        with open(OUTPUT, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,247 +1,215 @@
 import asyncio
 import sys
+import time
 import json
-import discord
-from discord.ext import commands
+from typing import Union
 from src.logger import logger
 from src.recv_handler import recv_handler
 from src.send_handler import send_handler
 from src.config import global_config
-from src.mmc_com_layer import mmc_start_com, mmc_stop_com, router
-from src.message_queue import message_queue, put_response, check_timeout_response
+from src.mmc_com_layer import mmc_start_com, mmc_stop_com, maibot_outbox, maibot_outboxes
+from src.message_queue import message_queue, put_response, check_timeout_response, get_channel_key, report_queue_stats
+from src.worker_pool import ChannelWorkerPool
+from src.message_cache import message_cache
+from src.discord_resolver import discord_resolver
+from src.http_client import media_downloader
+from src.image_pool import image_pool
+from src.send_scheduler import send_scheduler
+from src.inbound_event import InboundMessage
+from src.metrics import Stage, inbound_messages, observe_stage, registry
+from src.metrics_server import metrics_server, start_metrics_server
+from src.tracing import TraceStage
+from src.config_reload import watch_config, on_reload
+from src.traffic_recorder import traffic_recorder
+from src.inbound_journal import inbound_journal
+from src.gateway import create_bot, normalize_message, shard_latencies, gateway_metric_families
+from src.shard_launcher import shard_launcher
+from src.instances import BotInstance, bot_instances
 
-# 创建Discord客户端
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-
-# 配置代理
-proxy = global_config.discord_proxy
-if proxy:
-    logger.info(f"使用代理: {proxy}")
-    bot = commands.Bot(
-        command_prefix='!',
-        intents=intents,
-        proxy=proxy
-    )
-else:
-    bot = commands.Bot(command_prefix='!', intents=intents)
+# 创建Discord客户端；process模式下本进程不连接网关，只通过REST发送消息
+SHARDING_MODE = global_config.sharding_mode
+bot = create_bot(
+    sharded=SHARDING_MODE == "auto",
+    shard_ids=global_config.sharding_shard_ids,
+    shard_count=global_config.sharding_shard_count,
+)
+bot_instances.primary.bot = bot
 
 bot_ready = asyncio.Event()  # 添加一个事件来跟踪bot的登录状态
 
-@bot.event
-async def on_ready():
-    logger.info(f'Discord Bot已登录为 {bot.user.name}')
+def set_discord_bot() -> None:
     recv_handler.discord_bot = bot
     send_handler.discord_bot = bot
+    discord_resolver.discord_bot = bot
     bot_ready.set()  # 设置事件，表示bot已准备就绪
 
+@bot.event
+async def on_ready():
+    logger.info(f'Discord Bot已登录为 {bot.user.name}')
+    set_discord_bot()
+
 @bot.event
 async def on_message(message):
-    if message.author == bot.user:
+    event = await normalize_message(bot, message)
+    if event is not None:
+        await enqueue_inbound(event)
+
+async def enqueue_inbound(event: InboundMessage) -> None:
+    """把规范化后的消息（来自本进程的网关或网关进程）写入入站队列"""
+    traffic_recorder.record_inbound(event)
+    event.journal_seq = inbound_journal.append(event)
+    await message_queue.put(event)
+    if event.trace is not None:
+        event.trace.mark(TraceStage.enqueued)
+    inbound_messages.inc("enqueued")
+
+@bot.event
+async def on_raw_message_delete(payload):
+    message_cache.forget(payload.message_id)
+
+def register_instance(instance: BotInstance) -> None:
+    """为附加Bot实例创建客户端，收到的消息写入同一个入站队列"""
+    instance.bot = create_bot(proxy=instance.proxy)
+
+    @instance.bot.event
+    async def on_ready():
+        logger.info(f'Bot实例 {instance.name} 已登录为 {instance.bot.user.name}')
+        instance.resolver.discord_bot = instance.bot
+
+    @instance.bot.event
+    async def on_message(message):
+        event = await normalize_message(instance.bot, message, instance=instance)
+        if event is not None:
+            await enqueue_inbound(event)
+
+    @instance.bot.event
+    async def on_raw_message_delete(payload):
+        message_cache.forget(payload.message_id)
+
+for extra_instance in bot_instances.extra.values():
+    register_instance(extra_instance)
+
+async def handle_inbound(message: Union[InboundMessage, dict]) -> None:
+    if isinstance(message, InboundMessage):
+        observe_stage(Stage.queue_wait, time.monotonic() - message.received_at)
+        if message.trace is not None:
+            message.trace.mark(TraceStage.dequeued)
+        delivered = False
+        try:
+            delivered = await recv_handler.handle_inbound_message(message)
+        finally:
+            # 未送达的消息留在入站日志中，之后重放；暂存到发件箱的消息由发件箱补发后再确认
+            if delivered is not None:
+                inbound_journal.settle(message.journal_seq, delivered)
         return
-    
-    # 检查频道/私聊黑白名单
-    if isinstance(message.channel, discord.TextChannel):
-        if global_config.channel_list_type == "whitelist" and str(message.channel.id) not in global_config.channel_list:
-            return
-        if global_config.channel_list_type == "blacklist" and str(message.channel.id) in global_config.channel_list:
-            return
+    post_type = message.get("post_type")
+    if post_type == "message":
+        await recv_handler.handle_raw_message(message)
+    elif post_type == "meta_event":
+        await recv_handler.handle_meta_event(message)
+    elif post_type == "notice":
+        await recv_handler.handle_notice(message)
     else:
-        if global_config.private_list_type == "whitelist" and str(message.author.id) not in global_config.private_list:
-            return
-        if global_config.private_list_type == "blacklist" and str(message.author.id) in global_config.private_list:
-            return
-    
-    # 检查全局禁用名单
-    if str(message.author.id) in global_config.ban_user_id:
-        return
-    
-    # 获取消息引用信息
-    reference_info = None
-    if message.reference:
-        try:
-            referenced_message = await message.channel.fetch_message(message.reference.message_id)
-            reference_info = {
-                "message_id": str(referenced_message.id),
-                "user_id": str(referenced_message.author.id),
-                "content": referenced_message.content,
-                "timestamp": referenced_message.created_at.isoformat()
-            }
-        except Exception as e:
-            logger.error(f"获取引用消息失败: {e}")
-    
-    # 获取消息附件信息
-    attachments = []
-    for attachment in message.attachments:
-        attachments.append({
-            "id": str(attachment.id),
-            "filename": attachment.filename,
-            "url": attachment.url,
-            "content_type": attachment.content_type,
-            "size": attachment.size
-        })
-    
-    # 获取消息嵌入信息
-    embeds = []
-    for embed in message.embeds:
-        embed_data = {
-            "title": embed.title,
-            "description": embed.description,
-            "url": embed.url,
-            "color": embed.color.value if embed.color else None,
-            "timestamp": embed.timestamp.isoformat() if embed.timestamp else None,
-            "footer": {
-                "text": embed.footer.text if embed.footer else None,
-                "icon_url": embed.footer.icon_url if embed.footer else None
-            } if embed.footer else None,
-            "image": {
-                "url": embed.image.url if embed.image else None
-            } if embed.image else None,
-            "thumbnail": {
-                "url": embed.thumbnail.url if embed.thumbnail else None
-            } if embed.thumbnail else None,
-            "author": {
-                "name": embed.author.name if embed.author else None,
-                "url": embed.author.url if embed.author else None,
-                "icon_url": embed.author.icon_url if embed.author else None
-            } if embed.author else None,
-            "fields": [
-                {
-                    "name": field.name,
-                    "value": field.value,
-                    "inline": field.inline
-                } for field in embed.fields
-            ] if embed.fields else []
-        }
-        embeds.append(embed_data)
-    
-    # 获取消息组件信息
-    components = []
-    if message.components:
-        for component in message.components:
-            if isinstance(component, discord.ui.ActionRow):
-                for child in component.children:
-                    if isinstance(child, discord.ui.Button):
-                        components.append({
-                            "type": "button",
-                            "label": child.label,
-                            "style": str(child.style),
-                            "custom_id": child.custom_id,
-                            "url": child.url,
-                            "disabled": child.disabled
-                        })
-                    elif isinstance(child, discord.ui.Select):
-                        components.append({
-                            "type": "select",
-                            "custom_id": child.custom_id,
-                            "placeholder": child.placeholder,
-                            "min_values": child.min_values,
-                            "max_values": child.max_values,
-                            "options": [
-                                {
-                                    "label": option.label,
-                                    "value": option.value,
-                                    "description": option.description,
-                                    "default": option.default
-                                } for option in child.options
-                            ]
-                        })
-    
-    # 将Discord消息转换为MaiBot格式
-    discord_message = {
-        "post_type": "message",
-        "message_type": "group" if isinstance(message.channel, discord.TextChannel) else "private",
-        "message_id": str(message.id),
-        "user_id": str(message.author.id),
-        "group_id": str(message.channel.id) if isinstance(message.channel, discord.TextChannel) else None,
-        "message": message.content,
-        "raw_message": message.content,
-        "timestamp": message.created_at.isoformat(),
-        "edited_timestamp": message.edited_at.isoformat() if message.edited_at else None,
-        "tts": message.tts,
-        "mention_everyone": message.mention_everyone,
-        "mentions": [str(user.id) for user in message.mentions],
-        "mention_roles": [str(role.id) for role in message.role_mentions],
-        "mention_channels": [str(channel.id) for channel in message.channel_mentions],
-        "attachments": attachments,
-        "embeds": embeds,
-        "components": components,
-        "reference": reference_info,
-        "pinned": message.pinned,
-        "flags": message.flags.value if message.flags else 0,
-        "sender": {
-            "user_id": str(message.author.id),
-            "nickname": message.author.display_name,
-            "card": message.author.name,
-            "bot": message.author.bot,
-            "system": message.author.system,
-            "avatar_url": str(message.author.avatar.url) if message.author.avatar else None,
-            "discriminator": message.author.discriminator,
-            "color": message.author.color.value if message.author.color else None,
-            "roles": [str(role.id) for role in message.author.roles] if hasattr(message.author, 'roles') else []
-        },
-        "channel": {
-            "id": str(message.channel.id),
-            "name": message.channel.name if hasattr(message.channel, 'name') else None,
-            "type": str(message.channel.type),
-            "category_id": str(message.channel.category_id) if hasattr(message.channel, 'category_id') else None,
-            "position": message.channel.position if hasattr(message.channel, 'position') else None,
-            "nsfw": message.channel.nsfw if hasattr(message.channel, 'nsfw') else None,
-            "topic": message.channel.topic if hasattr(message.channel, 'topic') else None,
-            "slowmode_delay": message.channel.slowmode_delay if hasattr(message.channel, 'slowmode_delay') else None
-        } if isinstance(message.channel, discord.TextChannel) else {
-            "id": str(message.channel.id),
-            "type": str(message.channel.type)
-        }
-    }
-    
-    await message_queue.put(discord_message)
+        logger.warning(f"未知的post_type: {post_type}")
+
+
+inbound_pool = ChannelWorkerPool(
+    handle_inbound,
+    worker_count=global_config.worker_count,
+    max_pending=global_config.max_pending,
+)
+on_reload(lambda config: inbound_pool.resize(config.worker_count))
+message_queue.on_drop = lambda item: inbound_journal.discard(getattr(item, "journal_seq", None))
+for outbox in maibot_outboxes.values():
+    outbox.on_settled = inbound_journal.settle
+registry.register_collector(
+    lambda: [
+        ("adapter_worker_pool_pending", "gauge", "入站工作池中尚未处理完的消息数", [({}, inbound_pool.pending_count)]),
+        ("adapter_worker_pool_busy", "gauge", "正在处理消息的worker数", [({}, inbound_pool.stats()["busy_workers"])]),
+    ]
+)
+registry.register_collector(
+    lambda: gateway_metric_families(
+        shard_launcher.latencies.items() if SHARDING_MODE == "process" else shard_latencies(bot)
+    )
+)
+
 
 async def message_process():
     await bot_ready.wait()  # 等待bot准备就绪
+    inbound_pool.start()
     while True:
         message = await message_queue.get()
-        post_type = message.get("post_type")
-        if post_type == "message":
-            await recv_handler.handle_raw_message(message)
-        elif post_type == "meta_event":
-            await recv_handler.handle_meta_event(message)
-        elif post_type == "notice":
-            await recv_handler.handle_notice(message)
-        else:
-            logger.warning(f"未知的post_type: {post_type}")
+        # 按频道分发给工作池，频道内有序、频道间并行
+        await inbound_pool.submit(get_channel_key(message), message)
         message_queue.task_done()
-        await asyncio.sleep(0.05)
 
 async def main():
-    recv_handler.maibot_router = router
+    recv_handler.maibot_outbox = maibot_outbox
+    recv_handler.maibot_outboxes = maibot_outboxes
+    await inbound_journal.open()
     _ = await asyncio.gather(
         discord_client(),
+        *(instance_client(instance) for instance in bot_instances.extra.values()),
         mmc_start_com(),
         message_process(),
-        check_timeout_response()
+        check_timeout_response(),
+        report_queue_stats(),
+        send_scheduler.run(),
+        watch_config(),
+        start_metrics_server(),
+        traffic_recorder.run(),
+        *(outbox.run() for outbox in maibot_outboxes.values()),
+        inbound_journal.run(message_queue.put, lambda: any(outbox.connected for outbox in maibot_outboxes.values())),
     )
 
 async def discord_client():
     logger.info("正在启动Discord客户端...")
     try:
-        await bot.start(global_config.discord_token)
+        if SHARDING_MODE == "process":
+            # 网关由网关进程维持，本进程登录后只使用REST
+            await bot.login(global_config.discord_token)
+            logger.info(f'Discord Bot已登录为 {bot.user.name}，网关由网关进程负责')
+            set_discord_bot()
+            shard_launcher.on_event = enqueue_inbound
+            await shard_launcher.run(bot)
+        else:
+            await bot.start(global_config.discord_token)
     except Exception as e:
         logger.error(f"Discord客户端启动失败: {e}")
         raise
 
+async def instance_client(instance: BotInstance):
+    logger.info(f"正在启动Bot实例 {instance.name}...")
+    try:
+        await instance.bot.start(instance.token)
+    except Exception as e:
+        logger.error(f"Bot实例 {instance.name} 启动失败: {e}")
+        raise
+
 async def graceful_shutdown():
     try:
         logger.info("正在关闭adapter...")
+        await shard_launcher.stop()
         await mmc_stop_com()
-        await bot.close()
+        await inbound_pool.stop()
+        for outbox in maibot_outboxes.values():
+            await outbox.close()
+        await inbound_journal.close()
+        await metrics_server.stop()
+        await traffic_recorder.close()
+        await media_downloader.close()
+        image_pool.shutdown()
+        for instance in bot_instances:
+            await instance.bot.close()
         tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
         for task in tasks:
             task.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
     except Exception as e:
         logger.error(f"Adapter关闭中出现错误: {e}")
+    finally:
+        await logger.complete()  # 等待队列中的日志写完
 
 if __name__ == "__main__":
     loop = asyncio.new_event_loop()
@@ -0,0 +1,80 @@
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUTTLCache(Generic[V]):
+    """
+    带过期时间的LRU缓存
+
+    超过max_size时淘汰最久未使用的条目，超过ttl秒的条目在读取时视为不存在。
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self.counters: Counter = Counter()
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.counters["miss"] += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.counters["expired"] += 1
+            self.counters["miss"] += 1
+            return default
+        self._data.move_to_end(key)
+        self.counters["hit"] += 1
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.counters["evicted"] += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[V]:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def resize(self, max_size: int, ttl: Optional[float] = None) -> None:
+        """调整缓存容量和过期时间，多出的条目立即淘汰"""
+        self.max_size = max(1, max_size)
+        if ttl is not None:
+            self.ttl = ttl
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.counters["evicted"] += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def items(self) -> List[Tuple[Hashable, V]]:
+        """未过期的条目（不影响LRU顺序和命中统计）"""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at >= now]
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.counters["hit"] + self.counters["miss"]
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hit": self.counters["hit"],
+            "miss": self.counters["miss"],
+            "evicted": self.counters["evicted"],
+            "hit_rate": self.counters["hit"] / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,96 @@
+from typing import FrozenSet, Iterable, Optional, Union
+
+from .config import GlobalConfig, InstanceConfig, global_config
+from .logger import logger
+
+
+class FilterReason:
+    """消息被过滤的原因"""
+
+    channel_whitelist = "频道不在聊天白名单中"
+    channel_blacklist = "频道在聊天黑名单中"
+    private_whitelist = "私聊不在聊天白名单中"
+    private_blacklist = "私聊在聊天黑名单中"
+    banned = "用户在全局黑名单中"
+
+
+def to_id_set(ids: Iterable) -> FrozenSet[int]:
+    """将配置中的ID列表（字符串或整数）转为整数snowflake集合"""
+    result = set()
+    for raw_id in ids:
+        try:
+            result.add(int(raw_id))
+        except (TypeError, ValueError):
+            logger.warning(f"忽略无效的ID: {raw_id!r}")
+    return frozenset(result)
+
+
+class ChatFilter:
+    """
+    编译后的黑白名单过滤器
+
+    由GlobalConfig（主实例）或InstanceConfig（附加实例）构建，名单转为整数snowflake的frozenset，每次判断为O(1)。
+    过滤器构建后不可变，配置变化时整体替换。
+    """
+
+    __slots__ = ("channel_whitelist", "channel_ids", "private_whitelist", "private_ids", "banned_ids")
+
+    def __init__(
+        self,
+        channel_whitelist: bool,
+        channel_ids: FrozenSet[int],
+        private_whitelist: bool,
+        private_ids: FrozenSet[int],
+        banned_ids: FrozenSet[int],
+    ):
+        self.channel_whitelist = channel_whitelist
+        self.channel_ids = channel_ids
+        self.private_whitelist = private_whitelist
+        self.private_ids = private_ids
+        self.banned_ids = banned_ids
+
+    @classmethod
+    def from_config(cls, config: Union[GlobalConfig, InstanceConfig]) -> "ChatFilter":
+        return cls(
+            channel_whitelist=config.channel_list_type == "whitelist",
+            channel_ids=to_id_set(config.channel_list),
+            private_whitelist=config.private_list_type == "whitelist",
+            private_ids=to_id_set(config.private_list),
+            banned_ids=to_id_set(config.ban_user_id),
+        )
+
+    def check(self, user_id: int, channel_id: Optional[int]) -> Optional[str]:
+        """
+        检查是否允许聊天
+
+        Parameters:
+            user_id: int: 用户ID
+            channel_id: Optional[int]: 频道ID，私聊为None
+        Returns:
+            Optional[str]: 被过滤的原因（FilterReason），允许时为None
+        """
+        if channel_id is not None:
+            if (channel_id in self.channel_ids) != self.channel_whitelist:
+                return FilterReason.channel_whitelist if self.channel_whitelist else FilterReason.channel_blacklist
+        elif (user_id in self.private_ids) != self.private_whitelist:
+            return FilterReason.private_whitelist if self.private_whitelist else FilterReason.private_blacklist
+        if user_id in self.banned_ids:
+            return FilterReason.banned
+        return None
+
+    def allows(self, user_id: int, channel_id: Optional[int]) -> bool:
+        return self.check(user_id, channel_id) is None
+
+
+_chat_filter = ChatFilter.from_config(global_config)
+
+
+def get_chat_filter() -> ChatFilter:
+    """获取当前生效的过滤器"""
+    return _chat_filter
+
+
+def set_chat_filter(chat_filter: ChatFilter) -> None:
+    """整体替换过滤器，正在判断中的消息仍使用旧过滤器，不会看到一半新一半旧的名单"""
+    global _chat_filter
+    _chat_filter = chat_filter
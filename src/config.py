@@ -27,20 +27,131 @@ class ChatConfig:
     ban_user_id: List[str]
     enable_poke: bool
 
+@dataclass
+class InstanceConfig:
+    """[[Instances]]中的一个附加Bot实例，聊天名单未填写时沿用[Chat]"""
+    name: str
+    token: str
+    platform: str
+    proxy: str
+    channel_list_type: str
+    channel_list: List[str]
+    private_list_type: str
+    private_list: List[str]
+    ban_user_id: List[str]
+
 @dataclass
 class VoiceConfig:
     use_tts: bool
 
+@dataclass
+class PerformanceConfig:
+    worker_count: int
+    max_pending: int
+    queue_size: int
+    overflow_policy: str
+    message_cache_size: int
+    message_cache_ttl: int
+    user_cache_size: int
+    user_cache_ttl: int
+    send_channel_rate: float
+    send_channel_burst: int
+    send_global_rate: float
+    send_global_burst: int
+    coalesce_window: float
+
+@dataclass
+class MediaConfig:
+    download_max_connections: int
+    download_per_host_limit: int
+    download_max_size: int
+    download_timeout: int
+    download_retries: int
+    media_cache_enable: bool
+    media_cache_dir: str
+    media_cache_max_size: int
+    image_workers: int
+    image_job_timeout: int
+
+@dataclass
+class ReloadConfig:
+    watch: bool
+    watch_interval: int
+
+@dataclass
+class MetricsConfig:
+    enable: bool
+    host: str
+    port: int
+
+@dataclass
+class TracingConfig:
+    enable: bool
+    sample_rate: float
+    slow_threshold: float
+    ttl: int
+    file: str
+    rotation: str
+    retention: int
+
+@dataclass
+class RecordingConfig:
+    enable: bool
+    dir: str
+    anonymize: bool
+    max_size: int
+
+@dataclass
+class JournalConfig:
+    enable: bool
+    dir: str
+    segment_size: int
+    fsync_interval: float
+    retry_interval: float
+    max_attempts: int
+    max_size: int
+
+@dataclass
+class OutboxConfig:
+    memory_size: int
+    spill_dir: str
+    spill_max_size: int
+    send_timeout: float
+    drain_batch: int
+    backoff_initial: float
+    backoff_max: float
+
+@dataclass
+class ShardingConfig:
+    mode: str
+    shard_count: int
+    shard_ids: list
+    processes: int
+
 @dataclass
 class DebugConfig:
     level: str
+    payload_log: bool
+    payload_log_sample_rate: float
+    payload_log_max_length: int
+    payload_extras: bool
 
 @dataclass
 class GlobalConfig:
     discord: DiscordConfig
     maibot_server: MaiBotServerConfig
     chat: ChatConfig
+    instances: List[InstanceConfig]
     voice: VoiceConfig
+    performance: PerformanceConfig
+    media: MediaConfig
+    reload: ReloadConfig
+    metrics: MetricsConfig
+    tracing: TracingConfig
+    recording: RecordingConfig
+    journal: JournalConfig
+    outbox: OutboxConfig
+    sharding: ShardingConfig
     debug: DebugConfig
 
     def __init__(self):
@@ -56,8 +167,70 @@ class GlobalConfig:
         self.private_list = []
         self.ban_user_id = []
         self.enable_poke = True
+        self.instances = []
         self.use_tts = False
+        self.worker_count = 8
+        self.max_pending = 1000
+        self.queue_size = 0
+        self.overflow_policy = "drop_oldest"
+        self.message_cache_size = 5000
+        self.message_cache_ttl = 3600
+        self.user_cache_size = 10000
+        self.user_cache_ttl = 3600
+        self.send_channel_rate = 1.0
+        self.send_channel_burst = 5
+        self.send_global_rate = 40.0
+        self.send_global_burst = 40
+        self.coalesce_window = 0.3
+        self.download_max_connections = 32
+        self.download_per_host_limit = 8
+        self.download_max_size = 25 * 1024 * 1024
+        self.download_timeout = 10
+        self.download_retries = 2
+        self.media_cache_enable = True
+        self.media_cache_dir = "data/media_cache"
+        self.media_cache_max_size = 512 * 1024 * 1024
+        self.image_workers = 2
+        self.image_job_timeout = 15
+        self.reload_watch = True
+        self.reload_watch_interval = 5
+        self.metrics_enable = False
+        self.metrics_host = "127.0.0.1"
+        self.metrics_port = 9464
+        self.tracing_enable = False
+        self.tracing_sample_rate = 0.01
+        self.tracing_slow_threshold = 5.0
+        self.tracing_ttl = 300
+        self.tracing_file = "logs/slow_traces.jsonl"
+        self.tracing_rotation = "10 MB"
+        self.tracing_retention = 5
+        self.recording_enable = False
+        self.recording_dir = "data/recordings"
+        self.recording_anonymize = False
+        self.recording_max_size = 1024 * 1024 * 1024
+        self.journal_enable = False
+        self.journal_dir = "data/journal"
+        self.journal_segment_size = 16 * 1024 * 1024
+        self.journal_fsync_interval = 0.05
+        self.journal_retry_interval = 5
+        self.journal_max_attempts = 10
+        self.journal_max_size = 1024 * 1024 * 1024
+        self.outbox_memory_size = 1000
+        self.outbox_spill_dir = "data/outbox"
+        self.outbox_spill_max_size = 256 * 1024 * 1024
+        self.outbox_send_timeout = 10
+        self.outbox_drain_batch = 100
+        self.outbox_backoff_initial = 0.5
+        self.outbox_backoff_max = 30
+        self.sharding_mode = "none"
+        self.sharding_shard_count = 0
+        self.sharding_shard_ids = []
+        self.sharding_processes = 2
         self.debug_level = "DEBUG"
+        self.payload_log = False
+        self.payload_log_sample_rate = 1.0
+        self.payload_log_max_length = 2000
+        self.payload_extras = False
 
     def load_config(self, config_path: str = "config.toml") -> None:
         """加载配置文件"""
@@ -87,13 +260,117 @@ class GlobalConfig:
             self.ban_user_id = chat_config.get("ban_user_id", [])
             self.enable_poke = chat_config.get("enable_poke", True)
 
+            # 加载附加的Bot实例配置
+            self.instances = [
+                InstanceConfig(
+                    name=instance_config.get("name") or instance_config.get("platform_name", ""),
+                    token=instance_config.get("token", ""),
+                    platform=instance_config.get("platform_name", ""),
+                    proxy=instance_config.get("proxy", self.discord_proxy),
+                    channel_list_type=instance_config.get("channel_list_type", self.channel_list_type),
+                    channel_list=instance_config.get("channel_list", self.channel_list),
+                    private_list_type=instance_config.get("private_list_type", self.private_list_type),
+                    private_list=instance_config.get("private_list", self.private_list),
+                    ban_user_id=instance_config.get("ban_user_id", self.ban_user_id),
+                )
+                for instance_config in config.get("Instances", [])
+            ]
+
             # 加载语音配置
             voice_config = config.get("Voice", {})
             self.use_tts = voice_config.get("use_tts", False)
 
+            # 加载性能配置
+            performance_config = config.get("Performance", {})
+            self.worker_count = performance_config.get("worker_count", 8)
+            self.max_pending = performance_config.get("max_pending", 1000)
+            self.queue_size = performance_config.get("queue_size", 0)
+            self.overflow_policy = performance_config.get("overflow_policy", "drop_oldest")
+            self.message_cache_size = performance_config.get("message_cache_size", 5000)
+            self.message_cache_ttl = performance_config.get("message_cache_ttl", 3600)
+            self.user_cache_size = performance_config.get("user_cache_size", 10000)
+            self.user_cache_ttl = performance_config.get("user_cache_ttl", 3600)
+            self.send_channel_rate = performance_config.get("send_channel_rate", 1.0)
+            self.send_channel_burst = performance_config.get("send_channel_burst", 5)
+            self.send_global_rate = performance_config.get("send_global_rate", 40.0)
+            self.send_global_burst = performance_config.get("send_global_burst", 40)
+            self.coalesce_window = performance_config.get("coalesce_window", 0.3)
+
+            # 加载媒体配置
+            media_config = config.get("Media", {})
+            self.download_max_connections = media_config.get("download_max_connections", 32)
+            self.download_per_host_limit = media_config.get("download_per_host_limit", 8)
+            self.download_max_size = media_config.get("download_max_size", 25 * 1024 * 1024)
+            self.download_timeout = media_config.get("download_timeout", 10)
+            self.download_retries = media_config.get("download_retries", 2)
+            self.media_cache_enable = media_config.get("cache_enable", True)
+            self.media_cache_dir = media_config.get("cache_dir", "data/media_cache")
+            self.media_cache_max_size = media_config.get("cache_max_size", 512 * 1024 * 1024)
+            self.image_workers = media_config.get("image_workers", 2)
+            self.image_job_timeout = media_config.get("image_job_timeout", 15)
+
+            # 加载热重载配置
+            reload_config = config.get("Reload", {})
+            self.reload_watch = reload_config.get("watch", True)
+            self.reload_watch_interval = reload_config.get("watch_interval", 5)
+
+            # 加载指标端点配置
+            metrics_config = config.get("Metrics", {})
+            self.metrics_enable = metrics_config.get("enable", False)
+            self.metrics_host = metrics_config.get("host", "127.0.0.1")
+            self.metrics_port = metrics_config.get("port", 9464)
+
+            # 加载消息追踪配置
+            tracing_config = config.get("Tracing", {})
+            self.tracing_enable = tracing_config.get("enable", False)
+            self.tracing_sample_rate = tracing_config.get("sample_rate", 0.01)
+            self.tracing_slow_threshold = tracing_config.get("slow_threshold", 5.0)
+            self.tracing_ttl = tracing_config.get("ttl", 300)
+            self.tracing_file = tracing_config.get("file", "logs/slow_traces.jsonl")
+            self.tracing_rotation = tracing_config.get("rotation", "10 MB")
+            self.tracing_retention = tracing_config.get("retention", 5)
+
+            # 加载流量录制配置
+            recording_config = config.get("Recording", {})
+            self.recording_enable = recording_config.get("enable", False)
+            self.recording_dir = recording_config.get("dir", "data/recordings")
+            self.recording_anonymize = recording_config.get("anonymize", False)
+            self.recording_max_size = recording_config.get("max_size", 1024 * 1024 * 1024)
+
+            # 加载入站日志配置
+            journal_config = config.get("Journal", {})
+            self.journal_enable = journal_config.get("enable", False)
+            self.journal_dir = journal_config.get("dir", "data/journal")
+            self.journal_segment_size = journal_config.get("segment_size", 16 * 1024 * 1024)
+            self.journal_fsync_interval = journal_config.get("fsync_interval", 0.05)
+            self.journal_retry_interval = journal_config.get("retry_interval", 5)
+            self.journal_max_attempts = journal_config.get("max_attempts", 10)
+            self.journal_max_size = journal_config.get("max_size", 1024 * 1024 * 1024)
+
+            # 加载发件箱配置
+            outbox_config = config.get("Outbox", {})
+            self.outbox_memory_size = outbox_config.get("memory_size", 1000)
+            self.outbox_spill_dir = outbox_config.get("spill_dir", "data/outbox")
+            self.outbox_spill_max_size = outbox_config.get("spill_max_size", 256 * 1024 * 1024)
+            self.outbox_send_timeout = outbox_config.get("send_timeout", 10)
+            self.outbox_drain_batch = outbox_config.get("drain_batch", 100)
+            self.outbox_backoff_initial = outbox_config.get("backoff_initial", 0.5)
+            self.outbox_backoff_max = outbox_config.get("backoff_max", 30)
+
+            # 加载网关分片配置
+            sharding_config = config.get("Sharding", {})
+            self.sharding_mode = sharding_config.get("mode", "none")
+            self.sharding_shard_count = sharding_config.get("shard_count", 0)
+            self.sharding_shard_ids = sharding_config.get("shard_ids", [])
+            self.sharding_processes = sharding_config.get("processes", 2)
+
             # 加载调试配置
             debug_config = config.get("Debug", {})
             self.debug_level = debug_config.get("level", "DEBUG")
+            self.payload_log = debug_config.get("payload_log", False)
+            self.payload_log_sample_rate = debug_config.get("payload_sample_rate", 1.0)
+            self.payload_log_max_length = debug_config.get("payload_max_length", 2000)
+            self.payload_extras = debug_config.get("payload_extras", False)
 
             logger.debug(f"读取到的配置内容：")
             logger.debug(f"平台: {self.platform}")
@@ -107,12 +384,185 @@ class GlobalConfig:
             logger.debug(f"私聊列表: {self.private_list}")
             logger.debug(f"禁用用户ID列表: {self.ban_user_id}")
             logger.debug(f"是否启用TTS: {self.use_tts}")
+            logger.debug(f"并发worker数量: {self.worker_count}")
+            logger.debug(f"工作池最大积压消息数: {self.max_pending}")
+            logger.debug(f"入站队列容量: {self.queue_size}")
+            logger.debug(f"队列溢出策略: {self.overflow_policy}")
+            logger.debug(f"消息缓存容量: {self.message_cache_size}，过期时间: {self.message_cache_ttl}秒")
+            logger.debug(f"用户缓存容量: {self.user_cache_size}，过期时间: {self.user_cache_ttl}秒")
+            logger.debug(f"单频道发送速率: {self.send_channel_rate}条/秒，突发: {self.send_channel_burst}条")
+            logger.debug(f"全局发送速率: {self.send_global_rate}条/秒，突发: {self.send_global_burst}条")
+            logger.debug(f"出站消息合并窗口: {self.coalesce_window}秒")
+            logger.debug(f"下载最大连接数: {self.download_max_connections}，单host并发: {self.download_per_host_limit}")
+            logger.debug(f"下载大小上限: {self.download_max_size}字节，超时: {self.download_timeout}秒，重试: {self.download_retries}次")
+            logger.debug(f"媒体缓存: {'启用' if self.media_cache_enable else '禁用'}，目录: {self.media_cache_dir}，上限: {self.media_cache_max_size}字节")
+            logger.debug(f"图片处理进程数: {self.image_workers}，单任务超时: {self.image_job_timeout}秒")
+            logger.debug(f"监视配置文件变化: {self.reload_watch}，检查间隔: {self.reload_watch_interval}秒")
+            logger.debug(f"指标端点: {'启用' if self.metrics_enable else '禁用'}，地址: {self.metrics_host}:{self.metrics_port}")
+            logger.debug(
+                f"消息追踪: {'启用' if self.tracing_enable else '禁用'}，采样率: {self.tracing_sample_rate}，"
+                f"慢消息阈值: {self.tracing_slow_threshold}秒，输出文件: {self.tracing_file}"
+            )
+            logger.debug(
+                f"流量录制: {'启用' if self.recording_enable else '禁用'}，目录: {self.recording_dir}，"
+                f"匿名化: {self.recording_anonymize}，单文件上限: {self.recording_max_size}字节"
+            )
+            logger.debug(
+                f"入站日志: {'启用' if self.journal_enable else '禁用'}，目录: {self.journal_dir}，"
+                f"分段大小: {self.journal_segment_size}字节，fsync间隔: {self.journal_fsync_interval}秒，"
+                f"重放间隔: {self.journal_retry_interval}秒，最多重试: {self.journal_max_attempts}次，总大小上限: {self.journal_max_size}字节"
+            )
+            logger.debug(
+                f"发件箱: 内存容量: {self.outbox_memory_size}条，溢出目录: {self.outbox_spill_dir}，"
+                f"溢出上限: {self.outbox_spill_max_size}字节，发送超时: {self.outbox_send_timeout}秒，"
+                f"每批补发: {self.outbox_drain_batch}条，退避: {self.outbox_backoff_initial}~{self.outbox_backoff_max}秒"
+            )
+            logger.debug(
+                f"网关分片: 模式: {self.sharding_mode}，分片总数: {self.sharding_shard_count or '自动'}，"
+                f"负责的分片: {self.sharding_shard_ids or '全部'}，网关进程数: {self.sharding_processes}"
+            )
+            for instance in self.instances:
+                logger.debug(
+                    f"附加Bot实例 {instance.name}: 平台: {instance.platform}，代理: {instance.proxy}，"
+                    f"频道名单: {instance.channel_list_type} {instance.channel_list}，"
+                    f"私聊名单: {instance.private_list_type} {instance.private_list}，禁用用户: {instance.ban_user_id}"
+                )
             logger.debug(f"调试级别: {self.debug_level}")
+            logger.debug(f"记录消息内容: {self.payload_log}，采样率: {self.payload_log_sample_rate}，截断长度: {self.payload_log_max_length}，包含详细信息: {self.payload_extras}")
 
+            self.validate()
         except Exception as e:
             logger.error(f"加载配置文件失败: {e}")
             raise
 
+    def validate(self) -> None:
+        """检查配置取值是否合法，不合法时抛出ValueError"""
+        errors = []
+        for name in ("channel_list_type", "private_list_type"):
+            if getattr(self, name) not in LIST_TYPES:
+                errors.append(f"{name} 必须是 {LIST_TYPES} 之一，当前为 {getattr(self, name)!r}")
+        for name in ("channel_list", "private_list", "ban_user_id"):
+            if not isinstance(getattr(self, name), list):
+                errors.append(f"{name} 必须是列表")
+        platforms = [self.platform]
+        for instance in self.instances:
+            if not instance.token or not instance.platform:
+                errors.append(f"Bot实例 {instance.name!r} 必须填写 token 和 platform_name")
+            elif instance.platform in platforms:
+                errors.append(f"Bot实例 {instance.name!r} 的 platform_name {instance.platform!r} 与其他实例重复")
+            platforms.append(instance.platform)
+            for name in ("channel_list_type", "private_list_type"):
+                if getattr(instance, name) not in LIST_TYPES:
+                    errors.append(f"Bot实例 {instance.name!r} 的 {name} 必须是 {LIST_TYPES} 之一")
+            for name in ("channel_list", "private_list", "ban_user_id"):
+                if not isinstance(getattr(instance, name), list):
+                    errors.append(f"Bot实例 {instance.name!r} 的 {name} 必须是列表")
+        if self.instances and self.sharding_mode == "process":
+            errors.append("sharding mode 为 process 时不支持附加Bot实例")
+        if self.sharding_mode not in SHARDING_MODES:
+            errors.append(f"sharding mode 必须是 {SHARDING_MODES} 之一，当前为 {self.sharding_mode!r}")
+        if not isinstance(self.sharding_shard_ids, list) or not all(
+            isinstance(shard_id, int) and shard_id >= 0 for shard_id in self.sharding_shard_ids
+        ):
+            errors.append(f"shard_ids 必须是非负整数的列表，当前为 {self.sharding_shard_ids!r}")
+        elif self.sharding_shard_ids and not self.sharding_shard_count:
+            errors.append("指定 shard_ids 时必须同时指定 shard_count")
+        elif any(shard_id >= self.sharding_shard_count for shard_id in self.sharding_shard_ids):
+            errors.append(f"shard_ids 必须小于 shard_count（{self.sharding_shard_count}）")
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            errors.append(f"overflow_policy 必须是 {OVERFLOW_POLICIES} 之一，当前为 {self.overflow_policy!r}")
+        for name in POSITIVE_FIELDS:
+            if not isinstance(getattr(self, name), (int, float)) or getattr(self, name) <= 0:
+                errors.append(f"{name} 必须大于0，当前为 {getattr(self, name)!r}")
+        for name in NON_NEGATIVE_FIELDS:
+            if not isinstance(getattr(self, name), (int, float)) or getattr(self, name) < 0:
+                errors.append(f"{name} 不能小于0，当前为 {getattr(self, name)!r}")
+        if not 0 <= self.tracing_sample_rate <= 1:
+            errors.append(f"tracing sample_rate 必须在0到1之间，当前为 {self.tracing_sample_rate!r}")
+        if not 0 <= self.payload_log_sample_rate <= 1:
+            errors.append(f"payload_sample_rate 必须在0到1之间，当前为 {self.payload_log_sample_rate!r}")
+        if str(self.debug_level).upper() not in LOG_LEVELS:
+            errors.append(f"日志等级必须是 {LOG_LEVELS} 之一，当前为 {self.debug_level!r}")
+        if errors:
+            raise ValueError("配置不合法: " + "；".join(errors))
+
+
+LIST_TYPES = ("whitelist", "blacklist")
+SHARDING_MODES = ("none", "auto", "process")
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "channel_drop_oldest", "keep_priority")
+LOG_LEVELS = ("TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL")
+POSITIVE_FIELDS = (
+    "discord_heartbeat_interval",
+    "worker_count",
+    "max_pending",
+    "message_cache_size",
+    "message_cache_ttl",
+    "user_cache_size",
+    "user_cache_ttl",
+    "send_channel_rate",
+    "send_channel_burst",
+    "send_global_rate",
+    "send_global_burst",
+    "download_max_connections",
+    "download_per_host_limit",
+    "download_max_size",
+    "download_timeout",
+    "media_cache_max_size",
+    "image_workers",
+    "image_job_timeout",
+    "payload_log_max_length",
+    "metrics_port",
+    "tracing_ttl",
+    "tracing_retention",
+    "recording_max_size",
+    "journal_segment_size",
+    "journal_retry_interval",
+    "journal_max_attempts",
+    "journal_max_size",
+    "outbox_memory_size",
+    "outbox_spill_max_size",
+    "outbox_send_timeout",
+    "outbox_drain_batch",
+    "outbox_backoff_initial",
+    "outbox_backoff_max",
+    "sharding_processes",
+)
+NON_NEGATIVE_FIELDS = (
+    "queue_size",
+    "coalesce_window",
+    "download_retries",
+    "reload_watch_interval",
+    "tracing_slow_threshold",
+    "journal_fsync_interval",
+    "sharding_shard_count",
+)
+# 这些配置在启动时被用于建立连接或创建资源，修改后需要重启才能生效
+RESTART_REQUIRED_FIELDS = (
+    "discord_token",
+    "discord_proxy",
+    "platform",
+    "maibot_host",
+    "maibot_port",
+    "max_pending",
+    "download_max_connections",
+    "download_per_host_limit",
+    "media_cache_dir",
+    "image_workers",
+    "metrics_enable",
+    "metrics_host",
+    "metrics_port",
+    "tracing_file",
+    "tracing_rotation",
+    "tracing_retention",
+    "journal_enable",
+    "journal_dir",
+    "outbox_spill_dir",
+    "sharding_mode",
+    "sharding_shard_count",
+    "sharding_shard_ids",
+    "sharding_processes",
+)
+
 
 # 加载全局配置
 global_config = GlobalConfig()
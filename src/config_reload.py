@@ -0,0 +1,126 @@
+import asyncio
+import os
+import signal
+from typing import Callable, List, Optional
+
+from .config import GlobalConfig, RESTART_REQUIRED_FIELDS, global_config
+from .logger import logger, set_log_level
+from .chat_filter import ChatFilter, set_chat_filter
+from .message_queue import message_queue
+from .message_cache import message_cache
+from .discord_resolver import discord_resolver
+from .send_scheduler import send_scheduler
+from .http_client import media_downloader
+from .media_cache import media_cache
+from .image_pool import image_pool
+from .instances import bot_instances
+
+CONFIG_PATH = "config.toml"
+
+# 重载完成后额外调用的回调（例如main中创建的工作池），参数为新的配置
+_reload_hooks: List[Callable[[GlobalConfig], None]] = []
+_reload_lock = asyncio.Lock()
+
+
+def on_reload(hook: Callable[[GlobalConfig], None]) -> None:
+    """登记一个重载回调"""
+    _reload_hooks.append(hook)
+
+
+def _apply(new_config: GlobalConfig) -> None:
+    """
+    把新配置应用到各个组件
+
+    中间没有await，整个过程在事件循环的一次调度内完成，
+    消息处理协程不会看到只应用了一半的配置。
+    """
+    for name, value in vars(new_config).items():
+        if name not in RESTART_REQUIRED_FIELDS:
+            setattr(global_config, name, value)
+
+    set_chat_filter(ChatFilter.from_config(global_config))
+    set_log_level(global_config.debug_level)
+    message_queue.resize(global_config.queue_size, global_config.overflow_policy)
+    message_cache.resize(global_config.message_cache_size, global_config.message_cache_ttl)
+    discord_resolver.resize(global_config.user_cache_size, global_config.user_cache_ttl)
+    send_scheduler.configure(
+        global_config.send_channel_rate,
+        global_config.send_channel_burst,
+        global_config.send_global_rate,
+        global_config.send_global_burst,
+        global_config.coalesce_window,
+    )
+    media_downloader.max_size = global_config.download_max_size
+    media_downloader.timeout = global_config.download_timeout
+    media_downloader.retries = global_config.download_retries
+    media_cache.resize(global_config.media_cache_max_size, global_config.media_cache_enable)
+    image_pool.job_timeout = global_config.image_job_timeout
+    bot_instances.apply_config(global_config)
+    for hook in _reload_hooks:
+        hook(global_config)
+
+
+async def reload_config(config_path: str = CONFIG_PATH) -> bool:
+    """
+    重新加载配置文件
+
+    先完整解析并校验新配置，任何错误都不会影响当前运行的配置；
+    需要重启才能生效的配置项只报告差异，保持旧值不变。
+
+    Returns:
+        bool: 是否成功应用了新配置
+    """
+    async with _reload_lock:
+        new_config = GlobalConfig()
+        try:
+            await asyncio.to_thread(new_config.load_config, config_path)
+        except Exception as e:
+            logger.error(f"配置重载失败，继续使用当前配置: {e}")
+            return False
+
+        for name in RESTART_REQUIRED_FIELDS:
+            if getattr(new_config, name) != getattr(global_config, name):
+                value = "******" if name == "discord_token" else getattr(new_config, name)
+                logger.warning(f"配置项 {name} 已修改为 {value!r}，需要重启adapter才能生效")
+
+        try:
+            _apply(new_config)
+        except Exception as e:
+            logger.exception(f"应用新配置时出错: {e}")
+            return False
+        logger.info("配置已重载")
+        return True
+
+
+def _config_mtime(config_path: str) -> Optional[float]:
+    try:
+        return os.stat(config_path).st_mtime
+    except OSError:
+        return None
+
+
+async def watch_config(config_path: str = CONFIG_PATH) -> None:
+    """定期检查配置文件的修改时间，变化时自动重载；未启用监视时只注册SIGHUP"""
+    register_reload_signal(config_path)
+    last_mtime = _config_mtime(config_path)
+    while True:
+        await asyncio.sleep(global_config.reload_watch_interval or 5)
+        if not global_config.reload_watch:
+            continue
+        mtime = _config_mtime(config_path)
+        if mtime is not None and mtime != last_mtime:
+            last_mtime = mtime
+            logger.info("检测到配置文件变化，正在重载...")
+            await reload_config(config_path)
+
+
+def register_reload_signal(config_path: str = CONFIG_PATH) -> None:
+    """收到SIGHUP时重载配置（仅POSIX系统）"""
+    if not hasattr(signal, "SIGHUP"):
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(reload_config(config_path)))
+    except (NotImplementedError, RuntimeError):
+        return
+    logger.debug("已注册SIGHUP配置重载")
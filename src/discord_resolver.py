@@ -0,0 +1,135 @@
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+import discord
+
+from .cache import LRUTTLCache
+from .config import global_config
+from .logger import logger
+
+T = TypeVar("T")
+
+_LEADER_CANCELLED = object()  # 发起请求的协程被取消时交给等待者的标记，等待者据此重新发起请求
+
+
+class DiscordResolver:
+    """
+    用户与私聊频道解析器
+
+    依次从本地缓存、discord.py的网关缓存、REST获取User和DMChannel，
+    对同一ID的并发REST请求合并为一次。
+    """
+
+    discord_bot: discord.Client = None
+
+    def __init__(self, max_size: int, ttl: float):
+        self._users: LRUTTLCache[discord.User] = LRUTTLCache(max_size, ttl)
+        self._dm_channels: LRUTTLCache[discord.DMChannel] = LRUTTLCache(max_size, ttl)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.sources: Counter = Counter()
+
+    def remember_user(self, user: discord.abc.User) -> None:
+        self._users.set(user.id, user)
+
+    def remember_dm_channel(self, user_id: int, channel: discord.DMChannel) -> None:
+        self._dm_channels.set(user_id, channel)
+
+    async def get_user(self, user_id: int) -> Optional[discord.User]:
+        """
+        获取用户
+
+        Parameters:
+            user_id: int: 用户ID
+        Returns:
+            Optional[discord.User]: 用户，获取失败时为None
+        """
+        user = self._users.get(user_id)
+        if user is not None:
+            self.sources["user_cache"] += 1
+            return user
+        user = self.discord_bot.get_user(user_id)
+        if user is not None:
+            self.sources["user_gateway"] += 1
+        else:
+            try:
+                user = await self._single_flight(("user", user_id), lambda: self.discord_bot.fetch_user(user_id))
+            except Exception as e:
+                logger.error(f"获取用户 {user_id} 失败: {e}")
+                return None
+            self.sources["user_rest"] += 1
+        self.remember_user(user)
+        return user
+
+    async def get_dm_channel(self, user_id: int) -> Optional[discord.DMChannel]:
+        """
+        获取与用户的私聊频道
+
+        Parameters:
+            user_id: int: 用户ID
+        Returns:
+            Optional[discord.DMChannel]: 私聊频道，获取失败时为None
+        """
+        channel = self._dm_channels.get(user_id)
+        if channel is not None:
+            self.sources["dm_cache"] += 1
+            return channel
+        user = await self.get_user(user_id)
+        if user is None:
+            return None
+        channel = user.dm_channel
+        if channel is not None:
+            self.sources["dm_gateway"] += 1
+        else:
+            try:
+                channel = await self._single_flight(("dm", user_id), user.create_dm)
+            except Exception as e:
+                logger.error(f"创建与用户 {user_id} 的私聊频道失败: {e}")
+                return None
+            self.sources["dm_rest"] += 1
+        self.remember_dm_channel(user_id, channel)
+        return channel
+
+    async def _single_flight(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        同一key上同时只发起一次请求，其余调用者等待同一结果
+
+        发起请求的协程被取消时，只有它自己收到CancelledError；等待中的调用者重新发起请求。
+        """
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            self.sources["merged"] += 1
+            result = await asyncio.shield(future)
+            if result is not _LEADER_CANCELLED:
+                return result
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 标记异常已被读取，避免无人等待时告警
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def resize(self, max_size: int, ttl: float) -> None:
+        self._users.resize(max_size, ttl)
+        self._dm_channels.resize(max_size, ttl)
+
+    def stats(self) -> dict:
+        return {
+            "users": self._users.stats(),
+            "dm_channels": self._dm_channels.stats(),
+            "sources": dict(self.sources),
+        }
+
+
+discord_resolver = DiscordResolver(global_config.user_cache_size, global_config.user_cache_ttl)
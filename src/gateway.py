@@ -0,0 +1,139 @@
+import math
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import discord
+from discord.ext import commands
+
+from .config import global_config
+from .logger import logger
+from .message_cache import message_cache
+from .chat_filter import FilterReason
+from .instances import BotInstance, bot_instances, scoped_key
+from .inbound_event import InboundMessage
+from .metrics import Stage, gateway_events, inbound_messages, observe_stage, MetricFamily
+from .tracing import tracer, TraceStage
+
+
+def create_bot(
+    sharded: bool = False,
+    shard_ids: Optional[Sequence[int]] = None,
+    shard_count: Optional[int] = None,
+    proxy: Optional[str] = None,
+) -> commands.Bot:
+    """
+    创建Discord客户端
+
+    Parameters:
+        sharded: bool: 是否使用AutoShardedBot，在同一进程中维持多个网关分片
+        shard_ids: Optional[Sequence[int]]: 本进程负责的分片，None为全部
+        shard_count: Optional[int]: 分片总数，None为使用Discord推荐值
+        proxy: Optional[str]: 代理地址，None为使用[Discord_Server]中的代理
+    """
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    options = {"command_prefix": "!", "intents": intents}
+    # 配置代理
+    proxy = global_config.discord_proxy if proxy is None else proxy
+    if proxy:
+        logger.info(f"使用代理: {proxy}")
+        options["proxy"] = proxy
+    if not sharded:
+        return commands.Bot(**options)
+    return commands.AutoShardedBot(
+        shard_ids=list(shard_ids) if shard_ids else None,
+        shard_count=shard_count or None,
+        **options,
+    )
+
+
+def get_shard_id(message: discord.Message) -> int:
+    """消息所在的网关分片，私聊消息总是由0号分片接收"""
+    return message.guild.shard_id if message.guild is not None else 0
+
+
+def shard_latencies(bot: commands.Bot) -> List[Tuple[int, float]]:
+    """各分片的心跳延迟（秒），尚未连上的分片不返回"""
+    if isinstance(bot, commands.AutoShardedBot):
+        latencies = bot.latencies
+    else:
+        latencies = [(0, bot.latency)]
+    return [(shard_id, latency) for shard_id, latency in latencies if math.isfinite(latency)]
+
+
+def gateway_metric_families(latencies: Iterable[Tuple[int, float]]) -> Iterable[MetricFamily]:
+    yield "adapter_gateway_latency_seconds", "gauge", "各网关分片的心跳延迟", [
+        ({"shard": str(shard_id)}, latency) for shard_id, latency in latencies
+    ]
+
+
+async def normalize_message(
+    bot: commands.Bot,
+    message: discord.Message,
+    trace_enabled: bool = True,
+    instance: Optional[BotInstance] = None,
+) -> Optional[InboundMessage]:
+    """
+    把网关收到的消息规范化为InboundMessage
+
+    黑白名单只在这里判断一次，结果随消息传递；通过的消息会记录到最近消息缓存，并解析被回复的消息。
+
+    Parameters:
+        bot: commands.Bot: 收到消息的客户端
+        message: discord.Message: 网关消息
+        trace_enabled: bool: 是否按采样率记录处理轨迹（轨迹不能跨进程传递）
+        instance: Optional[BotInstance]: 收到消息的Bot实例，决定使用的黑白名单、用户缓存和平台名，None为主实例
+    Returns:
+        Optional[InboundMessage]: 需要发送给MaiBot的消息，被过滤或是任一Bot实例发出的消息为None
+    """
+    instance = instance or bot_instances.primary
+    if message.author == bot.user or bot_instances.is_own_user(message.author.id):
+        # 自己或同一进程中其他Bot实例发出的消息不转发（否则几个Bot会在同一频道中互相回复），
+        # 但也可能被回复，同样记录
+        message_cache.remember(message)
+        return None
+    inbound_messages.inc("received")
+    gateway_events.inc(str(get_shard_id(message)))
+    observe_stage(Stage.gateway, time.time() - message.created_at.timestamp())
+
+    is_group = isinstance(message.channel, discord.TextChannel)
+    reject_reason = instance.chat_filter.check(message.author.id, message.channel.id if is_group else None)
+    if reject_reason is not None and reject_reason != FilterReason.banned:
+        logger.debug("消息 {} 被过滤: {}", message.id, reject_reason)
+        inbound_messages.inc("filtered")
+        return None
+
+    # 记录到最近消息缓存，供之后的回复引用使用（被禁用户的消息也可能被别人回复）
+    message_cache.remember(message)
+    if isinstance(message.channel, discord.DMChannel):
+        instance.resolver.remember_user(message.author)
+        instance.resolver.remember_dm_channel(message.author.id, message.channel)
+
+    if reject_reason is not None:
+        logger.debug("消息 {} 被过滤: {}", message.id, reject_reason)
+        inbound_messages.inc("filtered")
+        return None
+
+    # 按采样率记录这条消息的处理轨迹，回复发出时结束
+    trace = None
+    if trace_enabled:
+        channel_key = f"group:{message.channel.id}" if is_group else f"private:{message.author.id}"
+        trace = tracer.start(message.id, scoped_key(instance.platform, channel_key))
+        if trace is not None:
+            trace.attrs["gateway_delay_ms"] = round((time.time() - message.created_at.timestamp()) * 1000, 3)
+            trace.attrs["shard"] = get_shard_id(message)
+
+    # 获取被回复的消息
+    referenced_message = None
+    if message.reference:
+        referenced_message = await message_cache.get_referenced(message)
+        if trace is not None:
+            trace.mark(TraceStage.reference_resolved)
+
+    # 队列中只放转换所需的字段，MessageBase在worker中直接由它构造
+    event = InboundMessage.from_message(
+        message, is_group, referenced_message, bot.user in message.mentions, instance.platform
+    )
+    event.trace = trace
+    return event
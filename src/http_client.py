@@ -0,0 +1,125 @@
+import asyncio
+import ssl
+from typing import Optional
+
+import aiohttp
+
+from .config import global_config
+from .logger import logger
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    """下载失败"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class MediaTooLargeError(DownloadError):
+    """下载内容超过大小上限"""
+
+
+def create_ssl_context() -> ssl.SSLContext:
+    context = ssl.create_default_context()
+    context.set_ciphers("DEFAULT@SECLEVEL=1")
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    return context
+
+
+class MediaDownloader:
+    """
+    共享的异步媒体下载器
+
+    所有媒体下载共用一个连接池（复用TLS连接），限制总并发和单host并发，
+    流式读取并在超过大小上限时立即中断，对可重试的错误做指数退避重试。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 32,
+        per_host_limit: int = 8,
+        max_size: int = 25 * 1024 * 1024,
+        timeout: float = 10,
+        retries: int = 2,
+        proxy: str = "",
+    ):
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.max_size = max_size
+        self.timeout = timeout
+        self.retries = retries
+        # aiohttp只支持http代理
+        self.proxy = proxy if proxy.startswith(("http://", "https://")) else None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.per_host_limit,
+                ssl=create_ssl_context(),
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def fetch(self, url: str, max_size: Optional[int] = None) -> bytes:
+        """
+        下载url对应的内容
+
+        Parameters:
+            url: str: 下载地址
+            max_size: Optional[int]: 大小上限（字节），默认使用配置值
+        Returns:
+            bytes: 下载到的内容
+        """
+        max_size = max_size or self.max_size
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._fetch_once(url, max_size)
+            except MediaTooLargeError:
+                raise
+            except DownloadError as e:
+                if not e.retryable or attempt >= self.retries:
+                    raise
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise DownloadError(f"下载失败: {e!r}") from e
+                error = e
+            delay = 0.5 * 2**attempt
+            logger.debug(f"下载 {url} 失败（{error!r}），{delay}秒后第{attempt + 1}次重试")
+            await asyncio.sleep(delay)
+        raise DownloadError(f"下载失败: {url}")
+
+    async def _fetch_once(self, url: str, max_size: int) -> bytes:
+        session = self._get_session()
+        # 超时按请求设置，热重载修改timeout后无需重建连接池
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with session.get(url, proxy=self.proxy, timeout=timeout) as response:
+            if response.status != 200:
+                raise DownloadError(f"HTTP Error: {response.status}", response.status in RETRYABLE_STATUS)
+            if response.content_length and response.content_length > max_size:
+                raise MediaTooLargeError(f"文件大小 {response.content_length} 超过上限 {max_size}")
+            buffer = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                buffer.extend(chunk)
+                if len(buffer) > max_size:
+                    raise MediaTooLargeError(f"文件大小超过上限 {max_size}")
+            return bytes(buffer)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+media_downloader = MediaDownloader(
+    max_connections=global_config.download_max_connections,
+    per_host_limit=global_config.download_per_host_limit,
+    max_size=global_config.download_max_size,
+    timeout=global_config.download_timeout,
+    retries=global_config.download_retries,
+    proxy=global_config.discord_proxy,
+)
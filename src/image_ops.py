@@ -0,0 +1,86 @@
+"""
+图片处理的纯函数
+
+这些函数会在图片处理进程池的子进程中执行，只依赖PIL，不要在这里引入配置、日志等模块。
+"""
+
+import io
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# (偏移, 魔数, 格式)
+IMAGE_SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (0, b"\xff\xd8\xff", "jpeg"),
+    (0, b"GIF87a", "gif"),
+    (0, b"GIF89a", "gif"),
+    (8, b"WEBP", "webp"),
+    (0, b"BM", "bmp"),
+    (0, b"II*\x00", "tiff"),
+    (0, b"MM\x00*", "tiff"),
+    (0, b"\x00\x00\x01\x00", "ico"),
+)
+
+SNIFF_LENGTH = 12  # 识别以上所有格式需要的最少字节数
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """
+    根据文件头的魔数判断图片格式，不解码图片
+    Parameters:
+        header: bytes: 图片数据的开头部分（至少SNIFF_LENGTH字节）
+    Returns:
+        Optional[str]: 图片格式（例如 'jpeg', 'png', 'gif'），无法识别时为None
+    """
+    for offset, signature, image_format in IMAGE_SIGNATURES:
+        if header[offset : offset + len(signature)] == signature:
+            if image_format == "webp" and header[:4] != b"RIFF":
+                continue
+            return image_format
+    return None
+
+
+def transcode_to_gif(image_bytes: bytes) -> bytes:
+    """将图片转码为GIF"""
+    image = Image.open(io.BytesIO(image_bytes))
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, format="GIF")
+    return output_buffer.getvalue()
+
+
+def detect_image_format(image_bytes: bytes) -> str:
+    """完整打开图片判断格式，仅在魔数无法识别时使用"""
+    return Image.open(io.BytesIO(image_bytes)).format.lower()
+
+
+def shrink_image(image_bytes: bytes, max_bytes: int) -> Tuple[bytes, str]:
+    """
+    缩小图片直到编码后不超过max_bytes
+
+    带透明通道的图片保存为PNG，其余保存为JPEG；动图只保留第一帧。
+    Returns:
+        Tuple[bytes, str]: 缩小后的图片数据和格式，无法缩小到上限内时返回最后一次的结果
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.seek(0)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    image_format = "png" if has_alpha else "jpeg"
+    size = len(image_bytes)
+    output = image_bytes
+    for _ in range(6):
+        # 文件大小大致与像素数成正比，按面积比例缩小并留一些余量
+        scale = min(0.9, (max_bytes / size) ** 0.5 * 0.9)
+        width, height = max(1, int(image.width * scale)), max(1, int(image.height * scale))
+        image = image.resize((width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if image_format == "png":
+            image.save(buffer, format="PNG", optimize=True)
+        else:
+            image.save(buffer, format="JPEG", quality=85, optimize=True)
+        output = buffer.getvalue()
+        size = len(output)
+        if size <= max_bytes:
+            break
+    return output, image_format
@@ -0,0 +1,93 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from .config import global_config
+from .logger import logger
+
+
+class ImageProcessPool:
+    """
+    图片处理进程池
+
+    PIL的解码/编码是CPU密集操作，放在事件循环里会卡住网关心跳和其他频道，
+    这里把它们交给有界的进程池执行，并为每个任务设置超时。
+    """
+
+    def __init__(self, max_workers: int = 2, job_timeout: float = 15):
+        self.max_workers = max(1, max_workers)
+        self.job_timeout = job_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # 限制同时提交的任务数，避免积压无限增长
+        self._slots = asyncio.Semaphore(self.max_workers * 2)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        在进程池中执行func(*args)
+
+        超时后结束当前进程池的子进程（之后的任务换一个新的进程池），并立即归还名额，
+        卡住的任务不会一直占着子进程和名额；同一进程池中正在执行的其他任务会以BrokenProcessPool失败。
+
+        Parameters:
+            func: 可被pickle的顶层函数
+            timeout: Optional[float]: 超时时间（秒），默认使用配置值
+        Raises:
+            TimeoutError: 任务超时
+        """
+        timeout = timeout or self.job_timeout
+        await self._slots.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                executor = self._get_executor()
+                future = loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                logger.warning("图片处理进程池已损坏，正在重建")
+                self._executor = None
+                executor = self._get_executor()
+                future = loop.run_in_executor(executor, func, *args)
+            try:
+                # shield: 超时时不取消future，用它判断任务何时真正结束
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                future.add_done_callback(self._consume_result)
+                self._retire(executor)
+                raise TimeoutError(f"图片处理任务超时（{timeout}秒）") from None
+            except BrokenProcessPool:
+                # 子进程异常退出（或进程池因其他任务超时被结束），下次提交时重建进程池
+                if self._executor is executor:
+                    self._executor = None
+                raise
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _consume_result(future: asyncio.Future) -> None:
+        if not future.cancelled():
+            future.exception()  # 取出结果，避免"exception was never retrieved"
+
+    def _retire(self, executor: ProcessPoolExecutor) -> None:
+        """结束执行超时任务的进程池中的子进程，之后的任务改用新的进程池"""
+        if self._executor is executor:
+            logger.warning("图片处理任务超时，正在结束当前进程池，之后的任务改用新的进程池")
+            self._executor = None
+        # ProcessPoolExecutor没有公开的终止接口，先关闭它再直接结束它的子进程
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+image_pool = ImageProcessPool(global_config.image_workers, global_config.image_job_timeout)
@@ -0,0 +1,187 @@
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+import discord
+
+from .config import global_config
+from .message_converter import message_to_dict
+from .instances import scoped_key
+from .tracing import Trace
+
+
+class ReplyInfo(NamedTuple):
+    """被回复消息中转换时用到的字段"""
+
+    message_id: int
+    user_id: int
+    content: str
+
+
+# 录制时保存的字段（reply单独处理）
+RECORD_FIELDS = (
+    "message_id",
+    "user_id",
+    "channel_id",
+    "is_group",
+    "mention_self",
+    "content",
+    "nickname",
+    "username",
+    "channel_name",
+    "image_url",
+    "platform",
+)
+
+
+class InboundMessage:
+    """
+    入站队列中的一条消息
+
+    只保存转换成MessageBase所需的字段：ID为整数snowflake，文本直接引用discord.Message
+    上的字符串，不复制；时间戳由消息ID推算，不单独保存。
+    仍需要字典的地方通过as_dict()按需构造。
+    开启payload_log和payload_extras时才额外持有原始消息对象，用于记录完整内容。
+    """
+
+    __slots__ = (
+        "message_id",
+        "user_id",
+        "channel_id",
+        "is_group",
+        "mention_self",
+        "content",
+        "nickname",
+        "username",
+        "channel_name",
+        "image_url",
+        "platform",
+        "reply",
+        "message",
+        "received_at",
+        "trace",
+        "journal_seq",
+    )
+
+    post_type = "message"
+
+    def __init__(
+        self,
+        message_id: int,
+        user_id: int,
+        channel_id: int,
+        is_group: bool,
+        mention_self: bool,
+        content: str,
+        nickname: str,
+        username: str,
+        channel_name: Optional[str] = None,
+        image_url: Optional[str] = None,
+        reply: Optional[ReplyInfo] = None,
+        message: Optional[discord.Message] = None,
+        platform: Optional[str] = None,
+    ):
+        self.message_id = message_id
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.is_group = is_group
+        self.mention_self = mention_self
+        self.content = content
+        self.nickname = nickname
+        self.username = username
+        self.channel_name = channel_name
+        self.image_url = image_url
+        self.reply = reply
+        self.message = message
+        self.platform = platform or global_config.platform  # 收到消息的Bot实例在MaiBot中的平台名
+        self.received_at = time.monotonic()  # 用于统计排队耗时
+        self.trace: Optional[Trace] = None  # 被采样时的处理轨迹
+        self.journal_seq: Optional[int] = None  # 在入站日志中的序号，未启用日志时为None
+
+    @classmethod
+    def from_message(
+        cls,
+        message: discord.Message,
+        is_group: bool,
+        referenced: Optional[discord.Message] = None,
+        mention_self: bool = False,
+        platform: Optional[str] = None,
+    ) -> "InboundMessage":
+        image_url = None
+        for attachment in message.attachments:
+            if (attachment.content_type or "").startswith("image/"):
+                image_url = attachment.url
+                break
+        reply = None
+        if referenced is not None:
+            reply = ReplyInfo(referenced.id, referenced.author.id, referenced.content)
+        keep_message = global_config.payload_log and global_config.payload_extras
+        return cls(
+            message_id=message.id,
+            user_id=message.author.id,
+            channel_id=message.channel.id,
+            is_group=is_group,
+            mention_self=mention_self,
+            content=message.content,
+            nickname=message.author.display_name,
+            username=message.author.name,
+            channel_name=getattr(message.channel, "name", None) if is_group else None,
+            image_url=image_url,
+            reply=reply,
+            message=message if keep_message else None,
+            platform=platform,
+        )
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "InboundMessage":
+        """由to_record()的结果重建消息，用于录制回放（旧录制中没有platform，视为主实例）"""
+        fields = {name: record.get(name) for name in RECORD_FIELDS}
+        reply = record.get("reply")
+        return cls(**fields, reply=ReplyInfo(*reply) if reply else None)
+
+    def to_record(self) -> Dict[str, Any]:
+        """转换为可以JSON序列化的字典，用于流量录制"""
+        record = {name: getattr(self, name) for name in RECORD_FIELDS}
+        record["reply"] = list(self.reply) if self.reply else None
+        return record
+
+    @property
+    def message_type(self) -> str:
+        return "group" if self.is_group else "private"
+
+    @property
+    def channel_key(self) -> str:
+        """分片键，主实例的消息与message_queue.get_channel_key对字典消息的结果一致"""
+        return scoped_key(self.platform, f"group:{self.channel_id}" if self.is_group else f"private:{self.user_id}")
+
+    @property
+    def is_priority(self) -> bool:
+        return not self.is_group or self.mention_self
+
+    def as_dict(self) -> Dict[str, Any]:
+        """构造OneBot格式的字典视图，每次调用都重新构造，不缓存"""
+        reference = {
+            "message_id": str(self.reply.message_id),
+            "user_id": str(self.reply.user_id),
+            "content": self.reply.content,
+        } if self.reply else None
+        if self.message is not None:
+            data = message_to_dict(self.message, self.is_group, None, self.mention_self)
+            data["reference"] = reference
+            return data
+        created_at = discord.utils.snowflake_time(self.message_id)
+        return {
+            "post_type": self.post_type,
+            "message_type": self.message_type,
+            "filter_passed": True,
+            "message_id": str(self.message_id),
+            "user_id": str(self.user_id),
+            "group_id": str(self.channel_id) if self.is_group else None,
+            "message": self.content,
+            "raw_message": self.content,
+            "timestamp": created_at.isoformat(),
+            "mention_self": self.mention_self,
+            "attachments": [{"url": self.image_url, "content_type": "image/"}] if self.image_url else [],
+            "reference": reference,
+            "sender": {"user_id": str(self.user_id), "nickname": self.nickname, "card": self.username},
+            "channel": {"id": str(self.channel_id), "name": self.channel_name},
+        }
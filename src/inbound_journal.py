@@ -0,0 +1,401 @@
+import asyncio
+import json
+import os
+import re
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+
+from .config import global_config
+from .logger import logger
+from .inbound_event import InboundMessage
+
+SEGMENT_PATTERN = re.compile(r"^journal-(\d{10})\.log$")
+REPLAY_BATCH = 500  # 同时在途的重放消息上限，避免重放时挤占队列
+COMPACT_LIVE_RATIO = 0.25  # 最旧的分段中未确认的条目少于这个比例时，把它们搬到新分段并删除旧分段
+WRITE_RETRY_DELAY = 1.0  # 秒，写入失败后重试前的等待时间
+
+
+class JournalSegment:
+    """一个分段文件，只在事件循环中维护其统计"""
+
+    __slots__ = ("index", "path", "size", "entries", "live")
+
+    def __init__(self, index: int, path: str, size: int = 0):
+        self.index = index
+        self.path = path
+        self.size = size
+        self.entries = 0  # 分段中的条目数
+        self.live = 0  # 其中尚未确认的条目数
+
+
+class JournalEntry:
+    __slots__ = ("seq", "segment", "record", "attempts", "dispatched", "replayed")
+
+    def __init__(self, seq: int, segment: JournalSegment, record: dict, dispatched: bool = True):
+        self.seq = seq
+        self.segment = segment
+        self.record = record
+        self.attempts = 0
+        self.dispatched = dispatched  # 已放入入站队列、等待处理结果
+        self.replayed = False
+
+
+def encode_line(data: dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class InboundJournal:
+    """
+    入站消息的预写日志，保证发给MaiBot的消息至少送达一次
+
+    on_message在消息入队前追加一条记录；router.send_message成功后确认（ack），
+    失败的消息在MaiBot重新连上后重放，进程重启时未确认的消息也会从日志中恢复并重放。
+    重放的消息排在新消息之后，且MaiBot可能收到重复的消息（相同message_id）。
+
+    日志按大小分成多个段文件，每行一个JSON：条目为{"s": 序号, "e": 消息}，确认为{"a": [序号...]}。
+    写入由后台任务按fsync_interval成批进行（组提交），一批只fsync一次，
+    因此断电时最多丢失最近fsync_interval秒内收到的消息；写入和fsync都在线程中执行，不阻塞事件循环。
+    最旧的分段中条目全部确认后删除；只剩少量未确认条目时把它们搬到最新分段再删除；
+    总大小超过max_size时丢弃最旧的分段。只按从旧到新的顺序删除分段，
+    保证恢复时每个未删除的条目对应的确认记录都还在。
+    """
+
+    def __init__(self, directory: str, enabled: bool = True):
+        self.directory = directory
+        self.enabled = enabled
+        self.durable_seq = 0  # 已fsync到磁盘的最大序号
+        self._next_seq = 1
+        self._next_index = 1
+        self._entries: "OrderedDict[int, JournalEntry]" = OrderedDict()
+        self._segments: Deque[JournalSegment] = deque()
+        self._total_size = 0
+        self._sealed = False  # 启动时恢复的最后一个分段可能以写了一半的行结尾，不再追加
+        self._buffer: List[Tuple[JournalSegment, List[bytes]]] = []
+        self._acks: List[int] = []
+        self._pending_delete: List[str] = []
+        self._has_data = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._replaying = 0
+        self._is_connected: Optional[Callable[[], bool]] = None
+        # 写入线程独占
+        self._fd: Optional[int] = None
+        self._fd_path: Optional[str] = None
+        self.counts = {"appended": 0, "acked": 0, "replayed": 0, "discarded": 0, "abandoned": 0, "lost": 0}
+
+    async def open(self) -> None:
+        """启动时调用：读取已有的分段，恢复未确认的条目"""
+        if not self.enabled:
+            return
+        segments = await asyncio.to_thread(self._read_segments)
+        acked = set()
+        for _, _, _, _, segment_acks in segments:
+            acked.update(segment_acks)
+        for index, path, size, entries, _ in segments:
+            segment = JournalSegment(index, path, size)
+            self._segments.append(segment)
+            self._total_size += size
+            self._next_index = index + 1
+            for seq, record in entries:
+                segment.entries += 1
+                self._next_seq = max(self._next_seq, seq + 1)
+                if seq in acked:
+                    continue
+                previous = self._entries.pop(seq, None)
+                if previous is not None:
+                    # 整理时被搬到新分段的条目，以新分段中的为准
+                    previous.segment.live -= 1
+                self._entries[seq] = JournalEntry(seq, segment, record, dispatched=False)
+                segment.live += 1
+        self._entries = OrderedDict(sorted(self._entries.items()))
+        self._sealed = True
+        self.durable_seq = self._next_seq - 1
+        if self._entries:
+            logger.info(f"从入站日志恢复了 {len(self._entries)} 条未送达MaiBot的消息，连接MaiBot后重放")
+
+    def _read_segments(self) -> List[Tuple[int, str, int, List[Tuple[int, dict]], List[int]]]:
+        os.makedirs(self.directory, exist_ok=True)
+        segments = []
+        for name in sorted(os.listdir(self.directory)):
+            match = SEGMENT_PATTERN.match(name)
+            if not match:
+                continue
+            path = os.path.join(self.directory, name)
+            entries = []
+            acks = []
+            with open(path, "rb") as f:
+                for line_number, line in enumerate(f, 1):
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        # 通常是进程崩溃时只写了一半的最后一行
+                        logger.warning(f"入站日志 {name} 第{line_number}行已损坏，跳过")
+                        continue
+                    if "s" in data:
+                        entries.append((data["s"], data["e"]))
+                    elif "a" in data:
+                        acks.extend(data["a"])
+            segments.append((int(match.group(1)), path, os.path.getsize(path), entries, acks))
+        return segments
+
+    def append(self, event: InboundMessage) -> Optional[int]:
+        """记录一条即将入队的消息，返回其序号；未启用时返回None"""
+        if not self.enabled:
+            return None
+        seq = self._next_seq
+        self._next_seq += 1
+        record = event.to_record()
+        segment = self._emit(encode_line({"s": seq, "e": record}))
+        segment.entries += 1
+        segment.live += 1
+        self._entries[seq] = JournalEntry(seq, segment, record)
+        self.counts["appended"] += 1
+        return seq
+
+    def settle(self, seq: Optional[int], delivered: bool) -> None:
+        """
+        一条消息处理结束
+
+        Parameters:
+            seq: 消息的序号，None表示没有被记录
+            delivered: 是否已送达MaiBot（或无需发送）；False时等待重放
+        """
+        entry = self._release(seq)
+        if entry is None:
+            return
+        if delivered:
+            self._ack(entry)
+            return
+        # MaiBot断开期间的失败不计入重试次数，连上后总会重放
+        if self._is_connected is None or self._is_connected():
+            entry.attempts += 1
+        if entry.attempts >= global_config.journal_max_attempts:
+            logger.error(f"消息 {entry.record.get('message_id')} 已重试 {entry.attempts} 次仍未送达MaiBot，放弃")
+            self.counts["abandoned"] += 1
+            self._ack(entry)
+            return
+        entry.dispatched = False
+
+    def discard(self, seq: Optional[int]) -> None:
+        """消息被入站队列的溢出策略主动丢弃，视为已处理，不再重放"""
+        entry = self._release(seq)
+        if entry is not None:
+            self.counts["discarded"] += 1
+            self._ack(entry)
+
+    def _release(self, seq: Optional[int]) -> Optional[JournalEntry]:
+        if seq is None:
+            return None
+        entry = self._entries.get(seq)
+        if entry is not None and entry.replayed:
+            entry.replayed = False
+            self._replaying -= 1
+        return entry
+
+    def _ack(self, entry: JournalEntry) -> None:
+        del self._entries[entry.seq]
+        entry.segment.live -= 1
+        self._acks.append(entry.seq)
+        self._has_data.set()
+        self.counts["acked"] += 1
+
+    def _emit(self, line: bytes) -> JournalSegment:
+        """把一行放入写缓冲，返回它所在的分段"""
+        segment = self._segments[-1] if self._segments else None
+        if (
+            segment is None
+            or self._sealed
+            or (segment.size > 0 and segment.size + len(line) > global_config.journal_segment_size)
+        ):
+            self._sealed = False
+            segment = JournalSegment(self._next_index, os.path.join(self.directory, f"journal-{self._next_index:010d}.log"))
+            self._next_index += 1
+            self._segments.append(segment)
+        segment.size += len(line)
+        self._total_size += len(line)
+        if self._buffer and self._buffer[-1][0] is segment:
+            self._buffer[-1][1].append(line)
+        else:
+            self._buffer.append((segment, [line]))
+        self._has_data.set()
+        return segment
+
+    def _compact(self) -> None:
+        """删除已全部确认的旧分段，整理稀疏的最旧分段，并限制总大小（不处理正在写入的分段）"""
+        while len(self._segments) > 1 and self._segments[0].live == 0:
+            self._drop_oldest()
+        if len(self._segments) > 1:
+            oldest = self._segments[0]
+            if oldest.live <= oldest.entries * COMPACT_LIVE_RATIO:
+                for entry in [entry for entry in self._entries.values() if entry.segment is oldest]:
+                    segment = self._emit(encode_line({"s": entry.seq, "e": entry.record}))
+                    segment.entries += 1
+                    segment.live += 1
+                    entry.segment = segment
+                oldest.live = 0
+                self._drop_oldest()
+        while len(self._segments) > 1 and self._total_size > global_config.journal_max_size:
+            oldest = self._segments[0]
+            lost = [entry for entry in self._entries.values() if entry.segment is oldest]
+            for entry in lost:
+                self._release(entry.seq)
+                del self._entries[entry.seq]
+            if lost:
+                self.counts["lost"] += len(lost)
+                logger.warning(f"入站日志超过大小上限，丢弃最旧的分段，其中 {len(lost)} 条消息未送达MaiBot")
+            self._drop_oldest()
+
+    def _drop_oldest(self) -> None:
+        segment = self._segments.popleft()
+        self._total_size -= segment.size
+        self._pending_delete.append(segment.path)
+
+    async def flush(self) -> bool:
+        """
+        写入并fsync缓冲的记录，删除已整理掉的分段
+
+        Returns:
+            bool: 是否写入成功（没有需要写入的内容时也为True）
+        """
+        async with self._flush_lock:
+            self._has_data.clear()
+            if self._acks:
+                self._emit(encode_line({"a": self._acks}))
+                self._acks = []
+            self._compact()
+            self._has_data.clear()
+            buffer, self._buffer = self._buffer, []
+            delete, self._pending_delete = self._pending_delete, []
+            if not buffer and not delete:
+                return True
+            chunks = [(segment.path, b"".join(lines)) for segment, lines in buffer]
+            last_seq = self._next_seq - 1
+            written: List[int] = []
+            try:
+                await asyncio.to_thread(self._write_batch, chunks, delete, written)
+            except OSError as e:
+                # 未写入的记录和待删除的分段放回队首，下次flush时按原顺序重试；durable_seq保持不变
+                self._buffer = buffer[len(written):] + self._buffer
+                self._pending_delete = delete + self._pending_delete
+                self._has_data.set()
+                logger.error(f"写入入站日志失败，稍后重试: {e}")
+                return False
+            self.durable_seq = last_seq
+            return True
+
+    def _write_batch(self, chunks: List[Tuple[str, bytes]], delete: List[str], written: List[int]) -> None:
+        """
+        在写入线程中调用
+
+        每个分段的数据fsync后把序号加入written；写入失败时截掉这次写了一半的数据，
+        重试时不会和半行拼在一起。
+        """
+        for index, (path, data) in enumerate(chunks):
+            if path != self._fd_path:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                created = not os.path.exists(path)
+                self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self._fd_path = path
+                if created:
+                    self._fsync_directory()
+            start = os.lseek(self._fd, 0, os.SEEK_END)
+            try:
+                view = memoryview(data)
+                while view:
+                    count = os.write(self._fd, view)
+                    view = view[count:]
+                os.fsync(self._fd)
+            except OSError:
+                try:
+                    os.ftruncate(self._fd, start)
+                except OSError:
+                    pass
+                raise
+            written.append(index)
+        for path in delete:
+            if path == self._fd_path:
+                os.close(self._fd)
+                self._fd = None
+                self._fd_path = None
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _fsync_directory(self) -> None:
+        """新建分段后fsync目录，保证文件本身在断电后仍然存在（仅POSIX）"""
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    async def run(self, dispatch: Callable[[InboundMessage], Awaitable[None]], is_connected: Callable[[], bool]) -> None:
+        """
+        后台任务：成批写入日志，并在MaiBot连接正常时重放未确认的消息
+
+        Parameters:
+            dispatch: 把重放的消息放回入站队列
+            is_connected: MaiBot当前是否已连接
+        """
+        if not self.enabled:
+            return
+        self._is_connected = is_connected
+        await asyncio.gather(self._write_loop(), self._replay_loop(dispatch, is_connected))
+
+    async def _write_loop(self) -> None:
+        while True:
+            await self._has_data.wait()
+            if global_config.journal_fsync_interval:
+                await asyncio.sleep(global_config.journal_fsync_interval)  # 收集一批再写
+            if not await self.flush():
+                await asyncio.sleep(WRITE_RETRY_DELAY)
+
+    async def _replay_loop(self, dispatch: Callable[[InboundMessage], Awaitable[None]], is_connected: Callable[[], bool]) -> None:
+        while True:
+            dispatched = 0
+            if self._entries and is_connected():
+                for entry in list(self._entries.values()):
+                    if self._replaying >= REPLAY_BATCH:
+                        break
+                    if entry.dispatched or entry.seq not in self._entries:
+                        continue
+                    entry.dispatched = True
+                    entry.replayed = True
+                    self._replaying += 1
+                    event = InboundMessage.from_record(entry.record)
+                    event.journal_seq = entry.seq
+                    await dispatch(event)
+                    dispatched += 1
+            if dispatched:
+                self.counts["replayed"] += dispatched
+                logger.info(f"重放了 {dispatched} 条未送达MaiBot的消息")
+            # 还有积压时尽快继续，否则按重试间隔检查
+            await asyncio.sleep(0.1 if dispatched else global_config.journal_retry_interval)
+
+    async def close(self) -> None:
+        """关闭前写完缓冲；未确认的消息留在日志中，下次启动时重放"""
+        if not self.enabled:
+            return
+        await self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._fd_path = None
+
+    def stats(self) -> dict:
+        return {
+            "unacked": len(self._entries),
+            "segments": len(self._segments),
+            "size": self._total_size,
+            **self.counts,
+        }
+
+
+inbound_journal = InboundJournal(global_config.journal_dir, global_config.journal_enable)
@@ -0,0 +1,118 @@
+from typing import Dict, Iterator, Optional
+
+from discord.ext import commands
+
+from .config import GlobalConfig, InstanceConfig, global_config
+from .logger import logger
+from .chat_filter import ChatFilter, get_chat_filter
+from .discord_resolver import DiscordResolver, discord_resolver
+
+
+def scoped_key(platform: str, key: str) -> str:
+    """
+    在频道键前加上平台名，区分不同Bot实例在同一频道中的消息
+
+    主实例的键保持不变，与单实例时一致。
+    """
+    return key if platform == global_config.platform else f"{platform}:{key}"
+
+
+class BotInstance:
+    """
+    一个Bot身份
+
+    每个实例有自己的Token、黑白名单、用户缓存和在MaiBot中的平台名，
+    与其他实例共用事件循环、MaiBot地址、消息缓存、媒体缓存、下载连接池和工作池。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        platform: str,
+        token: str,
+        proxy: str,
+        resolver: DiscordResolver,
+        chat_filter: Optional[ChatFilter] = None,
+    ):
+        self.name = name
+        self.platform = platform
+        self.token = token
+        self.proxy = proxy
+        self.resolver = resolver
+        self._chat_filter = chat_filter
+        self.bot: commands.Bot = None  # 由main创建
+
+    @classmethod
+    def from_config(cls, config: InstanceConfig) -> "BotInstance":
+        return cls(
+            name=config.name,
+            platform=config.platform,
+            token=config.token,
+            proxy=config.proxy,
+            resolver=DiscordResolver(global_config.user_cache_size, global_config.user_cache_ttl),
+            chat_filter=ChatFilter.from_config(config),
+        )
+
+    @property
+    def chat_filter(self) -> ChatFilter:
+        """主实例使用全局过滤器（[Chat]），附加实例使用自己的过滤器"""
+        return self._chat_filter or get_chat_filter()
+
+
+class BotInstances:
+    """
+    全部Bot实例，按MaiBot平台名索引
+
+    主实例由[Discord_Server]、[MaiBot_Server]和[Chat]配置，附加实例由[[Instances]]配置。
+    """
+
+    def __init__(self, config: GlobalConfig):
+        self.primary = BotInstance(
+            name=config.platform,
+            platform=config.platform,
+            token=config.discord_token,
+            proxy=config.discord_proxy,
+            resolver=discord_resolver,
+        )
+        self.extra: Dict[str, BotInstance] = {
+            instance_config.platform: BotInstance.from_config(instance_config)
+            for instance_config in config.instances
+        }
+
+    def __iter__(self) -> Iterator[BotInstance]:
+        yield self.primary
+        yield from self.extra.values()
+
+    def __len__(self) -> int:
+        return 1 + len(self.extra)
+
+    def get(self, platform: str) -> Optional[BotInstance]:
+        """按平台名查找实例，未知平台返回None"""
+        if platform == self.primary.platform:
+            return self.primary
+        return self.extra.get(platform)
+
+    def is_own_user(self, user_id: int) -> bool:
+        """是否是某个已登录的Bot实例自己的账号"""
+        return any(
+            instance.bot is not None and instance.bot.user is not None and instance.bot.user.id == user_id
+            for instance in self
+        )
+
+    def apply_config(self, config: GlobalConfig) -> None:
+        """配置重载时替换附加实例的过滤器和缓存大小；增删实例、修改Token和代理需要重启"""
+        configured = {instance_config.platform: instance_config for instance_config in config.instances}
+        for platform in configured.keys() - self.extra.keys():
+            logger.warning(f"新增的Bot实例 {platform} 需要重启adapter才能生效")
+        for platform, instance in self.extra.items():
+            instance_config = configured.get(platform)
+            if instance_config is None:
+                logger.warning(f"Bot实例 {platform} 已从配置中删除，需要重启adapter才能停止")
+                continue
+            if instance_config.token != instance.token or instance_config.proxy != instance.proxy:
+                logger.warning(f"Bot实例 {platform} 的Token或代理已修改，需要重启adapter才能生效")
+            instance._chat_filter = ChatFilter.from_config(instance_config)
+            instance.resolver.resize(config.user_cache_size, config.user_cache_ttl)
+
+
+bot_instances = BotInstances(global_config)
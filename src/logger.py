@@ -1,10 +1,58 @@
 from loguru import logger
 from .config import global_config
+import json
+import random
 import sys
+from typing import Any, Callable
+
+LOG_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+
+
+def _add_handler(level: str) -> int:
+    # enqueue=True: 日志先放入队列，由后台线程写入stderr，终端阻塞时不会卡住事件循环
+    return logger.add(
+        sys.stderr,
+        level=level,
+        format=LOG_FORMAT,
+        enqueue=True,
+        filter=lambda record: "trace_export" not in record["extra"],  # 慢trace只写入单独的文件
+    )
+
 
 logger.remove()
-logger.add(
-    sys.stderr,
-    level=global_config.debug_level,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-)
+_handler_id = _add_handler(global_config.debug_level)
+
+
+def set_log_level(level: str) -> None:
+    """修改日志等级，运行中调用"""
+    global _handler_id
+    new_handler_id = _add_handler(level)
+    logger.remove(_handler_id)
+    _handler_id = new_handler_id
+
+
+def _dump_payload(payload_factory: Callable[[], Any]) -> str:
+    text = json.dumps(payload_factory(), ensure_ascii=False, default=str)
+    limit = global_config.payload_log_max_length
+    if len(text) > limit:
+        return f"{text[:limit]}...（共 {len(text)} 字符，已截断）"
+    return text
+
+
+def log_payload(title: str, payload_factory: Callable[[], Any]) -> None:
+    """
+    按需记录完整的消息内容（DEBUG级别）
+
+    默认关闭，需要在配置中开启payload_log；开启后按采样率抽样并截断过长的内容。
+    序列化只在日志真正会输出时才进行，因此热路径上关闭时几乎没有开销。
+
+    Parameters:
+        title: str: 日志标题
+        payload_factory: 返回要记录的内容的函数，在确定输出时才调用
+    """
+    if not global_config.payload_log:
+        return
+    sample_rate = global_config.payload_log_sample_rate
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return
+    logger.opt(lazy=True, depth=1).debug("{}: {}", lambda: title, lambda: _dump_payload(payload_factory))
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from maim_message import MessageBase, Router
+
+from .config import global_config
+from .logger import logger, log_payload
+from .metrics import maibot_messages
+
+SPILL_FILE = "outbox.jsonl"
+CHECK_INTERVAL = 1.0  # 秒，检查连接状态的间隔
+# Socket.IO客户端自己的重连间隔最长为10秒，断开超过这个时间仍未恢复时才由发件箱重建连接
+RECONNECT_GRACE = 10.0
+
+# (消息, 回调标识)，标识由调用方提供（例如入站日志的序号），送达或失败时原样传给on_settled
+OutboxItem = Tuple[MessageBase, Any]
+
+
+class MaiBotOutbox:
+    """
+    发往MaiBot的发件箱，包在router.send_message外面
+
+    连接正常且没有积压时直接发送，行为与直接调用router相同；
+    连接断开、发送失败或超时后进入断开状态，之后的消息不再调用router，直接暂存并立即返回，
+    worker不会堆积在注定失败的发送上。
+    暂存的消息先放在内存中，超过memory_size后最旧的消息溢出到磁盘文件，
+    连接恢复后按原顺序成批补发；补发失败时按指数退避再试。
+    Socket.IO只在连接意外中断时自动重连，MaiBot主动关闭连接（例如重启）后不会再连，
+    所以断开超过RECONNECT_GRACE秒后由发件箱重建客户端，之后按同样的退避间隔重试。
+    溢出文件只用于限制内存占用，启动时清空；跨重启不丢消息由[Journal]负责。
+    """
+
+    def __init__(self, router: Router, platform: str, spill_dir: str, spill_file: str = SPILL_FILE):
+        self.router = router
+        self.platform = platform
+        self.spill_path = os.path.join(spill_dir, spill_file)
+        self.on_settled: Optional[Callable[[Any, bool], None]] = None  # 暂存的消息送达或被丢弃时调用
+        self._memory: Deque[OutboxItem] = deque()
+        self._draining: Deque[OutboxItem] = deque()  # 正在补发的一批，最旧
+        self._spill_pending: List[bytes] = []  # 已溢出但还没写入文件的行
+        self._spill_unread = 0  # 溢出文件中（含未写入的）尚未读回的条数
+        self._spill_offset = 0
+        self._spill_bytes = 0
+        self._spill_lock = asyncio.Lock()
+        self._has_items = asyncio.Event()
+        self._healthy = True  # 最近一次发送是否成功；连接状态另由router判断
+        self._retry_at = 0.0
+        self._backoff = global_config.outbox_backoff_initial
+        self.counts = {"sent": 0, "buffered": 0, "drained": 0, "dropped": 0}
+
+    @property
+    def depth(self) -> int:
+        return len(self._draining) + self._spill_unread + len(self._memory)
+
+    @property
+    def connected(self) -> bool:
+        return self._healthy and self.router.check_connection(self.platform)
+
+    async def send(self, message_base: MessageBase, token: Any = None) -> Optional[bool]:
+        """
+        发送一条消息
+
+        Returns:
+            Optional[bool]: True为已送达；None为已暂存，之后通过on_settled(token, 是否送达)通知结果；
+            False为发件箱已满，消息被丢弃
+        """
+        if not self.depth and self.connected:
+            if await self._deliver(message_base):
+                self.counts["sent"] += 1
+                return True
+        return self._buffer(message_base, token)
+
+    def _buffer(self, message_base: MessageBase, token: Any) -> Optional[bool]:
+        if len(self._memory) >= global_config.outbox_memory_size:
+            if self._spill_bytes >= global_config.outbox_spill_max_size:
+                self.counts["dropped"] += 1
+                maibot_messages.inc("outbound", "dropped")
+                logger.warning(f"发件箱已满（{self.depth}条），丢弃消息 {message_base.message_info.message_id}")
+                return False
+            # 溢出文件中的消息都比内存中的旧，把内存中最旧的一条移过去即可保持顺序
+            oldest, oldest_token = self._memory.popleft()
+            line = json.dumps({"t": oldest_token, "m": oldest.to_dict()}, ensure_ascii=False).encode("utf-8") + b"\n"
+            self._spill_pending.append(line)
+            self._spill_unread += 1
+            self._spill_bytes += len(line)
+        self._memory.append((message_base, token))
+        self.counts["buffered"] += 1
+        maibot_messages.inc("outbound", "buffered")
+        self._has_items.set()
+        return None
+
+    async def _deliver(self, message_base: MessageBase) -> bool:
+        try:
+            response = await asyncio.wait_for(
+                self.router.send_message(message_base), global_config.outbox_send_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"发送消息 {message_base.message_info.message_id} 到MaiBot超时")
+            response = None
+        except Exception as e:
+            logger.error(f"发送消息到MaiBot时出错: {e}")
+            response = None
+        if not response:
+            maibot_messages.inc("outbound", "failed")
+            self._mark_down()
+            return False
+        maibot_messages.inc("outbound", "sent")
+        log_payload("MaiBot响应", lambda: response.to_dict() if hasattr(response, "to_dict") else response)
+        self._mark_up()
+        return True
+
+    def _mark_down(self) -> None:
+        if self._healthy:
+            logger.warning("MaiBot连接不可用，之后的消息先暂存到发件箱")
+            self._healthy = False
+            self._backoff = global_config.outbox_backoff_initial
+        else:
+            self._backoff = min(self._backoff * 2, global_config.outbox_backoff_max)
+        self._retry_at = time.monotonic() + self._backoff
+
+    def _mark_up(self) -> None:
+        if not self._healthy:
+            logger.info(f"MaiBot连接可用，发件箱中有 {self.depth} 条消息待补发")
+            self._healthy = True
+
+    def _settle(self, token: Any, delivered: bool) -> None:
+        if token is not None and self.on_settled is not None:
+            self.on_settled(token, delivered)
+
+    async def run(self) -> None:
+        """后台任务：写出溢出的消息，监视连接状态，连接可用时成批补发"""
+        await asyncio.to_thread(self._spill_reset)
+        disconnected_since = None
+        while True:
+            await self._flush_spill()
+            now = time.monotonic()
+            if not self.router.check_connection(self.platform):
+                if disconnected_since is None:
+                    disconnected_since = now
+                elif now - disconnected_since >= RECONNECT_GRACE and now >= self._retry_at:
+                    await self._reconnect()
+                    self._mark_down()
+                await asyncio.sleep(CHECK_INTERVAL)
+                continue
+            disconnected_since = None
+            if now < self._retry_at:
+                await asyncio.sleep(min(self._retry_at - now, CHECK_INTERVAL))
+            elif self.depth:
+                await self._drain_burst()
+                await asyncio.sleep(0)
+            else:
+                self._mark_up()
+                self._has_items.clear()
+                try:
+                    await asyncio.wait_for(self._has_items.wait(), CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _reconnect(self) -> None:
+        """重建到MaiBot的客户端，已注册的消息处理器会被重新注册到新客户端上"""
+        target = self.router.config.route_config.get(self.platform)
+        if target is None:
+            return
+        logger.info(f"与MaiBot的连接断开已超过 {RECONNECT_GRACE:.0f} 秒，重新建立连接")
+        try:
+            await self.router.remove_platform(self.platform)
+            await self.router.add_platform(self.platform, target)
+        except Exception as e:
+            logger.error(f"重新连接MaiBot失败: {e}")
+
+    async def _drain_burst(self) -> None:
+        """补发一批消息，中途失败时剩下的留在最前面，退避后再试"""
+        if not self._draining:
+            if self._spill_unread:
+                await self._read_spill(global_config.outbox_drain_batch)
+            else:
+                for _ in range(min(global_config.outbox_drain_batch, len(self._memory))):
+                    self._draining.append(self._memory.popleft())
+        while self._draining:
+            message_base, token = self._draining[0]
+            if not await self._deliver(message_base):
+                return
+            self._draining.popleft()
+            self.counts["drained"] += 1
+            self._settle(token, True)
+
+    async def _flush_spill(self) -> None:
+        if not self._spill_pending:
+            return
+        async with self._spill_lock:
+            lines, self._spill_pending = self._spill_pending, []
+            await asyncio.to_thread(self._spill_write, lines)
+
+    async def _read_spill(self, count: int) -> None:
+        await self._flush_spill()
+        async with self._spill_lock:
+            lines, self._spill_offset = await asyncio.to_thread(self._spill_read, self._spill_offset, count)
+            self._spill_unread -= len(lines)
+            for line in lines:
+                data = json.loads(line)
+                self._draining.append((MessageBase.from_dict(data["m"]), data["t"]))
+            if not self._spill_unread:
+                await asyncio.to_thread(self._spill_reset)
+                self._spill_offset = 0
+                self._spill_bytes = 0
+
+    def _spill_write(self, lines: List[bytes]) -> None:
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "ab") as f:
+            f.write(b"".join(lines))
+
+    def _spill_read(self, offset: int, count: int) -> Tuple[List[bytes], int]:
+        lines = []
+        with open(self.spill_path, "rb") as f:
+            f.seek(offset)
+            for _ in range(count):
+                line = f.readline()
+                if not line:
+                    break
+                lines.append(line)
+            return lines, f.tell()
+
+    def _spill_reset(self) -> None:
+        try:
+            os.remove(self.spill_path)
+        except FileNotFoundError:
+            pass
+
+    async def close(self) -> None:
+        """关闭时丢弃未送达的消息（启用[Journal]时它们会在下次启动后重放）"""
+        if self.depth:
+            logger.warning(f"发件箱中还有 {self.depth} 条消息未送达MaiBot")
+        self._memory.clear()
+        self._draining.clear()
+        self._spill_pending = []
+        self._spill_unread = 0
+        await asyncio.to_thread(self._spill_reset)
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "memory": len(self._memory),
+            "spilled": self._spill_unread,
+            "draining": len(self._draining),
+            **self.counts,
+        }
@@ -0,0 +1,83 @@
+import base64
+import binascii
+from typing import Optional, Union
+
+from .image_ops import SNIFF_LENGTH, sniff_image_format, detect_image_format
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+BASE64_PREFIX = "base64://"
+
+
+class MediaPayload:
+    """
+    适配器内部流转的媒体数据
+
+    持有原始字节（可以是基于mmap的memoryview）或Base64字符串二者之一，
+    另一种表示只在真正需要时才生成，且不长期保存，避免同一份数据在内存中存两份：
+    - Base64只在与MaiBot交互的边界上编码/解码
+    - 判断格式只解码开头几个字节，只有转码等需要像素时才完整解码
+    """
+
+    __slots__ = ("_data", "_base64", "_format")
+
+    def __init__(self, data: Optional[BytesLike] = None, base64_str: Optional[str] = None):
+        if data is None and base64_str is None:
+            raise ValueError("媒体数据不能为空")
+        self._data = data
+        self._base64 = base64_str
+        self._format: Optional[str] = None
+
+    @classmethod
+    def from_bytes(cls, data: BytesLike) -> "MediaPayload":
+        return cls(data=data)
+
+    @classmethod
+    def from_base64(cls, encoded: str) -> "MediaPayload":
+        """从Base64字符串创建，允许带有 base64:// 前缀"""
+        if encoded.startswith(BASE64_PREFIX):
+            encoded = encoded[len(BASE64_PREFIX) :]
+        return cls(base64_str=encoded)
+
+    @property
+    def data(self) -> BytesLike:
+        """原始字节，首次访问时才解码Base64，解码后丢弃Base64字符串"""
+        if self._data is None:
+            self._data = base64.b64decode(self._base64)
+            self._base64 = None
+        return self._data
+
+    def header(self, length: int = SNIFF_LENGTH) -> bytes:
+        """开头的length个字节，不触发完整解码"""
+        if self._data is not None:
+            return bytes(self._data[:length])
+        # 每4个Base64字符对应3个字节
+        chars = (length + 2) // 3 * 4
+        try:
+            return base64.b64decode(self._base64[:chars])[:length]
+        except (binascii.Error, ValueError):
+            return b""
+
+    @property
+    def format(self) -> str:
+        """图片格式，优先按文件头魔数判断"""
+        if self._format is None:
+            self._format = sniff_image_format(self.header()) or detect_image_format(bytes(self.data))
+        return self._format
+
+    @property
+    def size(self) -> int:
+        if self._data is not None:
+            return len(self._data)
+        padding = self._base64[-2:].count("=")
+        return len(self._base64) * 3 // 4 - padding
+
+    def to_base64(self) -> str:
+        """编码为Base64字符串（与MaiBot交互的边界上使用），不缓存结果"""
+        if self._base64 is not None:
+            return self._base64
+        return base64.b64encode(self._data).decode("ascii")
+
+    def to_wire(self) -> str:
+        """编码为 base64:// 形式的文件字段"""
+        return f"{BASE64_PREFIX}{self.to_base64()}"
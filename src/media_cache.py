@@ -0,0 +1,296 @@
+import asyncio
+import hashlib
+import mmap
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from .config import global_config
+from .logger import logger
+
+# Discord CDN的附件链接带有会变化的签名参数，去掉后才能稳定命中
+DISCORD_CDN_HOSTS = {"cdn.discordapp.com", "media.discordapp.net"}
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url)
+    if parts.hostname in DISCORD_CDN_HOSTS:
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+    return url
+
+
+def content_digest(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class MediaCache:
+    """
+    内容寻址的本地媒体缓存
+
+    文件按内容的sha256存放（相同内容只存一份），另外维护 键 -> 内容hash 的索引，
+    键可以是URL，也可以是派生结果的键（例如某张图转换成GIF后的结果）。
+    键索引在内存中保存一份，磁盘上的键文件只用于重启后恢复；内容文件被淘汰时，
+    指向它的键文件一并删除，键文件的数量不会超过仍有效的键。
+    读取通过mmap完成，总大小超过上限时按LRU淘汰。磁盘扫描、读写和删除都在线程中进行。
+    """
+
+    def __init__(self, directory: str, max_bytes: int, enabled: bool = True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._blob_dir = os.path.join(directory, "blobs")
+        self._key_dir = os.path.join(directory, "keys")
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # digest -> size，按最近使用排序
+        self._keys: Dict[str, str] = {}  # 键的hash -> digest
+        self._keys_by_digest: Dict[str, Set[str]] = {}  # digest -> 指向它的键的hash
+        self._total_bytes = 0
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._removals: Set[asyncio.Task] = set()  # 同步调用方发起的后台删除，保留引用避免被回收
+        self.counters: Counter = Counter()
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            blobs, keys = await asyncio.to_thread(self._scan)
+            for digest, size in blobs:
+                self._entries[digest] = size
+                self._total_bytes += size
+            for key_hash, digest in keys:
+                self._index_key(key_hash, digest)
+            self._loaded = True
+            logger.info(
+                f"媒体缓存已加载: {len(self._entries)} 个文件，共 {self._total_bytes} 字节，{len(self._keys)} 个键"
+            )
+            await self._remove(self._evict())
+
+    def _scan(self) -> Tuple[List[Tuple[str, int]], List[Tuple[str, str]]]:
+        """
+        扫描磁盘上已有的缓存文件（在线程中运行）
+
+        内容文件按修改时间排序，用于恢复LRU顺序；指向不存在的内容的键文件和残留的临时文件直接删除。
+        """
+        os.makedirs(self._blob_dir, exist_ok=True)
+        os.makedirs(self._key_dir, exist_ok=True)
+        found = []
+        for root, _, files in os.walk(self._blob_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                found.append((stat.st_mtime, name, stat.st_size))
+        found.sort()
+        digests = {name for _, name, _ in found}
+        keys, stale = [], 0
+        for root, _, files in os.walk(self._key_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if name.endswith(".tmp"):
+                        os.remove(path)
+                        continue
+                    with open(path, "r", encoding="ascii") as f:
+                        digest = f.read().strip()
+                    if digest in digests:
+                        keys.append((name, digest))
+                    else:
+                        os.remove(path)
+                        stale += 1
+                except (OSError, ValueError):
+                    continue
+        if stale:
+            logger.info(f"媒体缓存清理了 {stale} 个失效的键")
+        return [(digest, size) for _, digest, size in found], keys
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self._blob_dir, digest[:2], digest)
+
+    def _key_path(self, key_hash: str) -> str:
+        return os.path.join(self._key_dir, key_hash[:2], key_hash)
+
+    async def get(self, digest: str) -> Optional[memoryview]:
+        """
+        按内容hash读取
+
+        Returns:
+            Optional[memoryview]: 基于mmap的只读视图，未命中时为None
+        """
+        if not self.enabled:
+            return None
+        await self._ensure_loaded()
+        if digest not in self._entries:
+            self.counters["miss"] += 1
+            return None
+        try:
+            mapped = await asyncio.to_thread(self._map, self._blob_path(digest))
+        except (OSError, ValueError):
+            await self._remove(self._drop(digest))
+            self.counters["miss"] += 1
+            return None
+        if digest in self._entries:
+            self._entries.move_to_end(digest)
+        self.counters["hit"] += 1
+        return memoryview(mapped)
+
+    @staticmethod
+    def _map(path: str) -> mmap.mmap:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """查找键对应的内容hash"""
+        if not self.enabled:
+            return None
+        await self._ensure_loaded()
+        return self._keys.get(content_digest(key.encode("utf-8")))
+
+    async def get_by_key(self, key: str) -> Optional[memoryview]:
+        """按键（URL或派生键）读取"""
+        digest = await self.lookup(key)
+        if digest is None:
+            if self.enabled:
+                self.counters["miss"] += 1
+            return None
+        # 内容文件已丢失时get会删除它和指向它的键
+        return await self.get(digest)
+
+    async def get_by_url(self, url: str) -> Optional[memoryview]:
+        return await self.get_by_key(normalize_url(url))
+
+    async def put(self, data, key: Optional[str] = None) -> Optional[str]:
+        """
+        存入内容，hash计算和文件写入在线程中进行
+
+        Parameters:
+            data: bytes-like: 内容
+            key: Optional[str]: 同时登记的键（URL或派生键）
+        Returns:
+            Optional[str]: 内容hash，缓存未启用时为None
+        """
+        if not self.enabled or not data:
+            return None
+        await self._ensure_loaded()
+        key_hash = content_digest(key.encode("utf-8")) if key is not None else None
+        digest = await asyncio.to_thread(self._write_blob, data, key_hash)
+        await self._remove(self._register(digest, len(data), key_hash))
+        return digest
+
+    async def put_url(self, url: str, data) -> Optional[str]:
+        return await self.put(data, normalize_url(url))
+
+    def _write_blob(self, data, key_hash: Optional[str]) -> str:
+        digest = content_digest(data)
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            self._atomic_write(path, data)
+        if key_hash is not None:
+            self._atomic_write(self._key_path(key_hash), digest.encode("ascii"))
+        return digest
+
+    def _register(self, digest: str, size: int, key_hash: Optional[str]) -> List[str]:
+        """登记内容和键，返回因超出上限被淘汰、需要删除的文件"""
+        if digest in self._entries:
+            self._entries.move_to_end(digest)
+            self.counters["dedup"] += 1
+        else:
+            self._entries[digest] = size
+            self._total_bytes += size
+            self.counters["stored"] += 1
+        if key_hash is not None:
+            self._index_key(key_hash, digest)
+        return self._evict()
+
+    def _index_key(self, key_hash: str, digest: str) -> None:
+        previous = self._keys.get(key_hash)
+        if previous is not None and previous != digest:
+            self._keys_by_digest.get(previous, set()).discard(key_hash)
+        self._keys[key_hash] = digest
+        self._keys_by_digest.setdefault(digest, set()).add(key_hash)
+
+    def _atomic_write(self, path: str, data) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _drop(self, digest: str) -> List[str]:
+        """从索引中移除内容和指向它的键，返回需要删除的内容文件和键文件"""
+        size = self._entries.pop(digest, None)
+        if size is None:
+            return []
+        self._total_bytes -= size
+        paths = [self._blob_path(digest)]
+        for key_hash in self._keys_by_digest.pop(digest, ()):
+            if self._keys.get(key_hash) == digest:
+                del self._keys[key_hash]
+                paths.append(self._key_path(key_hash))
+        return paths
+
+    def _evict(self) -> List[str]:
+        """按LRU淘汰到上限以内，返回需要删除的文件"""
+        paths = []
+        while self._total_bytes > self.max_bytes and self._entries:
+            digest = next(iter(self._entries))
+            paths.extend(self._drop(digest))
+            self.counters["evicted"] += 1
+        return paths
+
+    async def _remove(self, paths: List[str]) -> None:
+        """在线程中批量删除文件"""
+        if paths:
+            await asyncio.to_thread(self._remove_files, paths)
+
+    @staticmethod
+    def _remove_files(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_later(self, paths: List[str]) -> None:
+        """供同步调用方使用：索引已经更新，文件在后台线程中删除"""
+        if not paths:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._remove(paths))
+        except RuntimeError:
+            # 没有运行中的事件循环，不会阻塞其他协程，直接删除
+            self._remove_files(paths)
+            return
+        self._removals.add(task)
+        task.add_done_callback(self._removals.discard)
+
+    def resize(self, max_bytes: int, enabled: bool) -> None:
+        """调整缓存上限，缩小时立即按LRU淘汰，文件在后台删除"""
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        if self._loaded:
+            self._remove_later(self._evict())
+
+    def stats(self) -> dict:
+        lookups = self.counters["hit"] + self.counters["miss"]
+        return {
+            "files": len(self._entries),
+            "keys": len(self._keys),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hit": self.counters["hit"],
+            "miss": self.counters["miss"],
+            "dedup": self.counters["dedup"],
+            "evicted": self.counters["evicted"],
+            "hit_rate": self.counters["hit"] / lookups if lookups else 0.0,
+        }
+
+
+media_cache = MediaCache(
+    global_config.media_cache_dir,
+    global_config.media_cache_max_size,
+    global_config.media_cache_enable,
+)
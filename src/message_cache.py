@@ -0,0 +1,98 @@
+from collections import Counter
+from typing import Optional
+
+import discord
+
+from .cache import LRUTTLCache
+from .config import global_config
+from .logger import logger
+
+
+class MessageCache:
+    """
+    最近消息缓存，按消息ID（snowflake）索引
+
+    由on_message的消息流填充，用于解析回复引用，尽量避免每次回复都走一次REST请求。
+    查找顺序：reference.resolved -> reference.cached_message -> 本缓存 -> REST
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._cache: LRUTTLCache[discord.Message] = LRUTTLCache(max_size, ttl)
+        self.sources: Counter = Counter()  # 引用消息的命中来源
+
+    def remember(self, message: discord.Message) -> None:
+        """记录一条消息"""
+        self._cache.set(message.id, message)
+
+    def forget(self, message_id: int) -> None:
+        self._cache.pop(message_id)
+
+    async def get_referenced(self, message: discord.Message) -> Optional[discord.Message]:
+        """
+        获取消息引用的消息
+
+        Parameters:
+            message: discord.Message: 带有引用的消息
+        Returns:
+            Optional[discord.Message]: 被引用的消息，获取失败时为None
+        """
+        reference = message.reference
+        if reference is None or reference.message_id is None:
+            return None
+
+        resolved = reference.resolved
+        if isinstance(resolved, discord.Message):
+            self.sources["resolved"] += 1
+            self.remember(resolved)
+            return resolved
+        if isinstance(resolved, discord.DeletedReferencedMessage):
+            # 被引用的消息已被删除，REST也拿不到
+            self.sources["deleted"] += 1
+            return None
+
+        cached = reference.cached_message or self._cache.get(reference.message_id)
+        if cached is not None:
+            self.sources["cache"] += 1
+            return cached
+
+        channel = message.channel
+        if reference.channel_id and reference.channel_id != message.channel.id:
+            channel = message.guild.get_channel(reference.channel_id) if message.guild else None
+        if channel is None:
+            self.sources["failed"] += 1
+            return None
+        try:
+            fetched = await channel.fetch_message(reference.message_id)
+        except Exception as e:
+            self.sources["failed"] += 1
+            logger.error(f"获取引用消息失败: {e}")
+            return None
+        self.sources["rest"] += 1
+        self.remember(fetched)
+        return fetched
+
+    def get_reference(self, channel: discord.abc.Messageable, message_id: int) -> discord.MessageReference:
+        """
+        构造发送回复时使用的引用，不发起任何REST请求
+
+        Parameters:
+            channel: 消息所在频道
+            message_id: int: 被回复的消息ID
+        """
+        cached = self._cache.get(message_id)
+        if cached is not None:
+            self.sources["cache"] += 1
+            return cached.to_reference(fail_if_not_exists=False)
+        self.sources["partial"] += 1
+        return channel.get_partial_message(message_id).to_reference(fail_if_not_exists=False)
+
+    def resize(self, max_size: int, ttl: float) -> None:
+        self._cache.resize(max_size, ttl)
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        stats["sources"] = dict(self.sources)
+        return stats
+
+
+message_cache = MessageCache(global_config.message_cache_size, global_config.message_cache_ttl)
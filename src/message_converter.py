@@ -0,0 +1,230 @@
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import discord
+from maim_message import UserInfo, GroupInfo, Seg, BaseMessageInfo, MessageBase, FormatInfo
+
+from .config import global_config
+
+if TYPE_CHECKING:
+    from .inbound_event import InboundMessage
+
+CONTENT_FORMAT = ["text", "image", "emoji"]
+ACCEPT_FORMAT = ["text", "image", "emoji", "reply", "voice", "command"]
+
+
+def build_reply_segments(reply_user_id: int, reply_content: str, sender_nickname: Optional[str]) -> List[Seg]:
+    """构造回复前缀消息段，格式与RecvHandler.handle_reply_message一致"""
+    if sender_nickname:
+        prefix = f"[回复<{sender_nickname}:{reply_user_id}>："
+    else:
+        prefix = "[回复 未知用户："
+    return [
+        Seg(type="text", data=prefix),
+        Seg(type="text", data=reply_content or "(获取发言内容失败)"),
+        Seg(type="text", data="]，说："),
+    ]
+
+
+def build_segments(event: "InboundMessage") -> Optional[List[Seg]]:
+    """
+    由入站消息构造消息段
+
+    Returns:
+        Optional[List[Seg]]: 消息段列表，没有文本内容时为None
+    """
+    if not event.content:
+        return None
+    segments = [Seg(type="text", data=event.content)]
+    if event.image_url:
+        segments.append(Seg(type="image", data={"file": event.image_url, "url": event.image_url}))
+    if event.reply is not None:
+        segments.append(Seg(type="seglist", data=build_reply_segments(event.reply.user_id, event.reply.content, event.nickname)))
+    return segments
+
+
+def event_to_message_base(event: "InboundMessage") -> Optional[MessageBase]:
+    """
+    将入站消息直接转换为MaiBot的MessageBase
+
+    只读取MessageBase真正需要的字段，不再先构造完整的OneBot格式字典。
+
+    Parameters:
+        event: InboundMessage: 入站消息
+    Returns:
+        Optional[MessageBase]: 没有有效内容时为None
+    """
+    segments = build_segments(event)
+    if not segments:
+        return None
+    platform = event.platform
+    return MessageBase(
+        message_info=BaseMessageInfo(
+            platform=platform,
+            message_id=str(event.message_id),
+            time=time.time(),
+            user_info=UserInfo(
+                platform=platform,
+                user_id=str(event.user_id),
+                user_nickname=event.nickname,
+                user_cardname=event.username,
+            ),
+            group_info=GroupInfo(
+                platform=platform,
+                group_id=str(event.channel_id),
+                group_name=event.channel_name,
+            ) if event.is_group else None,
+            template_info=None,
+            format_info=FormatInfo(content_format=CONTENT_FORMAT, accept_format=ACCEPT_FORMAT),
+        ),
+        message_segment=Seg(type="seglist", data=segments),
+    )
+
+
+def message_to_message_base(
+    message: discord.Message,
+    is_group: bool,
+    referenced: Optional[discord.Message] = None,
+) -> Optional[MessageBase]:
+    """将Discord消息直接转换为MaiBot的MessageBase"""
+    from .inbound_event import InboundMessage
+
+    return event_to_message_base(InboundMessage.from_message(message, is_group, referenced))
+
+
+def reference_to_dict(referenced: Optional[discord.Message]) -> Optional[Dict[str, Any]]:
+    if referenced is None:
+        return None
+    return {
+        "message_id": str(referenced.id),
+        "user_id": str(referenced.author.id),
+        "content": referenced.content,
+        "timestamp": referenced.created_at.isoformat(),
+    }
+
+
+def embed_to_dict(embed: discord.Embed) -> Dict[str, Any]:
+    return {
+        "title": embed.title,
+        "description": embed.description,
+        "url": embed.url,
+        "color": embed.color.value if embed.color else None,
+        "timestamp": embed.timestamp.isoformat() if embed.timestamp else None,
+        "footer": {"text": embed.footer.text, "icon_url": embed.footer.icon_url} if embed.footer else None,
+        "image": {"url": embed.image.url} if embed.image else None,
+        "thumbnail": {"url": embed.thumbnail.url} if embed.thumbnail else None,
+        "author": {
+            "name": embed.author.name,
+            "url": embed.author.url,
+            "icon_url": embed.author.icon_url,
+        } if embed.author else None,
+        "fields": [{"name": field.name, "value": field.value, "inline": field.inline} for field in embed.fields],
+    }
+
+
+def components_to_list(message: discord.Message) -> List[Dict[str, Any]]:
+    components = []
+    for component in message.components or ():
+        for child in getattr(component, "children", ()):
+            if isinstance(child, discord.Button):
+                components.append({
+                    "type": "button",
+                    "label": child.label,
+                    "style": str(child.style),
+                    "custom_id": child.custom_id,
+                    "url": child.url,
+                    "disabled": child.disabled,
+                })
+            elif isinstance(child, discord.SelectMenu):
+                components.append({
+                    "type": "select",
+                    "custom_id": child.custom_id,
+                    "placeholder": child.placeholder,
+                    "min_values": child.min_values,
+                    "max_values": child.max_values,
+                    "options": [
+                        {
+                            "label": option.label,
+                            "value": option.value,
+                            "description": option.description,
+                            "default": option.default,
+                        } for option in child.options
+                    ],
+                })
+    return components
+
+
+def message_to_dict(
+    message: discord.Message,
+    is_group: bool,
+    referenced: Optional[discord.Message] = None,
+    mention_self: bool = False,
+    include_extras: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    构造OneBot格式的消息字典，只在记录日志、录制流量等需要完整内容时调用
+
+    嵌入、组件、身份组和频道详情开销较大，只有include_extras为True时才包含，
+    默认跟随配置中的payload_extras。
+    """
+    if include_extras is None:
+        include_extras = global_config.payload_extras
+    author = message.author
+    channel = message.channel
+    data = {
+        "post_type": "message",
+        "message_type": "group" if is_group else "private",
+        "filter_passed": True,
+        "message_id": str(message.id),
+        "user_id": str(author.id),
+        "group_id": str(channel.id) if is_group else None,
+        "message": message.content,
+        "raw_message": message.content,
+        "timestamp": message.created_at.isoformat(),
+        "edited_timestamp": message.edited_at.isoformat() if message.edited_at else None,
+        "tts": message.tts,
+        "mention_everyone": message.mention_everyone,
+        "mention_self": mention_self,
+        "mentions": [str(user.id) for user in message.mentions],
+        "mention_roles": [str(role.id) for role in message.role_mentions],
+        "mention_channels": [str(mentioned.id) for mentioned in message.channel_mentions],
+        "attachments": [
+            {
+                "id": str(attachment.id),
+                "filename": attachment.filename,
+                "url": attachment.url,
+                "content_type": attachment.content_type,
+                "size": attachment.size,
+            } for attachment in message.attachments
+        ],
+        "reference": reference_to_dict(referenced),
+        "pinned": message.pinned,
+        "flags": message.flags.value if message.flags else 0,
+        "sender": {
+            "user_id": str(author.id),
+            "nickname": author.display_name,
+            "card": author.name,
+            "bot": author.bot,
+        },
+        "channel": {"id": str(channel.id), "type": str(channel.type)},
+    }
+    if include_extras:
+        data["embeds"] = [embed_to_dict(embed) for embed in message.embeds]
+        data["components"] = components_to_list(message)
+        data["sender"].update({
+            "system": author.system,
+            "avatar_url": str(author.avatar.url) if author.avatar else None,
+            "discriminator": author.discriminator,
+            "color": author.color.value if author.color else None,
+            "roles": [str(role.id) for role in getattr(author, "roles", ())],
+        })
+        if is_group:
+            data["channel"].update({
+                "name": getattr(channel, "name", None),
+                "category_id": str(channel.category_id) if getattr(channel, "category_id", None) else None,
+                "position": getattr(channel, "position", None),
+                "nsfw": getattr(channel, "nsfw", None),
+                "topic": getattr(channel, "topic", None),
+                "slowmode_delay": getattr(channel, "slowmode_delay", None),
+            })
+    return data
@@ -1,45 +1,249 @@
 import asyncio
-import time
-from typing import Dict
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
 from .config import global_config
 from .logger import logger
+from .inbound_event import InboundMessage
 
-response_dict: Dict = {}
-response_time_dict: Dict = {}
-message_queue = asyncio.Queue()
-
-
-async def get_response(request_id: str) -> dict:
-    retry_count = 0
-    max_retries = 50  # 10秒超时
-    while request_id not in response_dict:
-        retry_count += 1
-        if retry_count >= max_retries:
-            raise TimeoutError(f"请求超时，未收到响应，request_id: {request_id}")
-        await asyncio.sleep(0.2)
-    response = response_dict.pop(request_id)
-    _ = response_time_dict.pop(request_id)
-    logger.trace(f"响应信息id: {request_id} 已从响应字典中取出")
+RESPONSE_TIMEOUT = 10.0  # 默认响应超时时间（秒）
+
+pending_responses: Dict[str, asyncio.Future] = {}
+response_stats: Counter = Counter()  # 本周期的超时/孤儿响应数，每个心跳周期输出日志后清零
+response_totals: Counter = Counter()  # 累计值，不清零，供指标端点导出
+
+
+def get_channel_key(message: Union[InboundMessage, dict]) -> str:
+    """
+    获取消息的分片键，同一分片键上的消息需要保证顺序
+
+    群聊按频道分片，私聊按用户分片
+    """
+    if isinstance(message, InboundMessage):
+        return message.channel_key
+    group_id = message.get("group_id")
+    if group_id:
+        return f"group:{group_id}"
+    user_id = message.get("user_id")
+    if user_id:
+        return f"private:{user_id}"
+    return str(message.get("post_type"))
+
+
+def is_priority_message(message: Union[InboundMessage, dict]) -> bool:
+    """私聊和@机器人的消息为高优先级消息，过载时优先保留"""
+    if isinstance(message, InboundMessage):
+        return message.is_priority
+    return message.get("message_type") == "private" or bool(message.get("mention_self"))
+
+
+class OverflowPolicy:
+    drop_oldest = "drop_oldest"  # 丢弃队列中最旧的消息
+    drop_newest = "drop_newest"  # 丢弃新到达的消息
+    channel_drop_oldest = "channel_drop_oldest"  # 丢弃积压最多的频道中最旧的消息
+    keep_priority = "keep_priority"  # 保留私聊和@消息，优先丢弃普通群聊消息
+
+    all = (drop_oldest, drop_newest, channel_drop_oldest, keep_priority)
+
+
+class InboundQueue(asyncio.Queue):
+    """
+    入站消息队列
+
+    maxsize为0时与asyncio.Queue行为一致（无界）；
+    有界时put永不阻塞，队列满时按overflow_policy丢弃消息并计数。
+    """
+
+    def __init__(self, maxsize: int = 0, policy: str = OverflowPolicy.drop_oldest):
+        if policy not in OverflowPolicy.all:
+            logger.warning(f"未知的队列溢出策略: {policy}，使用 {OverflowPolicy.drop_oldest}")
+            policy = OverflowPolicy.drop_oldest
+        super().__init__(maxsize)
+        self.policy = policy
+        self.enqueued_count = 0
+        self.dropped: Counter = Counter()
+        self.on_drop: Optional[Callable[[Any], None]] = None  # 消息被溢出策略丢弃时调用
+
+    def _init(self, maxsize):
+        self._queue = deque()
+        self._channel_counts: Counter = Counter()
+        self._ambient_count = 0  # 队列中非高优先级消息的数量
+
+    def _track(self, item, delta: int) -> None:
+        if not isinstance(item, (InboundMessage, dict)):
+            return
+        key = get_channel_key(item)
+        self._channel_counts[key] += delta
+        if self._channel_counts[key] <= 0:
+            del self._channel_counts[key]
+        if not is_priority_message(item):
+            self._ambient_count += delta
+
+    def _put(self, item):
+        self._queue.append(item)
+        self._track(item, 1)
+
+    def _get(self):
+        item = self._queue.popleft()
+        self._track(item, -1)
+        return item
+
+    async def put(self, item) -> None:
+        self.put_nowait(item)
+
+    def put_nowait(self, item) -> None:
+        while self.full():
+            if not self._make_room(item):
+                self.dropped[OverflowPolicy.drop_newest] += 1
+                if self.on_drop is not None:
+                    self.on_drop(item)
+                return
+        super().put_nowait(item)
+        self.enqueued_count += 1
+
+    def _make_room(self, item) -> bool:
+        """
+        按溢出策略腾出一个位置
+
+        Returns:
+            bool: 是否腾出了位置，False表示应丢弃新到达的消息
+        """
+        if self.policy == OverflowPolicy.drop_newest:
+            return False
+        index = 0
+        if self.policy == OverflowPolicy.channel_drop_oldest:
+            busiest_key = max(self._channel_counts, key=self._channel_counts.get, default=None)
+            index = self._find_index(lambda queued: get_channel_key(queued) == busiest_key)
+        elif self.policy == OverflowPolicy.keep_priority:
+            if self._ambient_count > 0:
+                index = self._find_index(lambda queued: not is_priority_message(queued))
+            elif not is_priority_message(item):
+                return False
+        self._remove_at(index)
+        return True
+
+    def _find_index(self, predicate) -> int:
+        for index, queued in enumerate(self._queue):
+            if isinstance(queued, (InboundMessage, dict)) and predicate(queued):
+                return index
+        return 0
+
+    def _remove_at(self, index: int) -> None:
+        item = self._queue[index]
+        del self._queue[index]
+        self._track(item, -1)
+        self.dropped[self.policy] += 1
+        self.task_done()
+        if self.on_drop is not None:
+            self.on_drop(item)
+
+    def resize(self, maxsize: int, policy: str) -> None:
+        """调整队列容量和溢出策略，缩小时立即丢弃多出的最旧消息"""
+        if policy not in OverflowPolicy.all:
+            raise ValueError(f"未知的队列溢出策略: {policy}")
+        self._maxsize = maxsize
+        self.policy = policy
+        while 0 < self._maxsize < self.qsize():
+            self._remove_at(0)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.qsize(),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "enqueued": self.enqueued_count,
+            "dropped": sum(self.dropped.values()),
+            "dropped_by_policy": dict(self.dropped),
+        }
+
+
+message_queue = InboundQueue(global_config.queue_size, global_config.overflow_policy)
+
+
+def expect_response(request_id: str) -> asyncio.Future:
+    """登记一个等待中的请求，返回其响应对应的Future"""
+    future = pending_responses.get(request_id)
+    if future is None:
+        future = asyncio.get_running_loop().create_future()
+        pending_responses[request_id] = future
+    return future
+
+
+async def report_queue_stats() -> None:
+    """定期报告入站队列的积压和丢弃情况"""
+    last_dropped = 0
+    while True:
+        await asyncio.sleep(global_config.discord_heartbeat_interval)
+        stats = message_queue.stats()
+        if stats["dropped"] > last_dropped:
+            logger.warning(
+                f"入站队列过载，本周期丢弃 {stats['dropped'] - last_dropped} 条消息，"
+                f"当前积压 {stats['size']}/{stats['maxsize']}，累计丢弃: {stats['dropped_by_policy']}"
+            )
+            last_dropped = stats["dropped"]
+        else:
+            logger.debug(f"入站队列积压: {stats['size']}，累计入队: {stats['enqueued']}")
+
+
+async def get_response(request_id: str, timeout: float = RESPONSE_TIMEOUT) -> dict:
+    """
+    等待指定请求的响应
+
+    Parameters:
+        request_id: str: 请求的echo id
+        timeout: float: 超时时间（秒）
+    Returns:
+        dict: 响应内容
+    """
+    future = expect_response(request_id)
+    try:
+        response = await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        response_stats["timeout"] += 1
+        response_totals["timeout"] += 1
+        raise TimeoutError(f"请求超时，未收到响应，request_id: {request_id}") from None
+    finally:
+        pending_responses.pop(request_id, None)
+    logger.trace(f"响应信息id: {request_id} 已取出")
     return response
 
 
+async def request_response(send: Awaitable, request_id: str, timeout: float = RESPONSE_TIMEOUT) -> dict:
+    """
+    先登记响应再发送请求，避免响应早于等待者到达而被当作孤儿响应丢弃
+
+    Parameters:
+        send: Awaitable: 发送请求的协程
+        request_id: str: 请求的echo id
+        timeout: float: 超时时间（秒）
+    Returns:
+        dict: 响应内容
+    """
+    expect_response(request_id)
+    try:
+        await send
+        return await get_response(request_id, timeout)
+    finally:
+        pending_responses.pop(request_id, None)
+
+
 async def put_response(response: dict):
     echo_id = response.get("echo")
-    now_time = time.time()
-    response_dict[echo_id] = response
-    response_time_dict[echo_id] = now_time
-    logger.trace(f"响应信息id: {echo_id} 已存入响应字典")
+    future = pending_responses.get(echo_id)
+    if future is None or future.done():
+        # 迟到或无人等待的响应直接丢弃
+        response_stats["orphan"] += 1
+        response_totals["orphan"] += 1
+        logger.trace(f"响应信息id: {echo_id} 无等待者，已丢弃")
+        return
+    future.set_result(response)
+    logger.trace(f"响应信息id: {echo_id} 已送达")
 
 
 async def check_timeout_response() -> None:
     while True:
-        cleaned_message_count: int = 0
-        now_time = time.time()
-        for echo_id, response_time in list(response_time_dict.items()):
-            if now_time - response_time > global_config.discord_heartbeat_interval:
-                cleaned_message_count += 1
-                response_dict.pop(echo_id)
-                response_time_dict.pop(echo_id)
-                logger.warning(f"响应消息 {echo_id} 超时，已删除")
-        logger.info(f"已删除 {cleaned_message_count} 条超时响应消息")
         await asyncio.sleep(global_config.discord_heartbeat_interval)
+        timeout_count = response_stats.pop("timeout", 0)
+        orphan_count = response_stats.pop("orphan", 0)
+        logger.info(
+            f"当前等待响应 {len(pending_responses)} 条，本周期超时 {timeout_count} 条，丢弃孤儿响应 {orphan_count} 条"
+        )
@@ -0,0 +1,190 @@
+import bisect
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# 默认的延迟分桶（秒），覆盖从消息转换的亚毫秒级到Discord限速等待的秒级
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LabelValues = Tuple[str, ...]
+# 采集函数返回的指标: (名称, 类型, 说明, [(标签, 值)])
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """只增不减的计数器，可带标签"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in self._values.items():
+            labels = format_labels(dict(zip(self.labelnames, labelvalues)))
+            lines.append(f"{self.name}{labels} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    累积分桶直方图，可带标签
+
+    只记录各桶计数、总和与次数，observe为O(log 桶数)，不保存原始样本。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数..., 总和, 次数]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        state = self._values.get(labelvalues)
+        if state is None:
+            state = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[index] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def count(self, *labelvalues: str) -> int:
+        state = self._values.get(labelvalues)
+        return int(state[-1]) if state else 0
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, state in self._values.items():
+            base = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                labels = format_labels({**base, "le": format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {format_value(cumulative)}")
+            lines.append(f"{self.name}_bucket{format_labels({**base, 'le': '+Inf'})} {format_value(state[-1])}")
+            lines.append(f"{self.name}_sum{format_labels(base)} {format_value(state[-2])}")
+            lines.append(f"{self.name}_count{format_labels(base)} {format_value(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+
+    计数器和直方图在事件发生时更新；队列深度、缓存命中率等已有统计的数据
+    通过采集函数在抓取时现算，热路径上不额外维护。
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        self._collectors.append(collector)
+
+    def expose(self) -> str:
+        """生成Prometheus文本格式的全部指标"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        for collector in self._collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class Stage:
+    """各处理阶段的名称，作为stage_latency的stage标签"""
+
+    gateway = "gateway_receive"  # Discord消息创建到on_message收到
+    queue_wait = "queue_wait"  # 入队到worker开始处理（含工作池积压）
+    conversion = "conversion"  # discord消息 -> MessageBase
+    router_send = "router_send"  # router.send_message
+    discord_send = "discord_send"  # 实际调用Discord API发送
+
+
+registry = MetricsRegistry()
+
+inbound_messages = registry.counter(
+    "adapter_inbound_messages_total",
+    "Discord消息数，按处理结果分类",
+    ("result",),
+)
+maibot_messages = registry.counter(
+    "adapter_maibot_messages_total",
+    "与MaiBot之间的消息数，按方向和结果分类",
+    ("direction", "result"),
+)
+gateway_events = registry.counter(
+    "adapter_gateway_events_total",
+    "各网关分片收到的消息事件数（自己发出的消息除外）",
+    ("shard",),
+)
+discord_rate_limits = registry.counter(
+    "adapter_discord_rate_limited_total",
+    "调用Discord API时遇到限速（429）的次数，包括discord.py自动等待后重试的请求",
+)
+discord_rate_limits.inc(amount=0)  # 没有标签，先导出0，未遇到限速时也有这条时间序列
+stage_latency = registry.histogram(
+    "adapter_stage_latency_seconds",
+    "消息在各处理阶段的耗时",
+    ("stage",),
+)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    stage_latency.observe(max(0.0, seconds), stage)
+
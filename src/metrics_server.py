@@ -0,0 +1,119 @@
+from typing import Iterable, Optional
+
+from aiohttp import web
+
+from .config import global_config
+from .logger import logger
+from .metrics import MetricFamily, registry
+from .message_queue import message_queue, pending_responses, response_totals
+from .message_cache import message_cache
+from .instances import bot_instances
+from .media_cache import media_cache
+from .send_scheduler import send_scheduler
+from .inbound_journal import inbound_journal
+from .mmc_com_layer import maibot_outboxes
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def collect_component_stats() -> Iterable[MetricFamily]:
+    """抓取时从各组件已有的统计中读取当前值"""
+    queue = message_queue.stats()
+    yield "adapter_inbound_queue_depth", "gauge", "入站队列中等待处理的消息数", [({}, queue["size"])]
+    yield "adapter_inbound_queue_dropped_total", "counter", "入站队列溢出丢弃的消息数", [
+        ({"policy": policy}, count) for policy, count in queue["dropped_by_policy"].items()
+    ]
+    yield "adapter_pending_responses", "gauge", "等待响应的echo id数量", [({}, len(pending_responses))]
+    yield "adapter_responses_total", "counter", "异常的响应数，按类型分类", [
+        ({"result": result}, response_totals[result]) for result in ("timeout", "orphan")
+    ]
+
+    cache_samples = [({"cache": "message"}, message_cache.stats()), ({"cache": "media"}, media_cache.stats())]
+    # 用户和私聊频道缓存每个Bot实例各有一份，按平台分类
+    for instance in bot_instances:
+        resolver = instance.resolver.stats()
+        cache_samples.append(({"cache": "user", "platform": instance.platform}, resolver["users"]))
+        cache_samples.append(({"cache": "dm_channel", "platform": instance.platform}, resolver["dm_channels"]))
+    yield "adapter_cache_hits_total", "counter", "缓存命中次数", [
+        (labels, stats["hit"]) for labels, stats in cache_samples
+    ]
+    yield "adapter_cache_misses_total", "counter", "缓存未命中次数", [
+        (labels, stats["miss"]) for labels, stats in cache_samples
+    ]
+    yield "adapter_cache_hit_ratio", "gauge", "缓存命中率", [
+        (labels, stats["hit_rate"]) for labels, stats in cache_samples
+    ]
+
+    if inbound_journal.enabled:
+        journal = inbound_journal.stats()
+        yield "adapter_journal_unacked", "gauge", "入站日志中尚未被MaiBot确认的消息数", [({}, journal["unacked"])]
+        yield "adapter_journal_size_bytes", "gauge", "入站日志占用的磁盘空间", [({}, journal["size"])]
+        yield "adapter_journal_entries_total", "counter", "入站日志条目数，按结果分类", [
+            ({"result": result}, journal[result])
+            for result in ("appended", "acked", "replayed", "discarded", "abandoned", "lost")
+        ]
+
+    outboxes = [(platform, outbox.stats()) for platform, outbox in maibot_outboxes.items()]
+    yield "adapter_maibot_connected", "gauge", "与MaiBot的连接是否可用（1为可用），按平台分类", [
+        ({"platform": platform}, int(outbox["connected"])) for platform, outbox in outboxes
+    ]
+    yield "adapter_outbox_depth", "gauge", "发件箱中等待补发到MaiBot的消息数，按平台和位置分类", [
+        ({"platform": platform, "location": location}, outbox[location])
+        for platform, outbox in outboxes
+        for location in ("memory", "spilled", "draining")
+    ]
+    yield "adapter_outbox_messages_total", "counter", "经过发件箱的消息数，按平台和结果分类", [
+        ({"platform": platform, "result": result}, outbox[result])
+        for platform, outbox in outboxes
+        for result in ("sent", "buffered", "drained", "dropped")
+    ]
+
+    scheduler = send_scheduler.stats()
+    yield "adapter_outbound_queue_depth", "gauge", "出站调度器中等待发送的消息数", [
+        ({}, send_scheduler.queue_depth())
+    ]
+    yield "adapter_outbound_messages_total", "counter", "发送到Discord的消息数，按结果分类", [
+        ({"result": result}, scheduler[result])
+        for result in ("sent", "failed", "coalesced")
+    ]
+
+
+registry.register_collector(collect_component_stats)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=registry.expose().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+
+class MetricsServer:
+    """本地HTTP指标端点，GET /metrics 返回Prometheus文本格式"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"指标端点已启动: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer(global_config.metrics_host, global_config.metrics_port)
+
+
+async def start_metrics_server() -> None:
+    if not global_config.metrics_enable:
+        return
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        logger.error(f"指标端点启动失败: {e}")
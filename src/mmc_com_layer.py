@@ -1,17 +1,33 @@
+from typing import Dict
+
 from maim_message import Router, RouteConfig, TargetConfig
 from .config import global_config
 from .logger import logger
 from .send_handler import send_handler
+from .maibot_outbox import MaiBotOutbox, SPILL_FILE
+from .instances import bot_instances
 
+# 每个Bot实例在MaiBot中是一个平台，各用一条连接，连接到同一个MaiBot
 route_config = RouteConfig(
     route_config={
-        global_config.platform: TargetConfig(
+        instance.platform: TargetConfig(
             url=f"ws://{global_config.maibot_host}:{global_config.maibot_port}/ws",
             token=""
         )
+        for instance in bot_instances
     }
 )
 router = Router(route_config)
+maibot_outboxes: Dict[str, MaiBotOutbox] = {
+    instance.platform: MaiBotOutbox(
+        router,
+        instance.platform,
+        global_config.outbox_spill_dir,
+        SPILL_FILE if instance is bot_instances.primary else f"outbox-{instance.platform}.jsonl",
+    )
+    for instance in bot_instances
+}
+maibot_outbox = maibot_outboxes[global_config.platform]  # 主实例的发件箱
 
 
 async def mmc_start_com():
@@ -1,9 +1,8 @@
-from .logger import logger
+from .logger import logger, log_payload
 from .config import global_config
 from .qq_emoji_list import qq_face
 import time
 import asyncio
-import json
 import discord
 from typing import List, Tuple, Optional, Dict, Any
 import uuid
@@ -17,7 +16,6 @@ from maim_message import (
     MessageBase,
     TemplateInfo,
     FormatInfo,
-    Router,
 )
 
 from .utils import (
@@ -28,11 +26,18 @@ from .utils import (
     get_stranger_info,
     get_message_detail,
 )
-from .message_queue import get_response
+from .discord_resolver import discord_resolver
+from .chat_filter import get_chat_filter
+from .message_converter import event_to_message_base
+from .inbound_event import InboundMessage
+from .maibot_outbox import MaiBotOutbox
+from .metrics import Stage, observe_stage
+from .tracing import Trace, TraceStage
 
 
 class RecvHandler:
-    maibot_router: Router = None
+    maibot_outbox: MaiBotOutbox = None  # 主实例的发件箱
+    maibot_outboxes: Dict[str, MaiBotOutbox] = {}  # 平台名 -> 发件箱，未登记的平台使用主实例的发件箱
     discord_bot: discord.Client = None
 
     def __init__(self):
@@ -75,30 +80,40 @@ class RecvHandler:
         Returns:
             bool: 是否允许聊天
         """
-        logger.debug(f"频道id: {channel_id}, 用户id: {user_id}")
-        if channel_id:
-            if global_config.channel_list_type == "whitelist" and channel_id not in global_config.channel_list:
-                logger.warning("频道不在聊天白名单中，消息被丢弃")
-                return False
-            elif global_config.channel_list_type == "blacklist" and channel_id in global_config.channel_list:
-                logger.warning("频道在聊天黑名单中，消息被丢弃")
-                return False
-        else:
-            if global_config.private_list_type == "whitelist" and user_id not in global_config.private_list:
-                logger.warning("私聊不在聊天白名单中，消息被丢弃")
-                return False
-            elif global_config.private_list_type == "blacklist" and user_id in global_config.private_list:
-                logger.warning("私聊在聊天黑名单中，消息被丢弃")
-                return False
-        if user_id in global_config.ban_user_id:
-            logger.warning("用户在全局黑名单中，消息被丢弃")
+        logger.debug("频道id: {}, 用户id: {}", channel_id, user_id)
+        reason = get_chat_filter().check(int(user_id), int(channel_id) if channel_id else None)
+        if reason is not None:
+            logger.warning(f"{reason}，消息被丢弃")
             return False
         return True
 
+    async def handle_inbound_message(self, event: InboundMessage) -> Optional[bool]:
+        """
+        处理入站队列中的Discord消息，直接转换为MessageBase
+
+        Parameters:
+            event: InboundMessage: 已通过黑白名单的消息
+        Returns:
+            Optional[bool]: 是否已处理完毕（送达MaiBot或无需发送），False表示应稍后重试，
+            None表示已暂存到发件箱，结果稍后以event.journal_seq通过发件箱的on_settled回调通知
+        """
+        logger.info("开始处理Discord消息: {}", event.message_id)
+        log_payload("收到Discord原始消息", event.as_dict)
+        start = time.perf_counter()
+        message_base = event_to_message_base(event)
+        observe_stage(Stage.conversion, time.perf_counter() - start)
+        if message_base is None:
+            logger.warning("消息 {} 没有有效内容", event.message_id)
+            return True
+        if event.trace is not None:
+            event.trace.mark(TraceStage.converted)
+        logger.info("消息 {} 处理完成，准备发送到MaiBot", event.message_id)
+        return await self.message_process(message_base, event.trace, event.journal_seq)
+
     async def handle_raw_message(self, raw_message: dict) -> None:
         """处理原始消息"""
-        logger.info(f"开始处理Discord消息: {raw_message.get('message_id')}")
-        logger.debug(f"收到Discord原始消息: {json.dumps(raw_message, ensure_ascii=False)}")
+        logger.info("开始处理Discord消息: {}", raw_message.get("message_id"))
+        log_payload("收到Discord原始消息", lambda: raw_message)
         
         # 检查消息类型
         message_type = raw_message.get("message_type")
@@ -106,8 +121,10 @@ class RecvHandler:
             logger.warning(f"未知的消息类型: {message_type}")
             return
         
-        # 检查是否允许聊天
-        if not self.check_allow_to_chat(raw_message.get("user_id"), raw_message.get("group_id")):
+        # 检查是否允许聊天（入口处已判断过的消息不再重复判断）
+        if not raw_message.get("filter_passed") and not self.check_allow_to_chat(
+            raw_message.get("user_id"), raw_message.get("group_id")
+        ):
             logger.info(f"消息 {raw_message.get('message_id')} 被黑白名单过滤")
             return
         
@@ -121,8 +138,7 @@ class RecvHandler:
         if message_type == "group":
             channel = self.discord_bot.get_channel(int(raw_message.get("group_id")))
         elif message_type == "private":
-            user = await self.discord_bot.fetch_user(int(raw_message.get("user_id")))
-            channel = user.dm_channel or await user.create_dm()
+            channel = await discord_resolver.get_dm_channel(int(raw_message.get("user_id")))
             
         if channel is None:
             logger.warning(f"无法获取频道信息: {raw_message.get('group_id' if message_type == 'group' else 'user_id')}")
@@ -163,8 +179,7 @@ class RecvHandler:
             ),
         )
 
-        logger.info(f"消息 {raw_message.get('message_id')} 处理完成，准备发送到MaiBot")
-        logger.debug(f"发送给Maibot的消息: {json.dumps(message_base.to_dict(), ensure_ascii=False)}")
+        logger.info("消息 {} 处理完成，准备发送到MaiBot", raw_message.get("message_id"))
 
         # 发送消息
         await self.message_process(message_base)
@@ -396,29 +411,42 @@ class RecvHandler:
             },
         )
 
-    async def message_process(self, message_base: MessageBase) -> None:
+    async def message_process(
+        self, message_base: MessageBase, trace: Optional[Trace] = None, token: Any = None
+    ) -> Optional[bool]:
         """
-        处理消息
+        处理消息，经消息所属平台的发件箱发送到MaiBot
 
         Parameters:
             message_base: MessageBase: 消息基类
+            trace: Optional[Trace]: 消息的处理轨迹（被采样时）
+            token: Any: 暂存后送达或丢弃时传给发件箱on_settled回调的标识
+        Returns:
+            Optional[bool]: MaiBot是否确认收到，None表示连接不可用、已暂存到发件箱
         """
-        if not self.maibot_router:
-            logger.error("MaiBot路由器未初始化")
-            return None
+        outbox = self.maibot_outboxes.get(message_base.message_info.platform, self.maibot_outbox)
+        if not outbox:
+            logger.error("MaiBot发件箱未初始化")
+            return False
 
+        logger.info("准备发送消息到MaiBot: {}", message_base.message_info.message_id)
+        log_payload("发送给MaiBot的消息", message_base.to_dict)
+        start = time.perf_counter()
+        if trace is not None:
+            trace.mark(TraceStage.router_send_start)
         try:
-            logger.info(f"准备发送消息到MaiBot: {message_base.message_info.message_id}")
-            logger.debug(f"从Maibot收到的原始数据: {json.dumps(message_base.to_dict(), ensure_ascii=False)}")
-            response = await self.maibot_router.send_message(message_base)
-            if response:
-                logger.info(f"成功收到MaiBot响应: {message_base.message_info.message_id}")
-                logger.debug(f"Maibot响应: {json.dumps(response.to_dict() if hasattr(response, 'to_dict') else response, ensure_ascii=False)}")
-            else:
-                logger.warning(f"未收到MaiBot响应: {message_base.message_info.message_id}")
-        except Exception as e:
-            logger.error(f"发送消息到MaiBot时出错: {e}")
-            return None
+            delivered = await outbox.send(message_base, token)
+        finally:
+            observe_stage(Stage.router_send, time.perf_counter() - start)
+            if trace is not None:
+                trace.mark(TraceStage.router_send_done)
+        if delivered:
+            logger.info("成功收到MaiBot响应: {}", message_base.message_info.message_id)
+        elif delivered is None:
+            logger.info("MaiBot暂不可用，消息 {} 已暂存到发件箱", message_base.message_info.message_id)
+        else:
+            logger.warning(f"消息未能发送到MaiBot: {message_base.message_info.message_id}")
+        return delivered
 
 
 recv_handler = RecvHandler()
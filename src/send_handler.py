@@ -1,3 +1,7 @@
+import asyncio
+import functools
+import io
+import itertools
 import json
 import websockets as Server
 import uuid
@@ -8,14 +12,28 @@ from maim_message import (
     BaseMessageInfo,
     MessageBase,
 )
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import discord
 
 from . import CommandType
 from .config import global_config
-from .message_queue import get_response
-from .logger import logger
-from .utils import get_image_format, convert_image_to_gif
+from .message_queue import request_response, RESPONSE_TIMEOUT
+from .logger import logger, log_payload
+from .message_cache import message_cache
+from .discord_resolver import discord_resolver
+from .instances import BotInstance, bot_instances, scoped_key
+from .utils import convert_emoji_to_gif, get_image_media, split_message
+from .media import MediaPayload
+from .image_ops import shrink_image
+from .image_pool import image_pool
+from .send_scheduler import send_scheduler, MESSAGE_LENGTH_LIMIT
+from .metrics import maibot_messages
+from .tracing import tracer, TraceStage
+from .traffic_recorder import traffic_recorder
+
+MAX_FILES_PER_MESSAGE = 10  # Discord单条消息最多10个附件
+MAX_EMBEDS_PER_MESSAGE = 10  # Discord单条消息最多10个嵌入
+DEFAULT_FILESIZE_LIMIT = 10 * 1024 * 1024  # 私聊等无服务器频道的上传大小上限
 
 
 class SendHandler:
@@ -27,7 +45,9 @@ class SendHandler:
         raw_message_base: MessageBase = MessageBase.from_dict(raw_message_base_dict)
         message_segment: Seg = raw_message_base.message_segment
         logger.info("接收到来自MaiBot的消息，处理中")
-        logger.debug(f"来自MaiBot的原始消息: {json.dumps(raw_message_base_dict, ensure_ascii=False)}")
+        maibot_messages.inc("inbound", "received")
+        traffic_recorder.record_outbound(raw_message_base_dict)
+        log_payload("来自MaiBot的原始消息", lambda: raw_message_base_dict)
         if message_segment.type == "command":
             return await self.send_command(raw_message_base)
         else:
@@ -62,26 +82,13 @@ class SendHandler:
                     content += seg.data
                 elif seg.type == "image":
                     # 处理图片，添加到attachments
-                    attachments.append({
-                        "id": str(uuid.uuid4()),
-                        "filename": f"image_{uuid.uuid4()}.png",
-                        "content_type": "image/png",
-                        "size": len(seg.data),
-                        "url": seg.data,
-                        "proxy_url": seg.data,
-                        "height": None,
-                        "width": None
-                    })
+                    attachments.append(self.build_attachment(seg.data, "image"))
                 elif seg.type == "emoji":
-                    # 处理表情，添加到embeds
-                    embeds.append({
-                        "type": "image",
-                        "url": seg.data,
-                        "image": {
-                            "url": seg.data,
-                            "proxy_url": seg.data
-                        }
-                    })
+                    # 处理表情，URL直接嵌入，其余作为附件上传
+                    if self.is_url(seg.data):
+                        embeds.append(self.build_image_embed(seg.data))
+                    else:
+                        attachments.append(self.build_attachment(seg.data, "emoji"))
         else:
             if message.message_segment.type == "reply":
                 message_reference = {
@@ -92,25 +99,12 @@ class SendHandler:
             elif message.message_segment.type == "text":
                 content = message.message_segment.data
             elif message.message_segment.type == "image":
-                attachments.append({
-                    "id": str(uuid.uuid4()),
-                    "filename": f"image_{uuid.uuid4()}.png",
-                    "content_type": "image/png",
-                    "size": len(message.message_segment.data),
-                    "url": message.message_segment.data,
-                    "proxy_url": message.message_segment.data,
-                    "height": None,
-                    "width": None
-                })
+                attachments.append(self.build_attachment(message.message_segment.data, "image"))
             elif message.message_segment.type == "emoji":
-                embeds.append({
-                    "type": "image",
-                    "url": message.message_segment.data,
-                    "image": {
-                        "url": message.message_segment.data,
-                        "proxy_url": message.message_segment.data
-                    }
-                })
+                if self.is_url(message.message_segment.data):
+                    embeds.append(self.build_image_embed(message.message_segment.data))
+                else:
+                    attachments.append(self.build_attachment(message.message_segment.data, "emoji"))
 
         # 构建Discord消息体
         payload = {
@@ -122,21 +116,61 @@ class SendHandler:
             "flags": 0
         }
 
-        logger.debug(f"发送给Discord的原始消息: {json.dumps(payload, ensure_ascii=False)}")
+        logger.debug("发送给Discord的消息: 文本长度 {}，附件 {} 个，嵌入 {} 个", len(content), len(attachments), len(embeds))
+
+        # 由消息所属平台对应的Bot实例发送，未知平台和主实例一样使用self.discord_bot
+        platform = message.message_info.platform
+        instance = bot_instances.extra.get(platform)
 
-        # 发送消息
+        # 交给出站调度器按限速发送
         if message.message_info.group_info:
             # 群消息
-            await self.send_group_message(
-                message.message_info.group_info.group_id,
-                payload
-            )
+            group_id = message.message_info.group_info.group_id
+            key = scoped_key(platform, f"group:{group_id}")
+            sender = functools.partial(self.send_group_message, group_id, instance=instance)
         else:
             # 私聊消息
-            await self.send_private_message(
-                message.message_info.user_info.user_id,
-                payload
-            )
+            user_id = message.message_info.user_info.user_id
+            key = scoped_key(platform, f"private:{user_id}")
+            sender = functools.partial(self.send_private_message, user_id, instance=instance)
+
+        # 关联到被回复消息的处理轨迹
+        trace = tracer.find_for_reply(message_reference["message_id"] if message_reference else None, key)
+        if trace is not None:
+            trace.replied = True
+            trace.mark(TraceStage.reply_received)
+        send_scheduler.submit(key, payload, sender, trace)
+
+    @staticmethod
+    def is_url(data: Any) -> bool:
+        return isinstance(data, str) and data.startswith(("http://", "https://"))
+
+    def build_attachment(self, data: Any, kind: str) -> dict:
+        """
+        构造附件描述，实际的下载/解码在发送时进行
+
+        Parameters:
+            data: 图片的URL、Base64字符串，或包含url/file字段的字典
+            kind: str: 附件类型（image/emoji）
+        """
+        if isinstance(data, dict):
+            data = data.get("url") or data.get("file") or ""
+        return {
+            "id": str(uuid.uuid4()),
+            "filename": f"{kind}_{uuid.uuid4().hex[:8]}",
+            "kind": kind,
+            "url": data,
+        }
+
+    def build_image_embed(self, url: str) -> dict:
+        return {
+            "type": "image",
+            "url": url,
+            "image": {
+                "url": url,
+                "proxy_url": url
+            }
+        }
 
     async def send_command(self, raw_message_base: MessageBase) -> None:
         """
@@ -237,21 +271,18 @@ class SendHandler:
         return {
             "type": "image",
             "data": {
-                "file": f"base64://{encoded_image}",
+                "file": MediaPayload.from_base64(encoded_image).to_wire(),
                 "subtype": 0,
             },
         }  # base64 编码的图片
 
-    def handle_emoji_message(self, encoded_emoji: str) -> dict:
+    async def handle_emoji_message(self, encoded_emoji: str) -> dict:
         """处理表情消息"""
-        encoded_image = encoded_emoji
-        image_format = get_image_format(encoded_emoji)
-        if image_format != "gif":
-            encoded_image = convert_image_to_gif(encoded_emoji)
+        emoji = await convert_emoji_to_gif(MediaPayload.from_base64(encoded_emoji))
         return {
             "type": "image",
             "data": {
-                "file": f"base64://{encoded_image}",
+                "file": emoji.to_wire(),
                 "subtype": 1,
                 "summary": "[动画表情]",
             },
@@ -345,12 +376,11 @@ class SendHandler:
             },
         )
     
-    async def send_message_to_napcat(self, action: str, params: dict) -> dict:
+    async def send_message_to_napcat(self, action: str, params: dict, timeout: float = RESPONSE_TIMEOUT) -> dict:
         request_uuid = str(uuid.uuid4())
         payload = json.dumps({"action": action, "params": params, "echo": request_uuid})
-        await self.server_connection.send(payload)
         try:
-            response = await get_response(request_uuid)
+            response = await request_response(self.server_connection.send(payload), request_uuid, timeout)
         except TimeoutError:
             logger.error("发送消息超时，未收到响应")
             return {"status": "error", "message": "timeout"}
@@ -359,16 +389,142 @@ class SendHandler:
             return {"status": "error", "message": str(e)}
         return response
 
-    async def send_group_message(self, channel_id: str, payload: dict) -> None:
+    async def load_attachment(self, attachment: dict) -> MediaPayload:
+        """下载或解码单个附件，表情转换为GIF（在图片处理进程池中进行）"""
+        source = attachment.get("url") or ""
+        if self.is_url(source):
+            media = await get_image_media(source)
+        else:
+            media = MediaPayload.from_base64(source)
+        if attachment.get("kind") == "emoji":
+            media = await convert_emoji_to_gif(media)
+        # 在这里完成解码和格式判断，Base64或图片无效时由调用方按单个附件处理失败
+        media.data, media.format
+        return media
+
+    async def fit_attachment(self, media: MediaPayload, max_bytes: int) -> Optional[MediaPayload]:
+        """附件超过大小上限时尝试缩小，仍然过大则返回None"""
+        if media.size <= max_bytes:
+            return media
+        logger.info(f"附件大小 {media.size} 超过上限 {max_bytes}，尝试缩小")
+        try:
+            shrunk, _ = await image_pool.run(shrink_image, bytes(media.data), max_bytes)
+        except Exception as e:
+            logger.error(f"缩小附件失败: {e}")
+            return None
+        if len(shrunk) > max_bytes:
+            logger.warning(f"附件缩小后仍有 {len(shrunk)} 字节，超过上限 {max_bytes}，已跳过")
+            return None
+        return MediaPayload.from_bytes(shrunk)
+
+    async def build_file_batches(self, attachments: List[dict], filesize_limit: int) -> List[List[discord.File]]:
+        """
+        并发下载/解码所有附件，并按Discord的单条消息限制（文件数与总大小）分批
+
+        Parameters:
+            attachments: List[dict]: 附件描述列表
+            filesize_limit: int: 单条消息允许上传的总大小
+        Returns:
+            List[List[discord.File]]: 每批对应一条消息的文件
+        """
+        results = await asyncio.gather(
+            *(self.load_attachment(attachment) for attachment in attachments), return_exceptions=True
+        )
+        batches: List[List[discord.File]] = []
+        batch: List[discord.File] = []
+        batch_size = 0
+        for attachment, media in zip(attachments, results):
+            if isinstance(media, BaseException):
+                logger.error(f"处理附件失败: {media}")
+                continue
+            try:
+                media = await self.fit_attachment(media, filesize_limit)
+                if media is None:
+                    continue
+                file = discord.File(io.BytesIO(media.data), filename=f"{attachment['filename']}.{media.format}")
+            except Exception as e:
+                # 单个附件出错只跳过这个附件，不影响文本和其他附件
+                logger.error(f"处理附件失败: {e}")
+                continue
+            if batch and (len(batch) >= MAX_FILES_PER_MESSAGE or batch_size + media.size > filesize_limit):
+                batches.append(batch)
+                batch, batch_size = [], 0
+            batch.append(file)
+            batch_size += media.size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def build_embeds(self, payload: dict) -> List[discord.Embed]:
+        embeds = []
+        for embed_data in payload.get("embeds") or []:
+            try:
+                embed = discord.Embed()
+                if embed_data.get("type") == "image":
+                    embed.set_image(url=embed_data["url"])
+                embeds.append(embed)
+            except Exception as e:
+                logger.error(f"处理嵌入内容失败: {e}")
+        return embeds
+
+    async def deliver(self, channel: discord.abc.Messageable, payload: dict, reference=None) -> None:
+        """
+        将消息体发送到频道，文本超长、附件过多或过大时拆成多条消息发送
+
+        Parameters:
+            channel: 目标频道
+            payload: dict: 消息内容
+            reference: 回复引用
+        """
+        guild = getattr(channel, "guild", None)
+        filesize_limit = guild.filesize_limit if guild else DEFAULT_FILESIZE_LIMIT
+        batches = []
+        if payload.get("attachments"):
+            batches = await self.build_file_batches(payload["attachments"], filesize_limit)
+        content = payload.get("content") or ""
+        chunks = split_message(content, MESSAGE_LENGTH_LIMIT) if content.strip() else []
+        embeds = self.build_embeds(payload)
+        if not chunks and not embeds and not batches:
+            # 例如附件全部下载或处理失败；空消息会被Discord以400拒绝，不再发送
+            logger.warning("消息没有可发送的内容（文本为空，附件均处理失败），已跳过")
+            return
+        # 超长文本拆成多条发送，回复引用放在第一条，嵌入和附件从最后一条开始，超出上限的依次追加
+        chunks = chunks or [None]
+        embed_groups = [embeds[i : i + MAX_EMBEDS_PER_MESSAGE] for i in range(0, len(embeds), MAX_EMBEDS_PER_MESSAGE)]
+        messages = [{"content": chunk} for chunk in chunks[:-1]]
+        messages.append(
+            {
+                "content": chunks[-1],
+                "embeds": embed_groups[0] if embed_groups else [],
+                "files": batches[0] if batches else None,
+            }
+        )
+        messages.extend(
+            {"embeds": group or [], "files": batch}
+            for group, batch in itertools.zip_longest(embed_groups[1:], batches[1:])
+        )
+        messages[0]["reference"] = reference
+        for index, message in enumerate(messages):
+            if index:
+                # 调度器只为第一次请求取了令牌，之后的每次请求都按频道限速再取
+                await send_scheduler.acquire()
+            await channel.send(**message)
+
+    async def send_group_message(self, channel_id: str, payload: dict, instance: Optional[BotInstance] = None) -> None:
         """
         发送群消息
 
         Parameters:
             channel_id: str: 频道ID
             payload: dict: 消息内容
+            instance: Optional[BotInstance]: 发送消息的附加Bot实例，None为主实例
         """
         try:
-            channel = self.discord_bot.get_channel(int(channel_id))
+            discord_bot = instance.bot if instance is not None else self.discord_bot
+            channel = discord_bot.get_channel(int(channel_id))
+            if channel is None and global_config.sharding_mode == "process":
+                # 网关进程模式下本进程没有频道缓存，直接通过REST发送
+                channel = discord_bot.get_partial_messageable(int(channel_id))
             if not channel:
                 logger.error(f"找不到频道: {channel_id}")
                 return
@@ -377,91 +533,37 @@ class SendHandler:
             reference = None
             if payload.get("message_reference"):
                 try:
-                    ref_msg = await channel.fetch_message(int(payload["message_reference"]["message_id"]))
-                    reference = ref_msg
+                    reference = message_cache.get_reference(channel, int(payload["message_reference"]["message_id"]))
                 except Exception as e:
                     logger.error(f"获取引用消息失败: {e}")
 
-            # 处理附件
-            files = []
-            if payload.get("attachments"):
-                for attachment in payload["attachments"]:
-                    try:
-                        # 这里需要实现从URL下载图片的逻辑
-                        # 暂时跳过
-                        pass
-                    except Exception as e:
-                        logger.error(f"处理附件失败: {e}")
-
-            # 处理嵌入内容
-            embeds = []
-            if payload.get("embeds"):
-                for embed_data in payload["embeds"]:
-                    try:
-                        embed = discord.Embed()
-                        if embed_data.get("type") == "image":
-                            embed.set_image(url=embed_data["url"])
-                        embeds.append(embed)
-                    except Exception as e:
-                        logger.error(f"处理嵌入内容失败: {e}")
-
-            # 发送消息
-            await channel.send(
-                content=payload.get("content", ""),
-                reference=reference,
-                embeds=embeds,
-                files=files
-            )
+            await self.deliver(channel, payload, reference)
             logger.info(f"成功发送消息到频道 {channel_id}")
         except Exception as e:
             logger.error(f"发送群消息失败: {e}")
+            raise
 
-    async def send_private_message(self, user_id: str, payload: dict) -> None:
+    async def send_private_message(self, user_id: str, payload: dict, instance: Optional[BotInstance] = None) -> None:
         """
         发送私聊消息
 
         Parameters:
             user_id: str: 用户ID
             payload: dict: 消息内容
+            instance: Optional[BotInstance]: 发送消息的附加Bot实例，None为主实例
         """
         try:
-            user = await self.discord_bot.fetch_user(int(user_id))
-            if not user:
+            resolver = instance.resolver if instance is not None else discord_resolver
+            channel = await resolver.get_dm_channel(int(user_id))
+            if not channel:
                 logger.error(f"找不到用户: {user_id}")
                 return
 
-            # 处理附件
-            files = []
-            if payload.get("attachments"):
-                for attachment in payload["attachments"]:
-                    try:
-                        # 这里需要实现从URL下载图片的逻辑
-                        # 暂时跳过
-                        pass
-                    except Exception as e:
-                        logger.error(f"处理附件失败: {e}")
-
-            # 处理嵌入内容
-            embeds = []
-            if payload.get("embeds"):
-                for embed_data in payload["embeds"]:
-                    try:
-                        embed = discord.Embed()
-                        if embed_data.get("type") == "image":
-                            embed.set_image(url=embed_data["url"])
-                        embeds.append(embed)
-                    except Exception as e:
-                        logger.error(f"处理嵌入内容失败: {e}")
-
-            # 发送消息
-            await user.send(
-                content=payload.get("content", ""),
-                embeds=embeds,
-                files=files
-            )
+            await self.deliver(channel, payload)
             logger.info(f"成功发送私聊消息给用户 {user_id}")
         except Exception as e:
             logger.error(f"发送私聊消息失败: {e}")
+            raise
 
 
 send_handler = SendHandler()
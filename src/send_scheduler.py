@@ -0,0 +1,356 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+from .cache import LRUTTLCache
+from .config import global_config
+from .metrics import Stage, discord_rate_limits, observe_stage
+from .tracing import Trace, TraceStage, tracer
+
+MESSAGE_LENGTH_LIMIT = 2000  # Discord单条消息的最大字符数
+# 按目标保存的发送统计只保留最近活跃的目标，总计另外累计，不随淘汰减少
+CHANNEL_STATS_SIZE = 1000
+CHANNEL_STATS_TTL = 3600  # 秒
+
+# 正在执行的发送任务的目标，sender中需要额外发送请求时据此向同一个令牌桶取令牌
+_current_key: ContextVar[Optional[str]] = ContextVar("send_scheduler_key", default=None)
+
+
+def is_text_only(payload: dict) -> bool:
+    return bool(payload.get("content")) and not payload.get("attachments") and not payload.get("embeds")
+
+
+def can_coalesce(queued: dict, incoming: dict) -> bool:
+    """两条消息都只有文本、后一条不是回复，且合并后不超过长度上限时可以合并"""
+    return (
+        is_text_only(queued)
+        and is_text_only(incoming)
+        and not incoming.get("message_reference")
+        and len(queued["content"]) + 1 + len(incoming["content"]) <= MESSAGE_LENGTH_LIMIT
+    )
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充的令牌数，capacity为桶容量（允许的突发量）"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """距离下一个令牌可用还需等待的秒数，0表示现在就可以发送"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundJob:
+    """一条待发送的消息"""
+
+    __slots__ = ("key", "payload", "sender", "enqueued_at", "ready_at", "merged", "trace")
+
+    def __init__(
+        self,
+        key: str,
+        payload: dict,
+        sender: Callable[[dict], Awaitable[None]],
+        hold: float = 0,
+        trace: Optional[Trace] = None,
+    ):
+        self.key = key
+        self.payload = payload
+        self.sender = sender
+        self.enqueued_at = time.monotonic()
+        self.ready_at = self.enqueued_at + hold  # 合并窗口结束前不发送
+        self.merged = 0
+        self.trace = trace
+
+
+class RateLimitLogCounter(logging.Filter):
+    """
+    统计discord.py遇到的429
+
+    discord.py的HTTPClient收到429后自己等待并重试，不会抛出异常，
+    只能从它在discord.http记录器上输出的警告中计数；过滤器不拦截任何日志。
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.msg, str) and record.msg.startswith("We are being rate limited."):
+            discord_rate_limits.inc()
+        return True
+
+
+logging.getLogger("discord.http").addFilter(RateLimitLogCounter())
+
+
+class ChannelSendStats:
+    __slots__ = ("sent", "failed", "coalesced", "wait_total", "wait_max", "wait_last")
+
+    def __init__(self):
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_last = 0.0
+
+    def record_wait(self, wait: float) -> None:
+        self.wait_total += wait
+        self.wait_last = wait
+        if wait > self.wait_max:
+            self.wait_max = wait
+
+
+class SendScheduler:
+    """
+    出站消息调度器
+
+    每个目标（频道/私聊）一个发送队列和一个令牌桶，另有一个全局令牌桶；
+    各目标之间轮询调度，同一目标同时只有一条消息在发送，保证目标内顺序。
+    一条消息出发前取一个令牌；sender拆成多次请求发送时，之后的每次请求前通过acquire()再取令牌。
+    MaiBot的消息处理协程只负责入队，不会被Discord的限速等待阻塞。
+    纯文本消息会在合并窗口内等待，同一目标的连续纯文本消息合并为一条发送。
+    """
+
+    def __init__(
+        self,
+        channel_rate: float,
+        channel_burst: int,
+        global_rate: float,
+        global_burst: int,
+        coalesce_window: float = 0,
+    ):
+        self.coalesce_window = coalesce_window
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self._global = TokenBucket(global_rate, global_burst)
+        self._queues: Dict[str, Deque[OutboundJob]] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._round_robin: Deque[str] = deque()
+        self._inflight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self.channel_stats: LRUTTLCache[ChannelSendStats] = LRUTTLCache(CHANNEL_STATS_SIZE, CHANNEL_STATS_TTL)
+        self.totals = ChannelSendStats()
+
+    def submit(
+        self,
+        key: str,
+        payload: dict,
+        sender: Callable[[dict], Awaitable[None]],
+        trace: Optional[Trace] = None,
+    ) -> None:
+        """
+        提交一条待发送的消息
+
+        Parameters:
+            key: str: 发送目标，例如 group:<频道ID> 或 private:<用户ID>
+            payload: dict: 消息内容
+            sender: 实际执行发送的协程函数，以payload为参数，失败时应记录日志后抛出异常
+            trace: Optional[Trace]: 对应入站消息的处理轨迹，发送完成时结束
+        """
+        if trace is not None:
+            trace.mark(TraceStage.send_queued)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._round_robin.append(key)
+        if self.coalesce_window > 0 and queue and can_coalesce(queue[-1].payload, payload):
+            # 合并到尚未发出的上一条消息中，不延长其合并窗口，保证延迟有上限
+            tail = queue[-1]
+            tail.payload["content"] = f"{tail.payload['content']}\n{payload['content']}"
+            tail.merged += 1
+            if tail.trace is None:
+                tail.trace = trace
+            elif trace is not None:
+                tracer.finish(trace, "coalesced")
+            return
+        hold = self.coalesce_window if is_text_only(payload) else 0
+        queue.append(OutboundJob(key, payload, sender, hold, trace))
+        self._wakeup.set()
+
+    def configure(
+        self,
+        channel_rate: float,
+        channel_burst: int,
+        global_rate: float,
+        global_burst: int,
+        coalesce_window: float,
+    ) -> None:
+        """运行中调整限速参数，已有的令牌桶同步更新"""
+        self.coalesce_window = coalesce_window
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        buckets = [(bucket, channel_rate, channel_burst) for bucket in self._buckets.values()]
+        buckets.append((self._global, global_rate, global_burst))
+        for bucket, rate, capacity in buckets:
+            bucket.rate = rate
+            bucket.capacity = capacity
+            bucket.tokens = min(bucket.tokens, capacity)
+        self._wakeup.set()
+
+    async def acquire(self) -> None:
+        """
+        在sender中为同一条消息的额外请求（拆分的文本、后续的附件批次）取令牌
+
+        在调度器之外调用时（没有正在执行的发送任务）直接返回。
+        """
+        key = _current_key.get()
+        if key is None:
+            return
+        while True:
+            now = time.monotonic()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.channel_rate, self.channel_burst)
+            delay = max(bucket.delay(now), self._global.delay(now))
+            if delay <= 0:
+                bucket.consume()
+                self._global.consume()
+                return
+            await asyncio.sleep(delay)
+
+    def queue_depth(self, key: Optional[str] = None) -> int:
+        if key is not None:
+            return len(self._queues.get(key, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def run(self) -> None:
+        """调度循环"""
+        while True:
+            key, delay = self._next_ready()
+            if key is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            global_delay = self._global.delay(time.monotonic())
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+            self._global.consume()
+            self._buckets[key].consume()
+            job = self._queues[key].popleft()
+            self._inflight.add(key)
+            task = asyncio.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _next_ready(self) -> Tuple[Optional[str], Optional[float]]:
+        """
+        按轮询顺序找出下一个可以发送的目标
+
+        Returns:
+            Tuple[Optional[str], Optional[float]]: 可发送的目标；没有时返回None和需要等待的最短时间
+        """
+        now = time.monotonic()
+        min_delay: Optional[float] = None
+        for _ in range(len(self._round_robin)):
+            key = self._round_robin[0]
+            self._round_robin.rotate(-1)
+            if key in self._inflight:
+                continue
+            if not self._queues[key]:
+                self._drop_idle(key, now)
+                continue
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.channel_rate, self.channel_burst)
+            delay = max(bucket.delay(now), self._queues[key][0].ready_at - now)
+            if delay <= 0:
+                return key, None
+            if min_delay is None or delay < min_delay:
+                min_delay = delay
+        return None, min_delay
+
+    def _drop_idle(self, key: str, now: float) -> None:
+        """清理已空闲的目标，令牌桶补满后才移除，避免绕过限速"""
+        bucket = self._buckets.get(key)
+        if bucket is not None and not bucket.is_full(now):
+            return
+        self._buckets.pop(key, None)
+        del self._queues[key]
+        self._round_robin.remove(key)
+
+    async def _execute(self, job: OutboundJob) -> None:
+        _current_key.set(job.key)
+        stats = self.channel_stats.get(job.key)
+        if stats is None:
+            stats = ChannelSendStats()
+        self.channel_stats.set(job.key, stats)
+        wait = time.monotonic() - job.enqueued_at
+        for target in (stats, self.totals):
+            target.record_wait(wait)
+            target.coalesced += job.merged
+        # 错误日志由sender自行记录，这里只做统计
+        start = time.monotonic()
+        outcome = "send_failed"
+        if job.trace is not None:
+            job.trace.mark(TraceStage.send_start)
+        try:
+            await job.sender(job.payload)
+            stats.sent += 1
+            self.totals.sent += 1
+            outcome = "replied"
+        except Exception:
+            stats.failed += 1
+            self.totals.failed += 1
+        finally:
+            observe_stage(Stage.discord_send, time.monotonic() - start)
+            if job.trace is not None:
+                job.trace.mark(TraceStage.send_done)
+                tracer.finish(job.trace, outcome)
+            self._inflight.discard(job.key)
+            self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        channels = {}
+        for key, stats in self.channel_stats.items():
+            done = stats.sent + stats.failed
+            channels[key] = {
+                "queue_depth": self.queue_depth(key),
+                "sent": stats.sent,
+                "failed": stats.failed,
+                "coalesced": stats.coalesced,
+                "wait_avg": stats.wait_total / done if done else 0.0,
+                "wait_max": stats.wait_max,
+                "wait_last": stats.wait_last,
+            }
+        return {
+            "queue_depth": self.queue_depth(),
+            "inflight": len(self._inflight),
+            "sent": self.totals.sent,
+            "failed": self.totals.failed,
+            "coalesced": self.totals.coalesced,
+            "channels": channels,
+        }
+
+
+send_scheduler = SendScheduler(
+    global_config.send_channel_rate,
+    global_config.send_channel_burst,
+    global_config.send_global_rate,
+    global_config.send_global_burst,
+    global_config.coalesce_window,
+)
@@ -0,0 +1,156 @@
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from discord.ext import commands
+
+from .config import global_config
+from .logger import logger
+from .inbound_event import InboundMessage
+from .metrics import gateway_events
+from .shard_worker import KEY_ENV
+
+READY_TIMEOUT_PER_SHARD = 10.0  # 秒，每个分片登录所需时间的估计值，超时后不再等待，继续启动下一个进程
+RESTART_DELAY = 5.0  # 秒，网关进程意外退出后重启前的等待时间
+STOP_TIMEOUT = 10.0  # 秒，关闭时等待网关进程退出的时间，超时后强制结束
+LINE_LIMIT = 4 * 1024 * 1024  # 单条消息记录的最大长度（字节）
+# 网关进程沿用当前工作目录（读取同一个config.toml），src包所在的目录加入PYTHONPATH
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def split_shards(shard_ids: Sequence[int], processes: int) -> List[List[int]]:
+    """把分片按顺序平均分成若干组，每组由一个网关进程负责"""
+    processes = max(1, min(processes, len(shard_ids)))
+    size, extra = divmod(len(shard_ids), processes)
+    groups, start = [], 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        groups.append(list(shard_ids[start:end]))
+        start = end
+    return groups
+
+
+class ShardLauncher:
+    """
+    多进程网关分片
+
+    每个网关进程（src/shard_worker.py）用AutoShardedBot维持一组分片，
+    把规范化后的InboundMessage通过本地TCP连接以JSON行发回本进程，
+    本进程照常写入入站队列，经同一个MaiBot连接发出；回复由本进程通过REST发送。
+    Discord限制同时登录的分片数，网关进程逐个启动，前一个就绪后才启动下一个；
+    意外退出的进程在RESTART_DELAY秒后重启。
+    """
+
+    def __init__(self):
+        self.on_event: Optional[Callable[[InboundMessage], Awaitable[None]]] = None
+        self.latencies: Dict[int, float] = {}  # 分片ID -> 心跳延迟（秒），由网关进程定期报告
+        self._key = secrets.token_hex(16)
+        self._processes: Dict[int, asyncio.subprocess.Process] = {}
+        self._ready: Dict[int, asyncio.Event] = {}
+        self._start_lock = asyncio.Lock()
+        self._stopping = False
+
+    async def run(self, bot: commands.Bot) -> None:
+        """
+        启动并守护全部网关进程
+
+        Parameters:
+            bot: commands.Bot: 已登录（只使用REST）的客户端，用于查询推荐的分片数
+        """
+        shard_count = global_config.sharding_shard_count
+        if not shard_count:
+            shard_count, _, _ = await bot.http.get_bot_gateway()
+            logger.info(f"使用Discord推荐的分片数: {shard_count}")
+        shard_ids = global_config.sharding_shard_ids or list(range(shard_count))
+        groups = split_shards(shard_ids, global_config.sharding_processes)
+        server = await asyncio.start_server(self._handle_connection, "127.0.0.1", 0, limit=LINE_LIMIT)
+        port = server.sockets[0].getsockname()[1]
+        logger.info(f"共 {shard_count} 个分片，本实例负责 {len(shard_ids)} 个，分到 {len(groups)} 个网关进程")
+        async with server:
+            await asyncio.gather(
+                *(self._supervise(index, group, shard_count, port) for index, group in enumerate(groups))
+            )
+
+    async def _supervise(self, index: int, shard_ids: List[int], shard_count: int, port: int) -> None:
+        python_path = os.pathsep.join(filter(None, [PROJECT_ROOT, os.environ.get("PYTHONPATH")]))
+        while not self._stopping:
+            async with self._start_lock:
+                if self._stopping:
+                    return
+                logger.info(f"启动网关进程 {index}，分片: {shard_ids}")
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, "-m", "src.shard_worker",
+                    "--index", str(index),
+                    "--shards", ",".join(map(str, shard_ids)),
+                    "--shard-count", str(shard_count),
+                    "--port", str(port),
+                    env={**os.environ, "PYTHONPATH": python_path, KEY_ENV: self._key},
+                )
+                self._processes[index] = process
+                ready = self._ready[index] = asyncio.Event()
+                waiters = [asyncio.create_task(ready.wait()), asyncio.create_task(process.wait())]
+                _, pending = await asyncio.wait(
+                    waiters,
+                    timeout=READY_TIMEOUT_PER_SHARD * len(shard_ids),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for waiter in pending:
+                    waiter.cancel()
+                if not ready.is_set() and process.returncode is None:
+                    logger.warning(f"网关进程 {index} 未能及时就绪，继续启动其他进程")
+            returncode = await process.wait()
+            for shard_id in shard_ids:
+                self.latencies.pop(shard_id, None)
+            if self._stopping:
+                return
+            logger.error(f"网关进程 {index} 已退出（返回码 {returncode}），{RESTART_DELAY:.0f}秒后重启")
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            hello = json.loads(await reader.readline() or b"{}")
+            if hello.get("type") != "hello" or not hmac.compare_digest(str(hello.get("key", "")), self._key):
+                logger.warning("拒绝了一个未认证的网关进程连接")
+                return
+            index = hello["worker"]
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                data = json.loads(line)
+                kind = data.get("type")
+                if kind == "event":
+                    # 入站队列满时在这里等待，网关进程的发送随之放慢
+                    await self.on_event(InboundMessage.from_record(data["event"]))
+                elif kind == "stats":
+                    self.latencies.update((shard_id, latency) for shard_id, latency in data["latencies"])
+                    for shard, count in data["events"].items():
+                        gateway_events.inc(shard, amount=count)
+                elif kind == "ready":
+                    logger.info(f"网关进程 {index} 已就绪")
+                    if index in self._ready:
+                        self._ready[index].set()
+        except (ConnectionError, ValueError, KeyError) as e:
+            logger.error(f"读取网关进程的消息失败: {e}")
+        finally:
+            writer.close()
+
+    async def stop(self) -> None:
+        """结束全部网关进程"""
+        self._stopping = True
+        processes = [process for process in self._processes.values() if process.returncode is None]
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+
+
+shard_launcher = ShardLauncher()
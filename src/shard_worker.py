@@ -0,0 +1,127 @@
+"""
+网关进程
+
+由shard_launcher以 python -m src.shard_worker 启动，只负责维持一部分网关分片：
+收到的消息在本进程中完成过滤、缓存和引用解析，规范化为InboundMessage后
+以JSON行的形式发给启动它的主进程，由主进程写入入站队列并发送给MaiBot。
+MaiBot的回复由主进程通过REST发送，不经过网关进程。
+
+用法: python -m src.shard_worker --index 0 --shards 0,1,2 --shard-count 8 --port 12345
+连接主进程的密钥通过环境变量 ADAPTER_SHARD_KEY 传入。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+from .logger import logger  # 先于config导入，与main相同
+from .config import global_config
+from .config_reload import watch_config
+from .discord_resolver import discord_resolver
+from .message_cache import message_cache
+from .gateway import create_bot, normalize_message, shard_latencies
+from .metrics import gateway_events
+
+KEY_ENV = "ADAPTER_SHARD_KEY"
+STATS_INTERVAL = 5.0  # 秒，向主进程报告分片延迟和事件数的间隔
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="网关进程")
+    parser.add_argument("--index", type=int, required=True, help="网关进程编号")
+    parser.add_argument("--shards", required=True, help="本进程负责的分片，逗号分隔")
+    parser.add_argument("--shard-count", type=int, required=True, help="分片总数")
+    parser.add_argument("--port", type=int, required=True, help="主进程监听的本地端口")
+    return parser.parse_args()
+
+
+class ShardWorker:
+    def __init__(self, index: int, shard_ids: List[int], shard_count: int, port: int, key: str):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.port = port
+        self.key = key
+        self.bot = create_bot(sharded=True, shard_ids=shard_ids, shard_count=shard_count)
+        self._writer: asyncio.StreamWriter = None
+        self._reported_events: Dict[str, float] = {}
+        self.bot.event(self.on_ready)
+        self.bot.event(self.on_message)
+        self.bot.event(self.on_raw_message_delete)
+
+    def send(self, line: Dict[str, Any]) -> None:
+        self._writer.write(json.dumps(line, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+
+    async def on_ready(self) -> None:
+        logger.info(f"网关进程 {self.index} 已登录为 {self.bot.user.name}，分片: {self.shard_ids}")
+        discord_resolver.discord_bot = self.bot
+        self.send({"type": "ready"})
+
+    async def on_message(self, message) -> None:
+        event = await normalize_message(self.bot, message, trace_enabled=False)
+        if event is not None:
+            self.send({"type": "event", "event": event.to_record()})
+            # 主进程处理不过来时在这里等待，而不是在本进程中无限堆积
+            await self._writer.drain()
+
+    async def on_raw_message_delete(self, payload) -> None:
+        message_cache.forget(payload.message_id)
+
+    async def report_stats(self) -> None:
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            events = {}
+            for shard_id in self.shard_ids:
+                label = str(shard_id)
+                total = gateway_events.value(label)
+                if total > self._reported_events.get(label, 0):
+                    events[label] = total - self._reported_events.get(label, 0)
+                    self._reported_events[label] = total
+            self.send({"type": "stats", "latencies": shard_latencies(self.bot), "events": events})
+
+    async def watch_parent(self, reader: asyncio.StreamReader) -> None:
+        """主进程退出时连接断开，本进程随之退出"""
+        await reader.read()
+        logger.warning(f"网关进程 {self.index} 与主进程的连接已断开，退出")
+
+    async def run(self) -> int:
+        """运行到网关连接结束或主进程退出，返回进程的退出码"""
+        reader, self._writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.send({"type": "hello", "worker": self.index, "key": self.key, "shards": self.shard_ids})
+        tasks = [
+            asyncio.create_task(self.bot.start(global_config.discord_token)),
+            asyncio.create_task(self.report_stats()),
+            asyncio.create_task(watch_config()),
+            asyncio.create_task(self.watch_parent(reader)),
+        ]
+        returncode = 0
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error(f"网关进程 {self.index} 出错: {task.exception()}")
+                    returncode = 1
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.bot.close()
+            self._writer.close()
+            await logger.complete()
+        return returncode
+
+
+def main() -> None:
+    args = parse_args()
+    shard_ids = [int(shard_id) for shard_id in args.shards.split(",")]
+    worker = ShardWorker(args.index, shard_ids, args.shard_count, args.port, os.environ.get(KEY_ENV, ""))
+    try:
+        sys.exit(asyncio.run(worker.run()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
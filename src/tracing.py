@@ -0,0 +1,154 @@
+import json
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import global_config
+from .logger import logger
+
+
+class TraceStage:
+    """trace中记录的阶段名称"""
+
+    received = "received"  # on_message收到
+    reference_resolved = "reference_resolved"  # 被回复的消息已取得（可能经过fetch_message）
+    enqueued = "enqueued"
+    dequeued = "dequeued"  # worker开始处理
+    converted = "converted"
+    router_send_start = "router_send_start"
+    router_send_done = "router_send_done"
+    reply_received = "reply_received"  # 收到MaiBot的回复
+    send_queued = "send_queued"  # 进入出站调度器
+    send_start = "send_start"
+    send_done = "send_done"
+
+
+class Trace:
+    """
+    一条消息的处理轨迹
+
+    以消息ID为trace_id，各阶段只记录相对开始时间的单调时钟偏移，开销很小。
+    """
+
+    __slots__ = ("trace_id", "channel_key", "started", "started_wall", "stages", "attrs", "replied")
+
+    def __init__(self, trace_id: int, channel_key: str):
+        self.trace_id = trace_id
+        self.channel_key = channel_key
+        self.started = time.monotonic()
+        self.started_wall = time.time()
+        self.stages: List[Tuple[str, float]] = []
+        self.attrs: Dict[str, Any] = {}
+        self.replied = False
+
+    def mark(self, stage: str) -> None:
+        self.stages.append((stage, time.monotonic() - self.started))
+
+    @property
+    def elapsed(self) -> float:
+        return self.stages[-1][1] if self.stages else 0.0
+
+    def to_record(self, outcome: str) -> Dict[str, Any]:
+        stages = []
+        previous = 0.0
+        for stage, offset in self.stages:
+            stages.append({"stage": stage, "at_ms": round(offset * 1000, 3), "delta_ms": round((offset - previous) * 1000, 3)})
+            previous = offset
+        return {
+            "trace_id": str(self.trace_id),
+            "channel": self.channel_key,
+            "start": datetime.fromtimestamp(self.started_wall, timezone.utc).isoformat(),
+            "total_ms": round(self.elapsed * 1000, 3),
+            "outcome": outcome,
+            "stages": stages,
+            **self.attrs,
+        }
+
+
+class Tracer:
+    """
+    按采样率为入站消息创建trace，并把MaiBot的回复关联回原消息
+
+    回复优先按其中回复段引用的消息ID关联，没有时关联到同一频道最近一条尚未回复的trace。
+    回复发送完成（或超过trace_ttl仍未回复）时结束trace，
+    总耗时超过slow_threshold的trace写入按大小轮转的JSONL文件。
+    """
+
+    def __init__(self, max_active: int = 10000):
+        self.max_active = max_active
+        self._active: "OrderedDict[int, Trace]" = OrderedDict()
+        self._latest_by_channel: Dict[str, int] = {}
+        self._sink_id: Optional[int] = None
+        self.exported = 0
+
+    def start(self, message_id: int, channel_key: str) -> Optional[Trace]:
+        """按采样率创建trace，未被采样时返回None"""
+        if not global_config.tracing_enable or random.random() >= global_config.tracing_sample_rate:
+            return None
+        self._expire()
+        trace = Trace(message_id, channel_key)
+        trace.mark(TraceStage.received)
+        self._active[message_id] = trace
+        self._latest_by_channel[channel_key] = message_id
+        while len(self._active) > self.max_active:
+            _, oldest = self._active.popitem(last=False)
+            self._finish(oldest, "evicted")
+        return trace
+
+    def find_for_reply(self, reply_to: Optional[str], channel_key: str) -> Optional[Trace]:
+        """查找MaiBot回复对应的trace"""
+        if not self._active:
+            return None
+        if reply_to:
+            try:
+                trace = self._active.get(int(reply_to))
+            except ValueError:
+                trace = None
+            if trace is not None:
+                return trace
+        message_id = self._latest_by_channel.get(channel_key)
+        trace = self._active.get(message_id) if message_id is not None else None
+        if trace is not None and not trace.replied:
+            return trace
+        return None
+
+    def finish(self, trace: Trace, outcome: str = "replied") -> None:
+        """回复已发出，结束trace"""
+        if self._active.pop(trace.trace_id, None) is None:
+            return
+        self._finish(trace, outcome)
+
+    def _finish(self, trace: Trace, outcome: str) -> None:
+        if self._latest_by_channel.get(trace.channel_key) == trace.trace_id:
+            del self._latest_by_channel[trace.channel_key]
+        if trace.elapsed >= global_config.tracing_slow_threshold:
+            self._export(trace.to_record(outcome))
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - global_config.tracing_ttl
+        while self._active:
+            trace = next(iter(self._active.values()))
+            if trace.started > deadline:
+                break
+            self._active.popitem(last=False)
+            self._finish(trace, "no_reply")
+
+    def _export(self, record: Dict[str, Any]) -> None:
+        if self._sink_id is None:
+            self._sink_id = logger.add(
+                global_config.tracing_file,
+                format="{message}",
+                filter=lambda log_record: "trace_export" in log_record["extra"],
+                rotation=global_config.tracing_rotation,
+                retention=global_config.tracing_retention,
+                enqueue=True,
+                encoding="utf-8",
+            )
+        self.exported += 1
+        line = json.dumps(record, ensure_ascii=False)
+        logger.bind(trace_export=True).info(line)
+
+
+tracer = Tracer()
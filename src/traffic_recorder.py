@@ -0,0 +1,230 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import global_config
+from .logger import logger
+from .inbound_event import InboundMessage
+
+RECORDING_VERSION = 1
+FLUSH_INTERVAL = 1.0  # 秒
+# 匿名化时替换图片/表情的1x1透明PNG
+PLACEHOLDER_IMAGE = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+MEDIA_SEGMENT_TYPES = ("image", "emoji")
+_NON_SPACE = re.compile(r"\S")
+
+# (类型, 相对录制开始的秒数, 数据)
+Record = Tuple[str, float, Any]
+
+
+class RecordingFile:
+    """
+    一个录制文件
+
+    记录在事件循环中只追加到buffer，序列化、匿名化和gzip压缩都在写入线程中进行。
+    同一文件内使用同一个随机盐做匿名化，ID的对应关系（同一用户、同一频道、回复对象）保持不变，
+    但盐不写入文件，无法由录制反推出原ID。
+    """
+
+    def __init__(self, directory: str, anonymize: bool, max_size: int):
+        self.directory = directory
+        self.anonymize = anonymize
+        self.max_size = max_size
+        self.path = os.path.join(directory, f"traffic-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl.gz")
+        self.started = time.monotonic()
+        self.started_wall = datetime.now(timezone.utc)
+        self.buffer: List[Record] = []
+        self.written = 0  # 压缩前的字节数
+        self.full = False
+        self._salt = secrets.token_bytes(16)
+        self._file: Optional[gzip.GzipFile] = None
+
+    def settings(self) -> Tuple[str, bool, int]:
+        return self.directory, self.anonymize, self.max_size
+
+    def append(self, kind: str, data: Any) -> None:
+        self.buffer.append((kind, time.monotonic() - self.started, data))
+
+    def write(self, records: List[Record]) -> None:
+        """在写入线程中调用"""
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = gzip.open(self.path, "wb", compresslevel=6)
+            self._write_line({
+                "type": "header",
+                "version": RECORDING_VERSION,
+                "started": self.started_wall.isoformat(),
+                "platform": global_config.platform,
+                "anonymized": self.anonymize,
+            })
+        for kind, offset, data in records:
+            if self.anonymize:
+                data = self._anonymize_event(data) if kind == "inbound" else self._anonymize_message(data)
+            key = "event" if kind == "inbound" else "message"
+            self._write_line({"type": kind, "t": round(offset, 6), key: data})
+            if self.written >= self.max_size:
+                self.full = True
+                break
+        if self.full:
+            self.close()
+        else:
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_line(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        self._file.write(line)
+        self.written += len(line)
+
+    def _anonymize_id(self, value: Any) -> Any:
+        """ID替换为56位的哈希值，保持原来的类型（整数或字符串）"""
+        if value is None or value == "":
+            return value
+        digest = hmac.new(self._salt, str(value).encode("utf-8"), hashlib.sha256).digest()
+        anonymized = int.from_bytes(digest[:7], "big")
+        return str(anonymized) if isinstance(value, str) else anonymized
+
+    @staticmethod
+    def _mask(text: Optional[str]) -> Optional[str]:
+        """文本替换为等长的占位字符，保留空白以保持换行和长度"""
+        return _NON_SPACE.sub("x", text) if text else text
+
+    def _anonymize_event(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        event = dict(event)
+        user_id = self._anonymize_id(event["user_id"])
+        channel_id = self._anonymize_id(event["channel_id"])
+        event["user_id"] = user_id
+        event["channel_id"] = channel_id
+        event["content"] = self._mask(event["content"])
+        event["nickname"] = f"user-{user_id}"
+        event["username"] = f"user-{user_id}"
+        if event["channel_name"] is not None:
+            event["channel_name"] = f"channel-{channel_id}"
+        if event["image_url"]:
+            event["image_url"] = f"https://cdn.discordapp.com/attachments/{channel_id}/{event['message_id']}/image.png"
+        if event["reply"]:
+            message_id, reply_user_id, content = event["reply"]
+            event["reply"] = [message_id, self._anonymize_id(reply_user_id), self._mask(content)]
+        return event
+
+    def _anonymize_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        message = json.loads(json.dumps(message))  # 深拷贝，不修改原消息
+        info = message.get("message_info") or {}
+        user_info = info.get("user_info")
+        if user_info:
+            user_info["user_id"] = self._anonymize_id(user_info.get("user_id"))
+            for name in ("user_nickname", "user_cardname"):
+                if user_info.get(name):
+                    user_info[name] = f"user-{user_info['user_id']}"
+        group_info = info.get("group_info")
+        if group_info:
+            group_info["group_id"] = self._anonymize_id(group_info.get("group_id"))
+            if group_info.get("group_name"):
+                group_info["group_name"] = f"channel-{group_info['group_id']}"
+        if message.get("message_segment"):
+            self._anonymize_segment(message["message_segment"])
+        if isinstance(message.get("raw_message"), str):
+            message["raw_message"] = self._mask(message["raw_message"])
+        return message
+
+    def _anonymize_segment(self, segment: Dict[str, Any]) -> None:
+        seg_type = segment.get("type")
+        data = segment.get("data")
+        if seg_type == "seglist" and isinstance(data, list):
+            for child in data:
+                self._anonymize_segment(child)
+        elif seg_type == "text" and isinstance(data, str):
+            segment["data"] = self._mask(data)
+        elif seg_type in MEDIA_SEGMENT_TYPES and isinstance(data, str):
+            # URL形式的表情同样可能指向个人内容，一并替换
+            segment["data"] = PLACEHOLDER_IMAGE
+        elif seg_type == "voice":
+            segment["data"] = ""
+
+
+class TrafficRecorder:
+    """
+    流量录制
+
+    开启后把入站消息（InboundMessage，即转换前的规范化事件）和MaiBot发来的出站消息
+    按时间顺序写入gzip压缩的JSONL文件，供benchmarks/replay_traffic.py回放。
+    热路径上只追加一个元组，写入每FLUSH_INTERVAL秒在线程中批量进行。
+    目录、匿名化或大小上限在热重载中修改后，下一条记录开始写入新的文件。
+    """
+
+    def __init__(self):
+        self._current: Optional[RecordingFile] = None
+        self._closing: List[RecordingFile] = []
+
+    def record_inbound(self, event: InboundMessage) -> None:
+        recording_file = self._file()
+        if recording_file is not None:
+            recording_file.append("inbound", event.to_record())
+
+    def record_outbound(self, message: Dict[str, Any]) -> None:
+        """记录MaiBot发来的消息（MessageBase的字典形式），之后不应再修改该字典"""
+        recording_file = self._file()
+        if recording_file is not None:
+            recording_file.append("outbound", message)
+
+    def _file(self) -> Optional[RecordingFile]:
+        if not global_config.recording_enable:
+            if self._current is not None:
+                self._rotate(None)
+            return None
+        settings = (global_config.recording_dir, global_config.recording_anonymize, global_config.recording_max_size)
+        if self._current is None or self._current.settings() != settings:
+            self._rotate(RecordingFile(*settings))
+            logger.info(f"开始录制流量到 {self._current.path}")
+        if self._current.full:
+            return None
+        return self._current
+
+    def _rotate(self, new_file: Optional[RecordingFile]) -> None:
+        if self._current is not None:
+            self._closing.append(self._current)
+        self._current = new_file
+
+    async def flush(self) -> None:
+        """把缓冲的记录写入文件，并关闭已经结束的录制文件"""
+        if not global_config.recording_enable and self._current is not None:
+            self._rotate(None)
+        closing, self._closing = self._closing, []
+        for recording_file in closing + ([self._current] if self._current is not None else []):
+            records, recording_file.buffer = recording_file.buffer, []
+            try:
+                if records and not recording_file.full:
+                    await asyncio.to_thread(recording_file.write, records)
+                    if recording_file.full:
+                        logger.warning(f"流量录制文件 {recording_file.path} 已达到大小上限，停止录制")
+                if recording_file in closing:
+                    await asyncio.to_thread(recording_file.close)
+                    logger.info(f"流量录制文件已保存: {recording_file.path}")
+            except OSError as e:
+                logger.error(f"写入流量录制文件 {recording_file.path} 失败，停止录制: {e}")
+                recording_file.full = True
+                recording_file.close()
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    async def close(self) -> None:
+        self._rotate(None)
+        await self.flush()
+
+
+traffic_recorder = TrafficRecorder()
@@ -2,23 +2,15 @@ import websockets as Server
 import json
 import base64
 import uuid
+from typing import List
 from .logger import logger
-from .message_queue import get_response
+from .message_queue import request_response
 
-import urllib3
-import ssl
-
-from PIL import Image
-import io
-
-
-class SSLAdapter(urllib3.PoolManager):
-    def __init__(self, *args, **kwargs):
-        context = ssl.create_default_context()
-        context.set_ciphers("DEFAULT@SECLEVEL=1")
-        context.minimum_version = ssl.TLSVersion.TLSv1_2
-        kwargs["ssl_context"] = context
-        super().__init__(*args, **kwargs)
+from .http_client import media_downloader
+from .media_cache import media_cache, content_digest
+from .image_ops import transcode_to_gif
+from .media import MediaPayload
+from .image_pool import image_pool
 
 
 async def get_group_info(websocket: Server.ServerConnection, group_id: int) -> dict:
@@ -31,8 +23,7 @@ async def get_group_info(websocket: Server.ServerConnection, group_id: int) -> d
     request_uuid = str(uuid.uuid4())
     payload = json.dumps({"action": "get_group_info", "params": {"group_id": group_id}, "echo": request_uuid})
     try:
-        await websocket.send(payload)
-        socket_response: dict = await get_response(request_uuid)
+        socket_response: dict = await request_response(websocket.send(payload), request_uuid)
     except TimeoutError:
         logger.error(f"获取群信息超时，群号: {group_id}")
         return None
@@ -59,8 +50,7 @@ async def get_member_info(websocket: Server.ServerConnection, group_id: int, use
         }
     )
     try:
-        await websocket.send(payload)
-        socket_response: dict = await get_response(request_uuid)
+        socket_response: dict = await request_response(websocket.send(payload), request_uuid)
     except TimeoutError:
         logger.error(f"获取成员信息超时，群号: {group_id}, 用户ID: {user_id}")
         return None
@@ -71,25 +61,37 @@ async def get_member_info(websocket: Server.ServerConnection, group_id: int, use
     return socket_response.get("data")
 
 
-async def get_image_base64(url: str) -> str:
-    # sourcery skip: raise-specific-error
-    """获取图片/表情包的Base64"""
+async def get_image_media(url: str) -> MediaPayload:
+    """
+    获取图片/表情包的原始数据，优先读取本地缓存
+    Parameters:
+        url: str: 图片地址
+    Returns:
+        MediaPayload: 图片数据
+    """
+    cached = await media_cache.get_by_url(url)
+    if cached is not None:
+        logger.debug(f"图片缓存命中: {url}")
+        return MediaPayload.from_bytes(cached)
     logger.debug(f"下载图片: {url}")
-    http = SSLAdapter()
     try:
-        response = http.request("GET", url, timeout=10)
-        if response.status != 200:
-            raise Exception(f"HTTP Error: {response.status}")
-        image_bytes = response.data
-        return base64.b64encode(image_bytes).decode("utf-8")
+        image_bytes = await media_downloader.fetch(url)
     except Exception as e:
         logger.error(f"图片下载失败: {str(e)}")
         raise
+    await media_cache.put_url(url, image_bytes)
+    return MediaPayload.from_bytes(image_bytes)
+
+
+async def get_image_base64(url: str) -> str:
+    # sourcery skip: raise-specific-error
+    """获取图片/表情包的Base64"""
+    return (await get_image_media(url)).to_base64()
 
 
 def convert_image_to_gif(image_base64: str) -> str:
     """
-    将Base64编码的图片转换为GIF格式
+    将Base64编码的图片转换为GIF格式（同步执行，事件循环中请使用convert_emoji_to_gif）
     Parameters:
         image_base64: str: Base64编码的图片数据
     Returns:
@@ -97,17 +99,36 @@ def convert_image_to_gif(image_base64: str) -> str:
     """
     logger.debug("转换图片为GIF格式")
     try:
-        image_bytes = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_bytes))
-        output_buffer = io.BytesIO()
-        image.save(output_buffer, format="GIF")
-        output_buffer.seek(0)
-        return base64.b64encode(output_buffer.read()).decode("utf-8")
+        return base64.b64encode(transcode_to_gif(base64.b64decode(image_base64))).decode("utf-8")
     except Exception as e:
         logger.error(f"图片转换为GIF失败: {str(e)}")
         return image_base64
 
 
+async def convert_emoji_to_gif(media: MediaPayload) -> MediaPayload:
+    """
+    将表情转换为GIF，转码在图片处理进程池中进行，转换结果按原图内容缓存
+    Parameters:
+        media: MediaPayload: 表情数据
+    Returns:
+        MediaPayload: GIF图片数据，转换失败时返回原数据
+    """
+    if media.format == "gif":
+        return media
+    cache_key = f"gif:{content_digest(media.data)}"
+    cached = await media_cache.get_by_key(cache_key)
+    if cached is not None:
+        return MediaPayload.from_bytes(cached)
+    logger.debug("转换图片为GIF格式")
+    try:
+        gif_bytes = await image_pool.run(transcode_to_gif, bytes(media.data))
+    except Exception as e:
+        logger.error(f"图片转换为GIF失败: {str(e)}")
+        return media
+    await media_cache.put(gif_bytes, cache_key)
+    return MediaPayload.from_bytes(gif_bytes)
+
+
 async def get_self_info(websocket: Server.ServerConnection) -> dict:
     """
     获取自身信息
@@ -120,8 +141,7 @@ async def get_self_info(websocket: Server.ServerConnection) -> dict:
     request_uuid = str(uuid.uuid4())
     payload = json.dumps({"action": "get_login_info", "params": {}, "echo": request_uuid})
     try:
-        await websocket.send(payload)
-        response: dict = await get_response(request_uuid)
+        response: dict = await request_response(websocket.send(payload), request_uuid)
     except TimeoutError:
         logger.error("获取自身信息超时")
         return None
@@ -132,16 +152,47 @@ async def get_self_info(websocket: Server.ServerConnection) -> dict:
     return response.get("data")
 
 
+SENTENCE_ENDINGS = ("。", "！", "？", "…", "!", "?", ".", "；", ";")
+
+
+def split_message(content: str, limit: int = 2000) -> List[str]:
+    """
+    将超长文本拆分为不超过limit字符的多段
+    依次尝试在换行、句末标点、空白处断开，都找不到时硬切。
+    Parameters:
+        content: str: 原文本
+        limit: int: 单段最大字符数
+    Returns:
+        List[str]: 拆分后的文本列表
+    """
+    chunks = []
+    while len(content) > limit:
+        window = content[:limit]
+        cut = window.rfind("\n")
+        if cut < limit // 2:
+            cut = max(window.rfind(ending) for ending in SENTENCE_ENDINGS)
+            cut = cut + 1 if cut >= 0 else cut
+        if cut < limit // 2:
+            cut = max(window.rfind(" "), window.rfind("\t"))
+        if cut <= 0:
+            cut = limit
+        chunks.append(content[:cut].rstrip())
+        content = content[cut:].lstrip("\n")
+    if content:
+        chunks.append(content)
+    return [chunk for chunk in chunks if chunk]
+
+
 def get_image_format(raw_data: str) -> str:
     """
     从Base64编码的数据中确定图片的格式。
+    只解码开头的几个字节并按魔数判断，无法识别时才完整打开图片。
     Parameters:
         raw_data: str: Base64编码的图片数据。
     Returns:
         format: str: 图片的格式（例如 'jpeg', 'png', 'gif'）。
     """
-    image_bytes = base64.b64decode(raw_data)
-    return Image.open(io.BytesIO(image_bytes)).format.lower()
+    return MediaPayload.from_base64(raw_data).format
 
 
 async def get_stranger_info(websocket: Server.ServerConnection, user_id: int) -> dict:
@@ -157,8 +208,7 @@ async def get_stranger_info(websocket: Server.ServerConnection, user_id: int) ->
     request_uuid = str(uuid.uuid4())
     payload = json.dumps({"action": "get_stranger_info", "params": {"user_id": user_id}, "echo": request_uuid})
     try:
-        await websocket.send(payload)
-        response: dict = await get_response(request_uuid)
+        response: dict = await request_response(websocket.send(payload), request_uuid)
     except TimeoutError:
         logger.error(f"获取陌生人信息超时，用户ID: {user_id}")
         return None
@@ -182,8 +232,7 @@ async def get_message_detail(websocket: Server.ServerConnection, message_id: str
     request_uuid = str(uuid.uuid4())
     payload = json.dumps({"action": "get_msg", "params": {"message_id": message_id}, "echo": request_uuid})
     try:
-        await websocket.send(payload)
-        response: dict = await get_response(request_uuid)
+        response: dict = await request_response(websocket.send(payload), request_uuid)
     except TimeoutError:
         logger.error(f"获取消息详情超时，消息ID: {message_id}")
         return None
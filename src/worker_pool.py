@@ -0,0 +1,125 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Set
+
+from .logger import logger
+
+
+class ChannelWorkerPool:
+    """
+    按频道分片的入站消息工作池
+
+    同一个分片键（频道或私聊用户）上的消息严格按到达顺序串行处理，
+    不同分片键之间由最多 worker_count 个worker并行处理。
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        worker_count: int = 8,
+        max_pending: int = 1000,
+    ):
+        """
+        Parameters:
+            handler: 处理单条消息的协程函数
+            worker_count: int: 并发worker数量
+            max_pending: int: 池内最多积压的消息数，超过后submit会等待（背压）
+        """
+        self.handler = handler
+        self.worker_count = max(1, worker_count)
+        self.max_pending = max(1, max_pending)
+        self._pending: Dict[str, Deque[Any]] = {}
+        self._active: Set[str] = set()
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._capacity = asyncio.Semaphore(self.max_pending)
+        self._workers: List[asyncio.Task] = []
+        self._busy = 0
+
+    def start(self) -> None:
+        """启动worker"""
+        if self._workers:
+            return
+        for index in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(index)))
+        logger.info(f"入站消息工作池已启动，worker数量: {self.worker_count}")
+
+    def resize(self, worker_count: int) -> None:
+        """
+        调整worker数量，运行中调用
+
+        增加时立即启动新worker；减少时向就绪队列放入停止标记，
+        worker处理完手头的消息后取到标记再退出，不会中断正在处理的消息。
+        """
+        worker_count = max(1, worker_count)
+        if not self._workers:
+            self.worker_count = worker_count
+            return
+        self._workers = [task for task in self._workers if not task.done()]
+        for index in range(self.worker_count, worker_count):
+            self._workers.append(asyncio.create_task(self._worker(index)))
+        for _ in range(worker_count, self.worker_count):
+            self._ready.put_nowait(None)
+        if worker_count != self.worker_count:
+            logger.info(f"入站消息工作池worker数量: {self.worker_count} -> {worker_count}")
+        self.worker_count = worker_count
+
+    async def stop(self) -> None:
+        """停止所有worker，未处理的消息将被丢弃"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def submit(self, key: str, item: Any) -> None:
+        """
+        提交一条消息
+
+        Parameters:
+            key: str: 分片键，同一键上的消息保证顺序
+            item: Any: 消息
+        """
+        await self._capacity.acquire()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = deque()
+        pending.append(item)
+        if key not in self._active:
+            self._active.add(key)
+            self._ready.put_nowait(key)
+
+    @property
+    def pending_count(self) -> int:
+        """池内尚未处理完的消息数"""
+        return self.max_pending - self._capacity._value
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.worker_count,
+            "busy_workers": self._busy,
+            "pending": self.pending_count,
+            "active_channels": len(self._active),
+        }
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            key = await self._ready.get()
+            if key is None:
+                return
+            pending = self._pending[key]
+            item = pending.popleft()
+            self._busy += 1
+            try:
+                await self.handler(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"worker {index} 处理消息时出错: {e}")
+            finally:
+                self._busy -= 1
+                self._capacity.release()
+                # 每处理一条就让出该频道，避免单个繁忙频道独占worker
+                if pending:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                    self._active.discard(key)
@@ -0,0 +1,22 @@
+"""
+测试的公共环境
+
+src下的模块在导入时会读取当前目录的config.toml，
+这里在收集测试前用模板配置创建一个临时工作目录并切换过去，测试不依赖本地的配置文件。
+"""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+_work_dir = tempfile.mkdtemp(prefix="adapter-test-")
+shutil.copy(os.path.join(ROOT_DIR, "template", "template_config.toml"), os.path.join(_work_dir, "config.toml"))
+os.chdir(_work_dir)
+# 与main.py保持一致，先导入logger再导入其他模块，避免config与logger的循环导入出错
+importlib.import_module("src.logger")
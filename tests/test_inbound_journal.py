@@ -0,0 +1,75 @@
+import asyncio
+
+from src.inbound_event import InboundMessage
+from src.inbound_journal import InboundJournal
+
+
+def make_event(message_id: int) -> InboundMessage:
+    return InboundMessage(message_id, 2, 3, True, False, f"消息{message_id}", "nick", "user")
+
+
+async def collect_replay(journal: InboundJournal, count: int) -> list:
+    """运行后台任务直到重放出count条消息"""
+    replayed = []
+
+    async def dispatch(event: InboundMessage) -> None:
+        replayed.append(event)
+
+    task = asyncio.create_task(journal.run(dispatch, lambda: True))
+    try:
+        for _ in range(200):
+            if len(replayed) >= count:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+    return replayed
+
+
+def test_unacked_entries_are_replayed_after_reopen(tmp_path):
+    async def scenario():
+        journal = InboundJournal(str(tmp_path))
+        await journal.open()
+        seqs = [journal.append(make_event(message_id)) for message_id in (101, 102, 103)]
+        assert await journal.flush()
+        assert journal.durable_seq == seqs[-1]
+        journal.settle(seqs[0], True)
+        journal.settle(seqs[1], False)  # 发送失败，等待重放
+        await journal.close()
+
+        reopened = InboundJournal(str(tmp_path))
+        await reopened.open()
+        assert list(reopened._entries) == seqs[1:]
+        assert reopened.stats()["unacked"] == 2
+
+        replayed = await collect_replay(reopened, 2)
+        assert [event.message_id for event in replayed] == [102, 103]
+        assert [event.journal_seq for event in replayed] == seqs[1:]
+        for event in replayed:
+            reopened.settle(event.journal_seq, True)
+        await reopened.close()
+
+        # 重放后已确认的条目不会再次恢复
+        final = InboundJournal(str(tmp_path))
+        await final.open()
+        assert not final._entries
+        await final.close()
+
+    asyncio.run(scenario())
+
+
+def test_settled_entries_are_not_replayed(tmp_path):
+    async def scenario():
+        journal = InboundJournal(str(tmp_path))
+        await journal.open()
+        seq = journal.append(make_event(201))
+        journal.discard(journal.append(make_event(202)))
+        journal.settle(seq, True)
+        await journal.close()
+
+        reopened = InboundJournal(str(tmp_path))
+        await reopened.open()
+        assert not reopened._entries
+        await reopened.close()
+
+    asyncio.run(scenario())
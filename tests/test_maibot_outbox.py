@@ -0,0 +1,76 @@
+import asyncio
+import os
+
+from maim_message import BaseMessageInfo, MessageBase, Seg
+
+from src import maibot_outbox
+from src.config import global_config
+from src.maibot_outbox import MaiBotOutbox
+
+
+class FakeRouter:
+    """只实现发件箱用到的接口，up为False时模拟MaiBot断开"""
+
+    def __init__(self):
+        self.up = True
+        self.received = []
+
+    def check_connection(self, platform: str) -> bool:
+        return self.up
+
+    async def send_message(self, message_base: MessageBase):
+        if not self.up:
+            raise ConnectionError("MaiBot未连接")
+        self.received.append(int(message_base.message_info.message_id))
+        return True
+
+
+def make_message(message_id: int) -> MessageBase:
+    info = BaseMessageInfo(platform="discord", message_id=str(message_id), time=0)
+    return MessageBase(message_info=info, message_segment=Seg(type="text", data=f"消息{message_id}"))
+
+
+async def wait_until(condition, timeout: float = 5.0) -> None:
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("等待超时")
+
+
+def test_overflow_spills_to_disk_and_drains_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(global_config, "outbox_memory_size", 3)
+    monkeypatch.setattr(global_config, "outbox_drain_batch", 2)
+    monkeypatch.setattr(global_config, "outbox_backoff_initial", 0.01)
+    monkeypatch.setattr(maibot_outbox, "CHECK_INTERVAL", 0.01)
+
+    async def scenario():
+        router = FakeRouter()
+        outbox = MaiBotOutbox(router, "discord", str(tmp_path))
+        settled = []
+        outbox.on_settled = lambda token, delivered: settled.append((token, delivered))
+        task = asyncio.create_task(outbox.run())
+        try:
+            assert await outbox.send(make_message(0), 0) is True
+
+            router.up = False
+            results = [await outbox.send(make_message(i), i) for i in range(1, 11)]
+            assert results == [None] * 10
+            stats = outbox.stats()
+            assert (stats["memory"], stats["spilled"]) == (3, 7)
+
+            # 后台任务把溢出的消息写到磁盘
+            await wait_until(lambda: not outbox._spill_pending)
+            with open(outbox.spill_path, "rb") as f:
+                assert len(f.readlines()) == 7
+
+            router.up = True
+            await wait_until(lambda: outbox.depth == 0)
+        finally:
+            task.cancel()
+        assert router.received == list(range(11))
+        assert settled == [(i, True) for i in range(1, 11)]
+        assert outbox.stats()["drained"] == 10
+        assert not os.path.exists(outbox.spill_path)
+
+    asyncio.run(scenario())